@@ -0,0 +1,206 @@
+"""Turns text with ANSI color escapes into urwid markup.
+
+The kernel colors tracebacks (ultratb) and object information with SGR
+escapes, and programs may color what they print. AnsiMarkup turns such text
+into a list of (AttrSpec, text) pieces, as the Qt console's
+AnsiCodeProcessor.split_string does for Qt formats. It is fed one chunk at a
+time, and keeps the colors, and any escape cut short at the end of a chunk,
+for the next one; so the stream messages of one output colorize as the
+whole of it would.
+
+There is one AttrSpec for each combination of colors and styles, and the
+state each escape leads to from each state is remembered, both shared by all
+converters. Escapes other than SGR are dropped: the other CSI escapes, the
+string escapes such as OSC (which sets the window title) up to the BEL or ST
+ending them, and the short ones such as ESC ( B."""
+
+import re
+
+import urwid
+
+from urwidpygments import get_palette
+
+# a CSI escape: its parameters and its command
+_csi_re = re.compile(u'\x1b\\[([0-?]*)([ -/]*[@-~])')
+# the other escapes: a string (OSC, DCS, SOS, PM or APC), which a BEL or ST
+# ends, or another escape should it start one; one with intermediate bytes;
+# and one of two characters
+_other_re = re.compile(u'\x1b(?:[\\]PX^_][^\x07\x1b]*(?:\x07|\x1b\\\\)?'
+                       u'|[ -/]+[0-~]|[0-OQ-WYZ\\\\`-~])')
+# the start of an escape, at the end of a chunk
+_partial_re = re.compile(u'\x1b(?:\\[[0-?]*[ -/]*|[ -/]*'
+                         u'|[\\]PX^_][^\x07\x1b]*\x1b?)\\Z')
+
+_colors = ('black', 'dark red', 'dark green', 'brown',
+           'dark blue', 'dark magenta', 'dark cyan', 'light gray')
+_bright = ('dark gray', 'light red', 'light green', 'yellow',
+           'light blue', 'light magenta', 'light cyan', 'white')
+
+# the state before any escape: bold, underline, standout, foreground and
+# background, where a color is None, an index into the 16 basic colors, or
+# an xterm 256 color name
+_DEFAULT = (False, False, False, None, None)
+
+
+def _color(color, bold):
+    if color is None:
+        return 'default'
+    if isinstance(color, int):
+        if bold and color < 8:
+            color += 8
+        return (_colors + _bright)[color]
+    return color
+
+
+def _sgr(state, params):
+    """Returns the state after an SGR escape with the given parameters."""
+    bold, underline, standout, fg, bg = state
+    codes = [int(p) for p in params.split(u';') if p.isdigit()] or [0]
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        i += 1
+        if code == 0:
+            bold, underline, standout, fg, bg = _DEFAULT
+        elif code == 1:
+            bold = True
+        elif code in (2, 22):
+            bold = False
+        elif code == 4:
+            underline = True
+        elif code == 24:
+            underline = False
+        elif code == 7:
+            standout = True
+        elif code == 27:
+            standout = False
+        elif 30 <= code <= 37:
+            fg = code - 30
+        elif 90 <= code <= 97:
+            fg = code - 90 + 8
+        elif code == 39:
+            fg = None
+        elif 40 <= code <= 47:
+            bg = code - 40
+        elif 100 <= code <= 107:
+            bg = code - 100 + 8
+        elif code == 49:
+            bg = None
+        elif code in (38, 48):
+            # 5;n for an xterm 256 color, 2;r;g;b for a true color, shown in
+            # the nearest of those; out of range, it is dropped
+            color = None
+            kind = codes[i:i+1]
+            if kind == [5]:
+                args = codes[i+1:i+2]
+                if len(args) == 1 and args[0] <= 255:
+                    color = 'h%d' % args[0]
+                i += 2
+            elif kind == [2]:
+                args = codes[i+1:i+4]
+                if len(args) == 3 and max(args) <= 255:
+                    palette = get_palette(256)
+                    color = palette.names[palette.nearest(tuple(args))]
+                i += 4
+            if color is not None and code == 38:
+                fg = color
+            elif color is not None:
+                bg = color
+    return (bold, underline, standout, fg, bg)
+
+
+class AnsiMarkup(object):
+    """Converts text with ANSI escapes to urwid markup, keeping the state
+    between calls to feed().
+
+    A bold color is shown in the bright version of the color, as most
+    terminals do."""
+    # state -> AttrSpec
+    _attrs = {}
+    # (state, SGR parameters) -> (state, AttrSpec)
+    _transitions = {}
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forgets the colors and any partial escape."""
+        self.state = _DEFAULT
+        self._held = u''
+
+    def attr(self, state=None):
+        """Returns the AttrSpec for state, by default the current one, or
+        None for plain text."""
+        if state is None:
+            state = self.state
+        if state == _DEFAULT:
+            return None
+        try:
+            return self._attrs[state]
+        except KeyError:
+            bold, underline, standout, fg, bg = state
+            fgs = [_color(fg, bold)]
+            for flag, name in ((bold, 'bold'), (underline, 'underline'),
+                               (standout, 'standout')):
+                if flag:
+                    fgs.append(name)
+            spec = urwid.AttrSpec(','.join(fgs), _color(bg, False), 256)
+            self._attrs[state] = spec
+            return spec
+
+    def feed(self, text):
+        """Returns the markup for text, as it follows the text fed before:
+        a list of strings and (AttrSpec, string) pieces."""
+        if self._held:
+            text = self._held + text
+            self._held = u''
+        if u'\x1b' not in text:
+            if not text:
+                return []
+            attr = self.attr()
+            return [text if attr is None else (attr, text)]
+        # an escape cut short is only looked for near the end; of a longer
+        # string escape cut short, what the next chunk brings is shown
+        partial = _partial_re.search(text, max(len(text) - 256, 0))
+        if partial:
+            self._held = partial.group()
+            text = text[:partial.start()]
+        text = _other_re.sub(u'', text)
+
+        markup = []
+        append = markup.append
+        transitions = self._transitions
+        state = self.state
+        attr = self.attr(state)
+        parts = _csi_re.split(text)
+        # parts is text, (params, command, text)*
+        piece = parts[0]
+        for i in xrange(1, len(parts), 3):
+            if parts[i + 1] != 'm':
+                piece += parts[i + 2]
+                continue
+            if piece:
+                append(piece if attr is None else (attr, piece))
+            key = (state, parts[i])
+            try:
+                state, attr = transitions[key]
+            except KeyError:
+                state = _sgr(state, parts[i])
+                attr = self.attr(state)
+                transitions[key] = state, attr
+            piece = parts[i + 2]
+        if piece:
+            append(piece if attr is None else (attr, piece))
+        self.state = state
+        return markup
+
+    def flush(self):
+        """Returns the markup for a partial escape held back, as text."""
+        held, self._held = self._held, u''
+        return self.feed(held.replace(u'\x1b', u'^['))
+
+
+def ansi_markup(text):
+    """Returns the urwid markup for text, on its own."""
+    converter = AnsiMarkup()
+    return converter.feed(text) + converter.flush()
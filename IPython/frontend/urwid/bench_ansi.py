@@ -0,0 +1,113 @@
+"""
+Times AnsiMarkup on a colored log, fed in chunks as stream messages would
+bring it, against converting each chunk on its own with a regex compiled for
+it and a new AttrSpec for each piece. Also checks that the chunks give the
+same markup as the whole log.
+
+Run: python bench_ansi.py [megabytes] [chunk size]
+"""
+
+import re, sys, time
+
+import urwid
+
+from ansimarkup import AnsiMarkup, ansi_markup
+
+# lines like the ones ultratb and coloransi write
+_lines = [
+    u'\x1b[0;31m---------------------------------------------------------------------------\x1b[0m',
+    u'\x1b[0;31mZeroDivisionError\x1b[0m                         Traceback (most recent call last)',
+    u'\x1b[0;32m/home/user/work/module.py\x1b[0m in \x1b[0;36m<module>\x1b[0;34m()\x1b[0m',
+    u'\x1b[1;32m----> 1\x1b[0;31m \x1b[0;36mprint\x1b[0m \x1b[0;36m1\x1b[0m\x1b[0;34m/\x1b[0m\x1b[0;36m0\x1b[0m\x1b[0;34m\x1b[0m\x1b[0m',
+    u'\x1b[1;37mpath\x1b[0m \x1b[1;33m=\x1b[0m \x1b[1;37ma\x1b[0m',
+    u'plain output without any color at all, as most lines printed are',
+    u'\x1b[38;5;208mwarning:\x1b[39m something \x1b[4munderlined\x1b[24m and \x1b[7mreversed\x1b[27m',
+]
+
+
+_colors = ('black', 'dark red', 'dark green', 'brown',
+           'dark blue', 'dark magenta', 'dark cyan', 'light gray')
+
+
+def colored_log(size):
+    lines = []
+    n = 0
+    i = 0
+    while n < size:
+        line = _lines[i % len(_lines)] + u' %d\n' % i
+        lines.append(line)
+        n += len(line)
+        i += 1
+    return u''.join(lines)
+
+
+def chunks(text, size):
+    return [text[i:i+size] for i in xrange(0, len(text), size)]
+
+
+def naive_markup(chunk):
+    """Converts a chunk on its own, as a per-message converter without a
+    cache would."""
+    pattern = re.compile(u'\x1b\\[(.*?)([A-Za-z])')
+    markup = []
+    start = 0
+    fg = 'default'
+    for match in pattern.finditer(chunk):
+        if match.start() > start:
+            markup.append((urwid.AttrSpec(fg, 'default'),
+                           chunk[start:match.start()]))
+        start = match.end()
+        codes = [int(p) for p in match.group(1).split(';') if p.isdigit()]
+        for code in codes or [0]:
+            if 30 <= code <= 37:
+                fg = _colors[code - 30]
+            elif code == 0:
+                fg = 'default'
+    if start < len(chunk):
+        markup.append((urwid.AttrSpec(fg, 'default'), chunk[start:]))
+    return markup
+
+
+def merged(markup):
+    """Joins neighbouring pieces with the same attribute."""
+    result = []
+    for piece in markup:
+        attr, text = piece if isinstance(piece, tuple) else (None, piece)
+        if result and result[-1][0] is attr:
+            result[-1] = (attr, result[-1][1] + text)
+        else:
+            result.append((attr, text))
+    return result
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    log = colored_log(int(megabytes * 2**20))
+    pieces = chunks(log, chunk_size)
+    print '%.1f MB log in %d chunks of %d' % (len(log) / 2.0**20,
+                                              len(pieces), chunk_size)
+
+    t0 = time.time()
+    converter = AnsiMarkup()
+    markup = []
+    for piece in pieces:
+        markup.extend(converter.feed(piece))
+    markup.extend(converter.flush())
+    streamed = time.time() - t0
+
+    t0 = time.time()
+    for piece in pieces:
+        naive_markup(piece)
+    naive = time.time() - t0
+
+    same = merged(markup) == merged(ansi_markup(log))
+    mb = len(log) / 2.0**20
+    print '%-22s %8s %8s' % ('', 'seconds', 'MB/s')
+    print '%-22s %8.2f %8.1f' % ('AnsiMarkup', streamed, mb / streamed)
+    print '%-22s %8.2f %8.1f' % ('per chunk, no caching', naive, mb / naive)
+    print 'attributes cached: %d' % len(AnsiMarkup._attrs)
+    print 'chunked markup same as whole: %s' % same
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures keystroke latency of PythonEdit against the size of its buffer, with
+and without incremental highlighting.
+
+A buffer of n lines of python is loaded into a PythonEdit, the cursor is put
+in the middle, and characters are typed one at a time. The keypress (which
+includes the colorize() call) and the render that the main loop would do
+after it are timed separately; rendering the whole edit box is urwid's part.
+
+Run: python bench_colorize.py [nkeys] [sizes...]
+"""
+
+import sys, time
+
+from pywidget import PythonEdit
+
+SOURCE = u'''\
+def f(x, y=2):
+    """Add y to x.
+
+    And return it."""
+    s = 'a string with %d args' % 2  # a comment
+    return x + y * 0x1f
+
+'''
+
+
+def buffer(nlines):
+    lines = SOURCE.splitlines(True)
+    return u''.join(lines[i % len(lines)] for i in xrange(nlines))
+
+
+def measure(nlines, nkeys, incremental):
+    edit = PythonEdit(buffer(nlines))
+    if not incremental:
+        edit.highlighter = None
+    edit.set_edit_pos(len(edit.edit_text) // 2)
+    size = (80,)
+    keys, renders = [], []
+    for key in ('x = 1 + 2' * (nkeys // 9 + 1))[:nkeys]:
+        t0 = time.time()
+        edit.keypress(size, key)
+        t1 = time.time()
+        edit.render(size, focus=True)
+        keys.append(t1 - t0)
+        renders.append(time.time() - t1)
+    keys.sort()
+    renders.sort()
+    return (keys[len(keys)//2], keys[int(len(keys)*0.99)],
+            renders[len(renders)//2])
+
+
+def main():
+    nkeys = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sizes = [int(a) for a in sys.argv[2:]] or [10, 100, 500, 2000]
+    print '%-8s %-12s %12s %12s %12s' % ('lines', 'highlight', 'key ms',
+                                         'key p99 ms', 'render ms')
+    for nlines in sizes:
+        for name, incremental in (('full', False), ('incremental', True)):
+            med, p99, render = measure(nlines, nkeys, incremental)
+            print '%-8d %-12s %12.3f %12.3f %12.3f' % (
+                nlines, name, med * 1e3, p99 * 1e3, render * 1e3)
+
+if __name__ == '__main__':
+    main()
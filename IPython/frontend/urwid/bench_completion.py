@@ -0,0 +1,52 @@
+"""
+Compares TextGrid with CompletionGrid for long lists of completions: the time
+to show a list and render the upper box, and the time to narrow it as a name
+is typed one character at a time.
+
+Run: python bench_completion.py [nmatches]
+"""
+
+import sys, time
+
+from pywidget import TextGrid, CompletionGrid
+
+
+def names(n):
+    return [u'name%d_%s' % (i, u'abcdefgh'[i % 8] * (i % 7)) for i in xrange(n)]
+
+
+def measure_show(grid, matches, size=(80,)):
+    t0 = time.time()
+    grid.set_text(matches)
+    grid.render(size)
+    return time.time() - t0
+
+
+def measure_typing(grid, matches, prefix, size=(80,)):
+    """Returns the time per keystroke for typing prefix."""
+    grid.set_text(matches)
+    grid.render(size)
+    t0 = time.time()
+    for n in range(1, len(prefix) + 1):
+        typed = prefix[:n]
+        if isinstance(grid, CompletionGrid):
+            grid.narrow(typed)
+        else:
+            grid.set_text([m for m in matches if m.startswith(typed)])
+        grid.render(size)
+    return (time.time() - t0) / len(prefix)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    matches = names(n)
+    prefix = u'name12'
+    print '%d matches' % n
+    print '%-15s %12s %14s' % ('grid', 'show ms', 'keystroke ms')
+    for name, cls in (('TextGrid', TextGrid), ('CompletionGrid', CompletionGrid)):
+        show = measure_show(cls(), matches)
+        typing = measure_typing(cls(), matches, prefix)
+        print '%-15s %12.2f %14.2f' % (name, show * 1e3, typing * 1e3)
+
+if __name__ == '__main__':
+    main()
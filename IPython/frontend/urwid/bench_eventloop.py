@@ -0,0 +1,141 @@
+"""
+Measures idle wakeups, message latency and burst handling of IpyEventLoop.
+
+No kernel is needed: a thread stands in for the channel threads and puts
+timestamped messages on the queue. The old 50 ms select-polling loop is
+reproduced here as PollingEventLoop for comparison.
+
+Run: python bench_eventloop.py [idle_seconds] [nmessages] [burst]
+"""
+
+import sys, time, select, threading, Queue
+
+from urwid import ExitMainLoop
+
+from eventloop import IpyEventLoop, WakeupQueue
+
+
+class PollingEventLoop(IpyEventLoop):
+    """The loop as it was before the wakeup pipe: poll the queue for one
+    message, then select on the terminal for up to 50 ms."""
+    def __init__(self, queue, interp):
+        super(PollingEventLoop, self).__init__(queue, interp)
+        self.remove_watch_file(queue.fileno())
+
+    def _loop(self):
+        self.wakeups += 1
+        did_something = False
+        if self._alarms and self._alarms[0][0] < time.time():
+            tm, callback = self._alarms.pop(0)
+            callback()
+            did_something = True
+        try:
+            msg = self.queue.get_nowait()
+        except Queue.Empty:
+            pass
+        else:
+            self._dispatch(msg)
+            did_something = True
+        fds = self._watch_files.keys()
+        tm = 0.05 if not did_something else 0
+        ready, w, err = select.select(fds, [], fds, tm)
+        for fd in ready:
+            self._watch_files[fd]()
+
+
+class CountingEventLoop(IpyEventLoop):
+    def _loop(self):
+        self.wakeups += 1
+        super(CountingEventLoop, self)._loop()
+
+
+class LatencyInterp(object):
+    def __init__(self, nmessages):
+        self.nmessages = nmessages
+        self.latencies = []
+
+    def pyout(self, msg):
+        self.latencies.append(time.time() - msg.content.sent)
+        if len(self.latencies) == self.nmessages:
+            raise ExitMainLoop()
+
+    def unknown_msg(self, msg):
+        pass
+
+
+def measure_idle(loopclass, seconds):
+    queue = WakeupQueue()
+    loop = loopclass(queue, LatencyInterp(0))
+    loop.wakeups = 0
+    def stop():
+        raise ExitMainLoop()
+    loop.alarm(seconds, stop)
+    loop.run()
+    return loop.wakeups
+
+
+def measure_latency(loopclass, nmessages, interval=0.013):
+    queue = WakeupQueue()
+    interp = LatencyInterp(nmessages)
+    loop = loopclass(queue, interp)
+    loop.wakeups = 0
+    def produce():
+        for i in range(nmessages):
+            time.sleep(interval)
+            queue.put({'msg_type': 'pyout',
+                       'content': {'sent': time.time()}})
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    loop.run()
+    lat = sorted(interp.latencies)
+    return lat[len(lat)//2], lat[int(len(lat)*0.99)], max(lat)
+
+
+def measure_burst(nmessages, batch_size):
+    """Queues a burst of one-line stream messages, and times how long an
+    InterpreterWidget takes to show all of them, redrawing on each idle."""
+    from interpreterwidget import InterpreterWidget
+    from eventloop import IpyInterpreter
+    queue = WakeupQueue()
+    widget = InterpreterWidget()
+    interp = IpyInterpreter(widget, None, None)
+    loop = IpyEventLoop(queue, interp, batch_size=batch_size)
+    frames = [0]
+    def redraw():
+        widget.render((80, 24), focus=True)
+        frames[0] += 1
+        if queue.empty() and not loop._backlog:
+            raise ExitMainLoop()
+    loop.enter_idle(redraw)
+    parent = {'msg_id': 0, 'session': 'bench', 'username': 'bench'}
+    for i in xrange(nmessages):
+        queue.put({'msg_type': 'stream', 'parent_header': parent,
+                   'header': {}, 'content': {'name': 'stdout',
+                                             'data': u'line %d\n' % i}})
+    t0 = time.time()
+    loop.run()
+    return time.time() - t0, frames[0]
+
+
+def main():
+    idle = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    nmessages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    burst = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    print '%-10s %14s %12s %12s %12s' % (
+        'loop', 'idle wakeups/s', 'median ms', 'p99 ms', 'max ms')
+    for name, cls in (('polling', PollingEventLoop),
+                      ('wakeup', CountingEventLoop)):
+        wakeups = measure_idle(cls, idle)
+        med, p99, mx = measure_latency(cls, nmessages)
+        print '%-10s %14.1f %12.3f %12.3f %12.3f' % (
+            name, wakeups / idle, med * 1e3, p99 * 1e3, mx * 1e3)
+    print
+    print 'burst of %d stream messages' % burst
+    print '%-12s %10s %10s' % ('batch_size', 'seconds', 'redraws')
+    for batch_size in (1, IpyEventLoop.batch_size):
+        secs, frames = measure_burst(burst, batch_size)
+        print '%-12d %10.2f %10d' % (batch_size, secs, frames)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Times showing a long output in the OutputBox: as one Text, as the box showed
+it before outputs were folded, and as a FoldedText, added whole (as a pyout
+would be) and streamed in chunks (as stream messages would bring it). Each
+output is rendered once after being added, and again after a line is added
+below it, as when more output comes.
+
+Run: python bench_fold.py [nlines] [chunk size]
+"""
+
+import sys, time
+
+import urwid
+
+from pywidget import OutputBox
+from scrollback import FoldedText
+
+
+def output(nlines):
+    return u''.join(u'%d: %s\n' % (i, u'some output ' * (i % 9))
+                    for i in xrange(nlines))
+
+
+def measure(text, chunk_size=None, threshold=None, size=(80, 24)):
+    saved = FoldedText.threshold
+    if threshold is not None:
+        FoldedText.threshold = threshold
+    try:
+        box = OutputBox()
+        t0 = time.time()
+        if chunk_size is None:
+            box.add_stdout(text)
+        else:
+            position = box.add_stdout(text[:chunk_size])
+            for i in xrange(chunk_size, len(text), chunk_size):
+                box.extend(position, text[i:i+chunk_size])
+        box.render(size, focus=False)
+        added = time.time() - t0
+        t0 = time.time()
+        box.add_stdout(u'and one more line')
+        box.render(size, focus=False)
+        more = time.time() - t0
+    finally:
+        FoldedText.threshold = saved
+    return added, more
+
+
+def main():
+    nlines = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 8192
+    text = output(nlines)
+    print '%d lines, %.1f MB' % (nlines, len(text) / 2.0**20)
+    print '%-24s %12s %12s' % ('', 'added ms', 'next line ms')
+    for label, kw in (('one Text', {'threshold': sys.maxint}),
+                      ('folded', {}),
+                      ('folded, streamed', {'chunk_size': chunk_size})):
+        added, more = measure(text, **kw)
+        print '%-24s %12.1f %12.1f' % (label, added * 1e3, more * 1e3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Times wrapping received messages in Message objects and dispatching them (as
+eventloop.dispatch does), and counts the objects and bytes the wrapped
+messages keep, against wrapping every dict within at once, as Message did
+before. The messages are a history_reply, a complete_reply and an
+execute_reply with user_variables, as a frontend receives them.
+
+Run: python bench_message.py [messages]
+"""
+
+import gc, sys, time
+
+from IPython.zmq.session import Session, Message
+
+
+class EagerMessage(object):
+    """Message as it was: every dict within wrapped when it is made."""
+    def __init__(self, msg_dict):
+        dct = self.__dict__
+        for k, v in msg_dict.iteritems():
+            if isinstance(v, dict):
+                v = EagerMessage(v)
+            dct[k] = v
+
+    def __iter__(self):
+        return iter(self.__dict__.iteritems())
+
+    def __getitem__(self, k):
+        return self.__dict__[k]
+
+
+def replies(session):
+    request = session.msg('execute_request')
+    history = dict((i, {'input': u'x = %d' % i, 'output': repr(i)})
+                   for i in xrange(500))
+    variables = dict(('v%d' % i, {'repr': repr(i), 'type': 'int'})
+                     for i in xrange(200))
+    return [
+        session.msg('history_reply', {'history': history}, request),
+        session.msg('complete_reply',
+                    {'matches': ['name%d' % i for i in xrange(300)],
+                     'matched_text': 'name', 'status': 'ok'}, request),
+        session.msg('execute_reply',
+                    {'status': 'ok', 'execution_count': 1, 'payload': [],
+                     'user_variables': variables, 'user_expressions': {}},
+                    request),
+    ]
+
+
+def handle(msg):
+    """What the frontend looks at in a reply."""
+    return msg.msg_type, msg.parent_header.msg_id, msg.content.status \
+        if 'status' in msg.content else None
+
+
+def kept(cls, msgs):
+    """Returns the number of objects, and their bytes, that wrapping msgs in
+    cls keeps."""
+    gc.collect()
+    before = set(id(o) for o in gc.get_objects())
+    wrapped = [cls(msg) for msg in msgs]
+    for msg in wrapped:
+        handle(msg)
+    gc.collect()
+    new = [o for o in gc.get_objects()
+           if id(o) not in before and o is not wrapped and o is not before]
+    return len(new), sum(sys.getsizeof(o) for o in new)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    session = Session()
+    msgs = replies(session) * (count // 3)
+    print '%d messages' % len(msgs)
+    print '%-10s %12s %12s %12s %12s' % ('', 'dispatch ms', 'dict() ms',
+                                         'objects', 'KB kept')
+    for label, cls in (('lazy', Message), ('eager', EagerMessage)):
+        t0 = time.time()
+        for msg in msgs:
+            handle(cls(msg))
+        wrap = time.time() - t0
+        t0 = time.time()
+        for msg in msgs:
+            dict(cls(msg))
+        walk = time.time() - t0
+        objects, size = kept(cls, msgs)
+        print '%-10s %12.1f %12.1f %12d %12.0f' % (
+            label, wrap * 1e3, walk * 1e3, objects, size / 1024.0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Measures how fast lines can be appended to the OutputBox.
+
+The OutputBox as it was before the RingListWalker is reproduced here as
+ListOutputBox: a SimpleListWalker that is sliced down to the last `remember`
+items after every append, with the trailing newline stripped through a
+temporary urwid.Text. The spooled OutputBox is measured too; its memory
+use should not grow with the number of lines.
+
+Run: python bench_outputbox.py [nlines] [remember]
+"""
+
+import os, sys, time
+
+import urwid
+
+from pywidget import OutputBox, recompose
+
+
+class ListOutputBox(OutputBox):
+    def __init__(self, remember=1000, jumptobottom=True):
+        OutputBox.__init__(self, remember, jumptobottom)
+        self.list = urwid.SimpleListWalker([])
+        self._w = urwid.ListBox(self.list)
+
+    @property
+    def jumptobottom(self):
+        return self._jumptobottom
+
+    @jumptobottom.setter
+    def jumptobottom(self, val):
+        self._jumptobottom = bool(val)
+
+    def add_stdout(self, markup):
+        t=urwid.Text(markup)
+        txt, attrs = t.get_text()
+        if len(txt) > 0 and txt[-1] == u'\n':
+            txt = txt[:-1]
+            t.set_text(recompose(txt, attrs))
+        self.list.append(t)
+        self.list[:] = self.list[-self.remember:]
+        if self.jumptobottom:
+            self.list.set_focus(len(self.list))
+
+
+def rss():
+    """The resident set size of this process in MB, on Linux."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError):
+        return float('nan')
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def measure(boxclass, nlines, remember, size=(80, 24), **kw):
+    box = boxclass(remember, **kw)
+    mem = rss()
+    markup = [('number', u'%d'), u' lines of output\n']
+    lines = [[(markup[0][0], markup[0][1] % i), markup[1]]
+             for i in xrange(1000)]
+    t0 = time.time()
+    for i in xrange(nlines):
+        box.add_stdout(lines[i % 1000])
+    secs = time.time() - t0
+    # make sure the result still renders
+    box.render(size, focus=False)
+    return secs, rss() - mem
+
+
+def main():
+    nlines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    remember = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print 'appending %d lines, remembering %d' % (nlines, remember)
+    print '%-10s %10s %14s %12s' % ('walker', 'seconds', 'lines/s',
+                                    'rss +MB')
+    for name, boxclass, kw in (('list', ListOutputBox, {}),
+                               ('ring', OutputBox, {}),
+                               ('spool', OutputBox, {'spool': True})):
+        secs, mem = measure(boxclass, nlines, remember, **kw)
+        print '%-10s %10.2f %14.0f %12.1f' % (name, secs, nlines / secs, mem)
+
+if __name__ == '__main__':
+    main()
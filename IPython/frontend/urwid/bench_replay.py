@@ -0,0 +1,40 @@
+"""
+Replays a trace of kernel messages through the urwid frontend, without a
+terminal, and reports messages per second, render time per frame and peak
+memory.
+
+The trace is a log recorded with IPython.zmq.tracelog, or a file of JSON
+messages, one per line; without one, a session of nexecutions made-up
+executions is replayed (see headless.synthetic_trace).
+max_fps limits the redraws as ThrottledMainLoop does; 0 redraws on every idle.
+
+Run: python bench_replay.py [trace | nexecutions] [max_fps] [colsxrows]
+"""
+
+import os, sys
+
+from headless import read_trace, synthetic_trace, replay
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else '1000'
+    max_fps = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    size = sys.argv[3] if len(sys.argv) > 3 else '80x24'
+    size = tuple(int(n) for n in size.split('x'))
+    if os.path.exists(source):
+        msgs = read_trace(source)
+    else:
+        msgs = synthetic_trace(int(source))
+
+    result = replay(msgs, size, max_fps or None)
+    print 'messages        %10d' % result['messages']
+    print 'seconds         %10.2f' % result['seconds']
+    print 'messages/s      %10.0f' % result['msgs_per_sec']
+    print 'frames drawn    %10d' % result['frames']
+    print 'frames skipped  %10d' % result['frames_skipped']
+    print 'frame ms median %10.2f' % result['frame_ms_median']
+    print 'frame ms max    %10.2f' % result['frame_ms_max']
+    print 'peak memory MB  %10.1f' % result['max_rss_mb']
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Times sending stream messages through a Session and receiving them over tcp,
+with 1 KB, 1 MB and 100 MB of output in each: packed by each packer there
+is, and sent as a buffer beside the message, which is neither packed nor
+copied.
+
+Run: python bench_session.py [packer ...]
+"""
+
+import sys, time
+
+import zmq
+
+from IPython.zmq.session import Session, packer_names
+
+# (size, messages sent)
+_sizes = ((2**10, 5000), (2**20, 50), (100 * 2**20, 2))
+
+
+def output(size):
+    """Printed lines, with the quotes and tabs json must escape."""
+    line = '%06d\t"result": [1.5, 2.5]\n'
+    lines = [line % i for i in xrange(size // len(line % 0) + 1)]
+    return ''.join(lines)[:size]
+
+
+def socket_pair():
+    context = zmq.Context.instance()
+    a = context.socket(zmq.PAIR)
+    port = a.bind_to_random_port('tcp://127.0.0.1')
+    b = context.socket(zmq.PAIR)
+    b.connect('tcp://127.0.0.1:%i' % port)
+    return a, b
+
+
+def time_messages(session, a, b, data, count, as_buffer):
+    t0 = time.time()
+    for i in xrange(count):
+        if as_buffer:
+            session.send(a, u'stream', {u'name': u'stdout'}, buffers=[data])
+        else:
+            session.send(a, u'stream', {u'name': u'stdout', u'data': data})
+        session.recv_msg(b)
+    return time.time() - t0
+
+
+def main():
+    names = sys.argv[1:] or packer_names
+    a, b = socket_pair()
+    print '%-10s %12s %12s %12s' % ('', '1 KB MB/s', '1 MB MB/s',
+                                    '100 MB MB/s')
+    runs = [(name, False) for name in names] + [('json', True)]
+    for name, as_buffer in runs:
+        session = Session(packer=name)
+        rates = []
+        for size, count in _sizes:
+            data = output(size)
+            took = time_messages(session, a, b, data, count, as_buffer)
+            rates.append(size * count / 2.0**20 / took)
+        label = 'buffer' if as_buffer else name
+        print '%-10s %12.1f %12.1f %12.1f' % ((label,) + tuple(rates))
+
+if __name__ == '__main__':
+    main()
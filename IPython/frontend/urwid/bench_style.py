@@ -0,0 +1,73 @@
+"""
+Times setting up the styles of an UrwidFormatter as a new process would:
+computing them, and loading them from a StyleCache file written before. Also
+times formatting tokens with the compiled table against looking each token
+type up by name, walking up to its parents.
+
+Run: python bench_style.py [style ...]
+"""
+
+import shutil, sys, tempfile, time
+
+import pygments.lexers, pygments.styles
+
+import urwidpygments
+from urwidpygments import UrwidFormatter, StyleCache, compile_style
+
+
+def fresh():
+    """Forgets what the process has computed, as if it had just started."""
+    urwidpygments._tables.clear()
+    urwidpygments._palettes.clear()
+
+
+def time_setup(styles, store=None):
+    fresh()
+    t0 = time.time()
+    for style in styles:
+        compile_style(style, store=store)
+    return time.time() - t0
+
+
+def by_name(table, tokens):
+    """The lookup formatgenerator did before the tables were compiled."""
+    attrs = dict((str(ttype), attr) for ttype, attr in table.items())
+    for ttype, tstring in tokens:
+        while str(ttype) not in attrs:
+            ttype = ttype[:-1]
+        yield attrs[str(ttype)], tstring
+
+
+def main():
+    names = sys.argv[1:] or list(pygments.styles.get_all_styles())
+    styles = [pygments.styles.get_style_by_name(name) for name in names]
+    path = tempfile.mkdtemp()
+    store = StyleCache(path)
+    time_setup(styles, store)        # write the file
+
+    print '%-18s %14s %14s' % ('', 'first style ms', 'per style ms')
+    for label, store in (('computed', None), ('loaded from file', path)):
+        first = time_setup(styles[:1], store and StyleCache(store))
+        every = time_setup(styles, store and StyleCache(store))
+        print '%-18s %14.2f %14.2f' % (label, first * 1e3,
+                                       every * 1e3 / len(styles))
+
+    source = open(pygments.lexers.__file__.replace('.pyc', '.py')).read()
+    lexer = pygments.lexers.get_lexer_by_name('python')
+    tokens = list(lexer.get_tokens(source)) * 10
+    formatter = UrwidFormatter()
+    t0 = time.time()
+    for piece in formatter.formatgenerator(tokens):
+        pass
+    table = time.time() - t0
+    t0 = time.time()
+    for piece in by_name(formatter.style_attrs, tokens):
+        pass
+    named = time.time() - t0
+    print '%d tokens' % len(tokens)
+    print 'compiled table     %8.0f tokens/ms' % (len(tokens) / table / 1e3)
+    print 'by name            %8.0f tokens/ms' % (len(tokens) / named / 1e3)
+    shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Times the output of a busy kernel in the tab shown, rendered after every
+batch, against the same output in a tab in the background, which keeps the
+messages until it is shown. As with ThrottledMainLoop, the screen is only
+drawn again when the canvas of the frontend is no longer cached.
+
+Run: python bench_tabs.py [nmessages] [lines per message]
+"""
+
+import sys, time
+
+from urwid.canvas import CanvasCache
+
+from eventloop import IpyInterpreter
+from zmqeventloop import TabbedEventLoop
+from tabs import TabbedFrontend
+
+
+def stream_msg(i, nlines):
+    data = u''.join(u'%d.%d some output\n' % (i, j) for j in xrange(nlines))
+    return {'msg_type': 'stream', 'header': {'msg_id': i},
+            'parent_header': {'msg_id': 'cell'},
+            'content': {'name': 'stdout', 'data': data}}
+
+
+def redraw(frontend, canvas, size):
+    """Renders frontend if it has changed since canvas was, and returns the
+    canvas on screen."""
+    for cls in type(frontend).__mro__:
+        if 'render' in cls.__dict__:
+            break
+    if CanvasCache.fetch(frontend, cls, size, True) is canvas:
+        return canvas
+    return frontend.render(size, focus=True)
+
+
+def run(loop, frontend, tab, msgs, size=(80, 24)):
+    route = loop.route(tab)
+    canvas = None
+    t0 = time.time()
+    for msg in msgs:
+        route.put(dict(msg))
+        if len(loop.queue) >= 10:
+            # a batch as the sockets might bring them, then a redraw
+            while loop.queue:
+                loop._run_msgs()
+            canvas = redraw(frontend, canvas, size)
+    while loop.queue:
+        loop._run_msgs()
+    redraw(frontend, canvas, size)
+    received = time.time() - t0
+    t0 = time.time()
+    frontend.show(tab)
+    frontend.render(size, focus=True)
+    return received, time.time() - t0
+
+
+def main():
+    nmsgs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    nlines = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    msgs = [stream_msg(i, nlines) for i in xrange(nmsgs)]
+    print '%d stream messages of %d lines' % (nmsgs, nlines)
+    print '%-12s %14s %14s' % ('tab', 'received ms', 'shown ms')
+    for label, shown in (('shown', 0), ('background', 1)):
+        frontend = TabbedFrontend()
+        loop = TabbedEventLoop()
+        for i in range(2):
+            tab = frontend.new_tab()
+            tab.interp = IpyInterpreter(tab.widget, None, None)
+        frontend.loop = loop
+        frontend.show(frontend.tabs[0])
+        received, show = run(loop, frontend, frontend.tabs[shown], msgs)
+        print '%-12s %14.1f %14.1f' % (label, received * 1e3, show * 1e3)
+
+if __name__ == '__main__':
+    main()
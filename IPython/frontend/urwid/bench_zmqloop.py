@@ -0,0 +1,88 @@
+"""
+Compares the threaded QueueKernelManager with the single-threaded
+PollerKernelManager: round-trip time of execute requests, and the CPU time the
+frontend process spends on them.
+
+A kernel is started for each manager. Requests are sent one at a time, the
+next one as soon as the previous execute_reply has been dispatched.
+
+Run: python bench_zmqloop.py [nrequests] [code]
+"""
+
+import os, sys, time
+
+from urwid import ExitMainLoop
+
+from eventloop import QueueKernelManager, IpyEventLoop
+from zmqeventloop import PollerKernelManager, ZMQEventLoop
+
+
+class RoundTripInterp(object):
+    def __init__(self, kernelmanager, nrequests, code):
+        self.kernelmanager = kernelmanager
+        self.nrequests = nrequests
+        self.code = code
+        self.times = []
+
+    def send(self):
+        self.sent = time.time()
+        self.kernelmanager.xreq_channel.execute(self.code)
+
+    def execute_reply(self, msg):
+        self.times.append(time.time() - self.sent)
+        if len(self.times) == self.nrequests:
+            raise ExitMainLoop()
+        self.send()
+
+    def unknown_msg(self, msg):
+        pass
+
+
+def cputime():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def measure(kmclass, loopclass, nrequests, code, timeout=60):
+    km = kmclass()
+    km.start_kernel()
+    interp = RoundTripInterp(km, nrequests, code)
+    loop = loopclass(km.rcvd_queue, interp)
+    if isinstance(km, PollerKernelManager):
+        km.event_loop = loop
+    km.start_channels()
+    # let the kernel come up
+    time.sleep(2)
+
+    def give_up():
+        raise ExitMainLoop()
+    loop.alarm(timeout, give_up)
+    loop.alarm(0, interp.send)
+    t0, c0 = time.time(), cputime()
+    try:
+        loop.run()
+        wall, cpu = time.time() - t0, cputime() - c0
+    finally:
+        km.stop_channels()
+        km.kill_kernel()
+    return sorted(interp.times), wall, cpu
+
+
+def main():
+    nrequests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    code = sys.argv[2] if len(sys.argv) > 2 else 'pass'
+    print '%-10s %8s %10s %10s %12s' % (
+        'manager', 'replies', 'median ms', 'p99 ms', 'cpu ms/req')
+    for name, kmclass, loopclass in (
+            ('threaded', QueueKernelManager, IpyEventLoop),
+            ('poller', PollerKernelManager, ZMQEventLoop)):
+        times, wall, cpu = measure(kmclass, loopclass, nrequests, code)
+        if not times:
+            print '%-10s %8d (no replies)' % (name, 0)
+            continue
+        print '%-10s %8d %10.2f %10.2f %12.3f' % (
+            name, len(times), times[len(times)//2] * 1e3,
+            times[int(len(times)*0.99)] * 1e3, cpu / len(times) * 1e3)
+
+if __name__ == '__main__':
+    main()
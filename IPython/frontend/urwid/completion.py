@@ -0,0 +1,175 @@
+"""Tab completion for the urwid frontend, asked of the kernel without
+blocking.
+
+Tab asks the kernel for the completions of the name before the cursor, and
+the completion box then follows the typing. Requests wait until the typing
+pauses for delay seconds, and a reply to any but the latest request is
+dropped. The matches of recent requests are kept, so that a name that only
+got longer since (with no new '.') is completed from them at once, without
+asking the kernel again. They are forgotten after each execution, which may
+have changed the namespace."""
+
+import re
+
+# the dotted name the cursor is at the end of
+_name_re = re.compile(r'[A-Za-z_][\w.]*$')
+
+
+def common_prefix(strings):
+    """Returns the longest string that all of strings start with."""
+    if not strings:
+        return u''
+    first, last = min(strings), max(strings)
+    n = 0
+    while n < len(first) and first[n] == last[n]:
+        n += 1
+    return first[:n]
+
+
+class Completer(object):
+    """Completes the input of an InterpreterWidget from the kernel of
+    kernelmanager, using alarms of loop (an urwid event loop).
+
+    Keys get to it through filter_input(), which should be the input_filter
+    of the MainLoop, and replies through complete_reply(). The widget's
+    completionbox should be a CompletionGrid."""
+    delay = 0.15
+    cache_size = 20
+
+    def __init__(self, widget, kernelmanager, loop, delay=None):
+        self.widget = widget
+        self.kernelmanager = kernelmanager
+        self.loop = loop
+        if delay is not None:
+            self.delay = delay
+        # Whether the completion box is shown and follows the input
+        self.active = False
+        # (text, matches) for the last few replies, oldest first
+        self.cache = []
+        self._alarm = None
+        self._pending = None
+        self._pending_text = None
+        self._insert = False
+
+    @property
+    def editbox(self):
+        return self.widget.inputbox.editbox
+
+    def context(self):
+        """Returns the (possibly dotted) name the cursor is at the end of,
+        the line it is in and the cursor position in that line."""
+        edit = self.editbox
+        text, pos = edit.edit_text, edit.edit_pos
+        linestart = text.rfind(u'\n', 0, pos) + 1
+        lineend = text.find(u'\n', pos)
+        if lineend < 0:
+            lineend = len(text)
+        line = text[linestart:lineend]
+        col = pos - linestart
+        m = _name_re.search(line, 0, col)
+        return (m.group() if m else u''), line, col
+
+    def cached(self, text):
+        """Returns the cached matches for text or a prefix of it, or None.
+        The matches for a prefix will do unless text adds a '.' to it, but
+        they still need to be narrowed down to those starting with text."""
+        for prefix, matches in reversed(self.cache):
+            if text.startswith(prefix) and u'.' not in text[len(prefix):]:
+                return matches
+        return None
+
+    def filter_input(self, keys, raw=None):
+        """Handles tab and escape, and refreshes the completions after any
+        other key. Returns the keys for urwid to handle."""
+        passed = []
+        for key in keys:
+            if key == 'tab' and self.context()[0]:
+                self.complete()
+            elif key == 'esc' and self.active:
+                self.cancel()
+            elif key == 'enter':
+                self.cancel()
+                passed.append(key)
+            else:
+                passed.append(key)
+                if self.active:
+                    # after urwid has handled the key
+                    self._schedule(0, self.update)
+        return passed
+
+    def complete(self):
+        """Shows the completions of the name at the cursor, and completes as
+        much of it as all of them share."""
+        self.active = True
+        self._insert = True
+        self.update(delay=0)
+
+    def update(self, delay=None):
+        """Shows the completions for the current input, from the cache if
+        possible, or else asks the kernel for them after delay seconds."""
+        text = self.context()[0]
+        if not text:
+            self.cancel()
+            return
+        matches = self.cached(text)
+        if matches is not None:
+            self._show(text, matches)
+        else:
+            self._schedule(self.delay if delay is None else delay,
+                           self._request)
+
+    def cancel(self):
+        """Hides the completions, and drops any reply on its way."""
+        self.active = False
+        self._insert = False
+        self._pending = None
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+            self._alarm = None
+        self.widget.completionbox.show([])
+
+    def invalidate(self):
+        """Forgets the cached matches."""
+        del self.cache[:]
+
+    def _schedule(self, delay, callback):
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+        def run():
+            self._alarm = None
+            callback()
+        self._alarm = self.loop.alarm(delay, run)
+
+    def _request(self):
+        text, line, col = self.context()
+        if not text:
+            return
+        matches = self.cached(text)
+        if matches is not None:
+            self._show(text, matches)
+            return
+        self._pending_text = text
+        self._pending = self.kernelmanager.xreq_channel.complete(
+            text, line, col, self.editbox.edit_text)
+
+    def complete_reply(self, msg):
+        if self._pending is None or \
+                msg.parent_header.msg_id != self._pending:
+            # an answer to a request that has been superseded
+            return
+        self._pending = None
+        self.cache.append((self._pending_text, list(msg.content.matches)))
+        del self.cache[:-self.cache_size]
+        if self.active:
+            self.update()
+
+    def _show(self, text, matches):
+        box = self.widget.completionbox
+        box.show(matches, text)
+        if self._insert:
+            self._insert = False
+            prefix = common_prefix(box.shown)
+            if len(prefix) > len(text):
+                self.editbox.insert_text(prefix[len(text):])
+                self.editbox.colorize()
+                box.narrow(prefix)
@@ -1,4 +1,4 @@
-import Queue, time, heapq
+import Queue, os, errno, fcntl, time
 
 from IPython.zmq.session import Message
 from IPython.zmq.kernelmanager import (KernelManager, ZmqSocketChannel,
@@ -6,12 +6,12 @@ from IPython.zmq.kernelmanager import (KernelManager, ZmqSocketChannel,
 import urwid
 from urwid import SelectEventLoop, ExitMainLoop
 from IPython.utils.traitlets import Type
-import select
+from ansimarkup import AnsiMarkup, ansi_markup
 
 def prettymessage(msg, indent=''):
     lines = []
     for k,v in dict(msg).items():
-        if isinstance(v, Message):
+        if isinstance(v, (dict, Message)):
             lines.append(indent + k)
             lines.extend(prettymessage(v, indent + '  '))
         else:
@@ -19,6 +19,98 @@ def prettymessage(msg, indent=''):
                 indent, k, repr(v)))
     return lines
 
+def _same_stream(msg1, msg2):
+    return (msg1['msg_type'] == msg2['msg_type'] == 'stream'
+            and msg1['content']['name'] == msg2['content']['name']
+            and msg1['parent_header'] == msg2['parent_header'])
+
+def _join_stream(msg, pieces):
+    content = dict(msg['content'], data=u''.join(pieces))
+    return dict(msg, content=content)
+
+def merge_streams(msgs):
+    """Takes a list of raw (dict) messages, and returns a list in which each
+    run of consecutive 'stream' messages to the same stream, with the same
+    parent, is replaced by a single message holding all of their data."""
+    merged = []
+    pieces = []
+    for msg in msgs:
+        if (pieces and isinstance(msg, dict)
+                and _same_stream(merged[-1], msg)):
+            pieces.append(msg['content']['data'])
+            continue
+        if len(pieces) > 1:
+            merged[-1] = _join_stream(merged[-1], pieces)
+        merged.append(msg)
+        if isinstance(msg, dict) and msg['msg_type'] == 'stream':
+            pieces = [msg['content']['data']]
+        else:
+            pieces = []
+    if len(pieces) > 1:
+        merged[-1] = _join_stream(merged[-1], pieces)
+    return merged
+
+class WakeupQueue(Queue.Queue):
+    """A Queue that can be watched with select.
+
+    Putting an item on the queue writes a byte to a pipe, whose read end is
+    returned by fileno(). The consumer calls clear_wakeup() before draining the
+    queue; at most one byte is ever pending, so a burst of messages costs a
+    single write."""
+    def __init__(self, maxsize=0):
+        Queue.Queue.__init__(self, maxsize)
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._signalled = False
+
+    def fileno(self):
+        return self._rfd
+
+    def _put(self, item):
+        # called with self.mutex held
+        Queue.Queue._put(self, item)
+        if not self._signalled:
+            self._signalled = True
+            self._write_wakeup()
+
+    def _write_wakeup(self):
+        try:
+            os.write(self._wfd, 'x')
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def wakeup(self):
+        """Make the read end readable, whether or not anything was put."""
+        self.mutex.acquire()
+        try:
+            self._signalled = True
+            self._write_wakeup()
+        finally:
+            self.mutex.release()
+
+    def clear_wakeup(self):
+        """Empty the pipe. Items put after this call will signal again."""
+        self.mutex.acquire()
+        try:
+            self._signalled = False
+            while True:
+                try:
+                    if not os.read(self._rfd, 4096):
+                        break
+                except OSError, e:
+                    if e.errno == errno.EAGAIN:
+                        break
+                    raise
+        finally:
+            self.mutex.release()
+
+    def close(self):
+        os.close(self._rfd)
+        os.close(self._wfd)
+
 class UrwidChannel(ZmqSocketChannel):
     def __init__(self, rcvd_queue, *args, **kwargs):
         super(UrwidChannel, self).__init__(*args, **kwargs)
@@ -40,10 +132,13 @@ class QueueKernelManager(KernelManager):
     xreq_channel_class = Type(UrwidXReq)
     sub_channel_class = Type(UrwidSub)
     rep_channel_class = Type(UrwidRep)
+
+    # The channels put the messages they receive on an instance of this
+    rcvd_queue_class = WakeupQueue
     
     def __init__(self, *args, **kw):
         super(QueueKernelManager, self).__init__(*args, **kw)
-        self.rcvd_queue = Queue.Queue()
+        self.rcvd_queue = self.rcvd_queue_class()
 
     @property
     def xreq_channel(self):
@@ -77,72 +172,116 @@ class QueueKernelManager(KernelManager):
 
 
 class IpyEventLoop(SelectEventLoop):
-    """A simple event loop for use with ipython."""
-    def __init__(self, queue, interp):
+    """A simple event loop for use with ipython.
+
+    The queue must be a WakeupQueue (or provide fileno(), wakeup() and
+    clear_wakeup()); it is watched like any other file, so the loop blocks in
+    select until there is terminal input, a kernel message, or an alarm due.
+
+    Messages are handled in batches of at most batch_size messages or
+    batch_time seconds. After each batch the queue is unwatched until the loop
+    has gone idle, so that the screen is redrawn once per batch rather than
+    once per message."""
+
+    # Defaults for the per-batch budget; time is in seconds.
+    batch_size = 1000
+    batch_time = 0.05
+
+    def __init__(self, queue, interp, batch_size=None, batch_time=None):
         self.queue = queue
         self.interp = interp
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if batch_time is not None:
+            self.batch_time = batch_time
+        self._backlog = []
+        self._queue_handle = None
         super(IpyEventLoop, self).__init__()
-    
-    def _run_alarms(self):
-        """Checks if there are any alarms that went off,
-        and calls their callbacks if necessary"""
-        curtime = time.time()
-        if self._alarms and self._alarms[0][0] < curtime:
-            tm, callback = heapq.heappop(self._alarms)
-            callback()
-            self._did_something = True
-    
+        self._watch_queue()
+
+    def _watch_queue(self):
+        self._queue_handle = self.watch_file(self.queue.fileno(),
+                                             self._run_msgs)
+
+    def _unwatch_queue(self):
+        self.remove_watch_file(self._queue_handle)
+        self._queue_handle = None
+
+    def _take_msgs(self, n):
+        """Takes up to n messages from the queue without blocking."""
+        msgs = []
+        while len(msgs) < n:
+            try:
+                msgs.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return msgs
+
     def _run_msgs(self):
-        """Checks if a message is in the queue, and runs it if there is"""
-        try:
-            msg = self.queue.get_nowait()
-        except Queue.Empty:
-            return
-        
-        self._did_something = True
-        if not isinstance(msg, Message):
-            msg = Message(msg)
-        if hasattr(self.interp, msg.msg_type):
-            func = getattr(self.interp, msg.msg_type)
-        else:
-            func = self.interp.unknown_msg
-        func(msg)
+        """Runs one batch of the messages waiting in the queue"""
+        self.queue.clear_wakeup()
+        deadline = time.time() + self.batch_time
+        msgs = self._backlog + self._take_msgs(
+                self.batch_size - len(self._backlog))
+        self._backlog = []
+        msgs = merge_streams(msgs)
+        for i, msg in enumerate(msgs):
+            self._dispatch(msg)
+            if time.time() > deadline:
+                self._backlog = msgs[i+1:]
+                break
 
-    def _loop(self):
-        self._did_something = False
-        # Check for alarms
-        self._run_alarms()
+        # Wait for the redraw before taking the next batch
+        self._unwatch_queue()
 
-        # if there are any messages, gather and process them
-        self._run_msgs()
-        
-        # check the file descriptors
-        fds = self._watch_files.keys()
-        
-        # TODO: We can't select on fds and on queues.
-        # I don't know how to fix this, which means that for
-        # now this loop can't block.
-        # I guess I could have another thread that blocks on
-        # file descriptors, and adds them to a queue when
-        # they go... but that seems inefficient.
-        tm = 0.05 if not self._did_something else 0
-        ready, w, err = select.select(fds, [], fds, tm)
-        if not ready:
-            if not self._did_something:
-                self._enter_idle()
-            self._did_something = False
-        else:
-            for fd in ready:
-                callback = self._watch_files[fd]
-                callback()
-                self._did_something = True
+    def _entering_idle(self):
+        super(IpyEventLoop, self)._entering_idle()
+        if self._queue_handle is None:
+            self._watch_queue()
+            if self._backlog or not self.queue.empty():
+                self.queue.wakeup()
+
+    def _dispatch(self, msg):
+        dispatch(self.interp, msg)
+
+
+def dispatch(interp, msg):
+    """Calls the method of interp named for the type of msg, or its
+    unknown_msg if it has none."""
+    if not isinstance(msg, Message):
+        msg = Message(msg)
+    if hasattr(interp, msg.msg_type):
+        func = getattr(interp, msg.msg_type)
+    else:
+        func = interp.unknown_msg
+    func(msg)
 
 
 class IpyInterpreter(object):
-    def __init__(self, widget, screen, kernelmanager):
+    # The payload of an execute_reply holding text to page
+    payload_source_page = 'IPython.zmq.page.page'
+
+    def __init__(self, widget, screen, kernelmanager, completer=None,
+                 pager=None, highlighter=None):
         self.widget = widget
         self.screen = screen
         self.kernelmanager = kernelmanager
+        # a completion.Completer, if tab completion is wanted
+        self.completer = completer
+        # a pager.PagedWidget wrapping widget, to page text in; without one,
+        # paged text is added to the output
+        self.pager = pager
+        # a highlighter.BackgroundHighlighter; without one, code and
+        # tracebacks are highlighted before they are shown
+        self.highlighter = highlighter
+        # stream name -> AnsiMarkup, keeping the colors of each stream from
+        # one message to the next
+        self._streams = {}
+        # (stream name, output position) of the last stream output, which
+        # the next message of the same stream continues until the next cell
+        # (the execute_reply may come before the last of the stream, so it
+        # is the next pyin that ends it)
+        self._open_stream = None
 
     def _accept_input(self):
         """Accept the input from the input box and process it"""
@@ -166,32 +305,89 @@ class IpyInterpreter(object):
         if input == 'enter':
             return self._accept_input()
 
+    def filter_input(self, keys, raw):
+        """The input_filter for the MainLoop: lets the completer see the keys
+        first, unless they are for the pager."""
+        paging = self.pager is not None and self.pager.paging
+        if self.completer is not None and not paging:
+            keys = self.completer.filter_input(keys, raw)
+        return keys
+
+    def page(self, text, start=0):
+        if self.pager is not None:
+            self.pager.page(text, start)
+        else:
+            self.widget.add_to_output(text)
+
+    def add_highlighted(self, text, lexer):
+        """Adds text to the output, highlighted with lexer. With a
+        highlighter, the text is shown plain until it has been highlighted,
+        unless that was done before."""
+        if self.highlighter is None:
+            tokens = lexer.get_tokens(text)
+            markup = list(self.widget.formatter.formatgenerator(tokens))
+            self.widget.add_to_output(markup)
+            return
+        def highlighted(markup):
+            # called from the event loop, after position is set below
+            self.widget.replace_output(position, markup)
+        markup = self.highlighter.highlight(text, lexer, highlighted)
+        position = self.widget.add_to_output(text if markup is None
+                                             else markup)
+
     def execute_reply(self, msg):
+        if self.completer is not None:
+            self.completer.invalidate()
+        for converter in self._streams.values():
+            converter.reset()
+        for item in getattr(msg.content, 'payload', ()):
+            if item.get('source') == self.payload_source_page:
+                self.page(item['text'], item.get('start_line_number', 0))
         if msg.content.status == 'ok':
             if 'transformed_code' in msg.content:
-                output = msg.content.transformed_code
-                markup = self.widget.highlight(output)
-                self.widget.add_to_output(markup)
+                self.add_highlighted(msg.content.transformed_code,
+                                     self.widget.lexer)
         elif msg.content.status == 'error':
-            self.widget.add_to_output('error: ' + str(msg.content))
-            return
-            errname = msg.content.exc_name
-            errstr = msg.content.exc_str
-            traceback = msg.content.traceback
-            self.widget.add_to_output("\n".join(
-                traceback + '{0}: {1}'.format(errname, errstr)))
+            # the traceback itself comes as a pyerr
+            self.widget.add_to_output(u'error: {0}: {1}'.format(
+                msg.content.ename, msg.content.evalue))
         elif msg.content.status == 'abort':
             self.widget.add_to_output('Kernel abort')
 
+    def complete_reply(self, msg):
+        if self.completer is not None:
+            self.completer.complete_reply(msg)
+
     def pyin(self, msg):
+        self._open_stream = None
         self.widget.add_to_output('pyin: ' + msg.content.code)
 
     def pyout(self, msg):
         self.widget.add_to_output('pyout [{0:2d}]: {1}'.format(
             msg.content.prompt_number, msg.content.data))
 
+    def pyerr(self, msg):
+        # the parts of an ultratb traceback do not end in newlines, colored
+        # or not
+        traceback = u'\n'.join(msg.content.traceback)
+        if u'\x1b' in traceback:
+            self.widget.add_to_output(ansi_markup(traceback))
+        else:
+            self.add_highlighted(traceback, self.widget.errlexer)
+
     def stream(self, msg):
-        self.widget.add_to_output(u'stream:' + unicode(msg.content.data))
+        name = msg.content.name
+        if name not in self._streams:
+            self._streams[name] = AnsiMarkup()
+        markup = self._streams[name].feed(unicode(msg.content.data))
+        if self._open_stream is not None and self._open_stream[0] == name:
+            if self.widget.extend_output(self._open_stream[1], markup):
+                return
+        position = self.widget.add_to_output([u'stream:'] + markup)
+        self._open_stream = (name, position)
+
+    def unknown_msg(self, msg):
+        pass
 
 
 
@@ -1,12 +1,14 @@
 import pydoc
 
-import urwid, pygments
+import urwid, pygments, pygments.styles
 
-from interpreterwidget import InterpreterWidget, PagerScreen
+from interpreterwidget import InterpreterWidget
+from pager import PagedWidget
 
 class FakeInterpreter(object):
-    def __init__(self, widget, screen):
+    def __init__(self, widget, screen, pager):
         self.widget = widget
+        self.pager = pager
         self.widget.completionbox.set_text([
             'COMPLETION BOX',
             'Currently',
@@ -53,7 +55,7 @@ CTRL-W : Switch widget at the top'''
         elif inpt == 'ctrl d':
             raise urwid.ExitMainLoop()
         elif inpt == 'ctrl p':
-            self.screen.page(pydoc.render_doc('pydoc'))
+            self.pager.page(pydoc.render_doc('pydoc'))
             return True
         elif inpt == 'ctrl o':
             txt = self.widget.inputbox.text.strip()
@@ -61,7 +63,7 @@ CTRL-W : Switch widget at the top'''
                 fulltxt = pydoc.render_doc(str(txt))
             except ImportError:
                 fulltxt = 'No documentation found for ' + repr(txt)
-            self.screen.page(fulltxt)
+            self.pager.page(fulltxt)
             return True
         if inpt == 'ctrl w': # widget switch
             if self.widget.upperbox.widget == self.widget.completionbox:
@@ -93,9 +95,10 @@ CTRL-W : Switch widget at the top'''
 
 def main():
     mainwin = InterpreterWidget()
+    top = PagedWidget(mainwin)
     
-    screen = PagerScreen()
-    interp = FakeInterpreter(mainwin, screen)
+    screen = urwid.raw_display.Screen()
+    interp = FakeInterpreter(mainwin, screen, top)
     
     promptattr = urwid.AttrSpec('yellow, bold', 'default')
     
@@ -103,7 +106,7 @@ def main():
     
     #screen.set_terminal_properties(colors=256)   # at least, try...
     #screen.reset_default_terminal_palette()      # get the normal colors
-    loop = urwid.MainLoop(mainwin, screen=screen, 
+    loop = urwid.MainLoop(top, screen=screen, 
                             unhandled_input=interp.handle_input)
     try:
         loop.run()
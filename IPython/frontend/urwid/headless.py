@@ -0,0 +1,175 @@
+"""Runs the urwid frontend without a terminal, for benchmarks and tests.
+
+HeadlessScreen is an urwid screen of a fixed size that only turns the
+canvases it is given into text. replay() drives an InterpreterWidget with it:
+the messages of a trace are dispatched through IpyEventLoop and
+IpyInterpreter as if they came from a kernel, and the frames drawn are timed.
+
+A trace is a list of kernel messages. read_trace() reads the messages received
+from a log written by IPython.zmq.tracelog, or from a file with one JSON
+message per line, and synthetic_trace() makes up a session."""
+
+import json, resource, time
+
+import urwid
+from urwid import ExitMainLoop
+
+from IPython.zmq.tracelog import TraceReader, TraceError, RECEIVED
+from eventloop import IpyEventLoop, IpyInterpreter, WakeupQueue
+from interpreterwidget import InterpreterWidget
+from mainloop import ThrottledMainLoop
+
+
+class HeadlessScreen(urwid.BaseScreen):
+    """A screen of size cols x rows that draws nowhere. The text of the last
+    frame is kept in lines."""
+    def __init__(self, cols=80, rows=24):
+        urwid.BaseScreen.__init__(self)
+        self.size = (cols, rows)
+        self.lines = []
+
+    def run_wrapper(self, fn):
+        self.start()
+        try:
+            return fn()
+        finally:
+            self.stop()
+
+    def get_cols_rows(self):
+        return self.size
+
+    def get_input_descriptors(self):
+        return []
+
+    def get_input_nonblocking(self):
+        return None, [], []
+
+    def set_mouse_tracking(self):
+        pass
+
+    def draw_screen(self, size, canvas):
+        # Walk the whole canvas, as a real screen would
+        self.lines = [''.join(text for attr, cs, text in row)
+                      for row in canvas.content()]
+
+    def clear(self):
+        pass
+
+
+class ReplayMainLoop(ThrottledMainLoop):
+    """Times each frame drawn, and stops once every message of the trace has
+    been dispatched and drawn."""
+    def __init__(self, *args, **kw):
+        ThrottledMainLoop.__init__(self, *args, **kw)
+        self.frame_times = []
+
+    def draw_screen(self):
+        t0 = time.time()
+        ThrottledMainLoop.draw_screen(self)
+        self.frame_times.append(time.time() - t0)
+
+    def entering_idle(self):
+        ThrottledMainLoop.entering_idle(self)
+        loop = self.event_loop
+        if (loop.queue.empty() and not loop._backlog and
+                self._frame_alarm is None and not self._changed()):
+            raise ExitMainLoop()
+
+
+def read_trace(path):
+    """Reads the messages received in a trace log, or a file of JSON
+    messages, one per line."""
+    try:
+        reader = TraceReader(path)
+    except TraceError:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    try:
+        return [record.msg for record in reader
+                if record.direction == RECEIVED]
+    finally:
+        reader.close()
+
+
+def synthetic_trace(nexecutions=1000, stream_lines=20, session='replay'):
+    """Makes up the messages a kernel would send for nexecutions executions:
+    some print stream_lines lines, some show a result, and some raise."""
+    msgs = []
+    # the parts of an ultratb traceback, which the frontend joins with
+    # newlines
+    traceback = [u'Traceback (most recent call last):',
+                 u'  File "<ipython console>", line 1, in <module>',
+                 u'ZeroDivisionError: integer division or modulo by zero']
+    for i in xrange(nexecutions):
+        parent = {'msg_id': i, 'session': session, 'username': 'replay'}
+        def msg(msg_type, content):
+            return {'msg_type': msg_type, 'parent_header': parent,
+                    'header': {'msg_id': len(msgs), 'session': 'kernel',
+                               'username': 'kernel'},
+                    'content': content}
+        code = u'for i in range(%d): print i, i*i' % stream_lines
+        msgs.append(msg('pyin', {'code': code}))
+        kind = i % 3
+        if kind == 0:
+            for j in xrange(stream_lines):
+                msgs.append(msg('stream', {'name': 'stdout',
+                                           'data': u'%d %d\n' % (j, j*j)}))
+        elif kind == 1:
+            msgs.append(msg('pyout', {'prompt_number': i,
+                                      'data': repr(range(i % 50))}))
+        else:
+            msgs.append(msg('pyerr', {'traceback': traceback,
+                                      'ename': u'ZeroDivisionError',
+                                      'evalue': u'integer division or '
+                                                u'modulo by zero'}))
+            msgs.append(msg('execute_reply', {'status': 'error',
+                                              'traceback': traceback,
+                                              'ename': u'ZeroDivisionError',
+                                              'evalue': u''}))
+            continue
+        msgs.append(msg('execute_reply', {'status': 'ok'}))
+    return msgs
+
+
+def max_rss():
+    """The peak resident set size of this process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def replay(msgs, size=(80, 24), max_fps=None, widget=None):
+    """Dispatches msgs to an InterpreterWidget on a HeadlessScreen of the
+    given size, as fast as the frontend takes them, and returns a dict of:
+
+    messages, seconds, msgs_per_sec -- the messages and how long they took
+    frames, frame_ms_median, frame_ms_max -- the frames drawn, and their
+        render times
+    frames_skipped -- see ThrottledMainLoop
+    max_rss_mb -- the peak memory of the process, when the replay finished
+    screen -- the HeadlessScreen, showing the last frame
+    """
+    if widget is None:
+        widget = InterpreterWidget()
+    screen = HeadlessScreen(*size)
+    queue = WakeupQueue()
+    interp = IpyInterpreter(widget, screen, None)
+    loop = IpyEventLoop(queue, interp)
+    mainloop = ReplayMainLoop(widget, screen=screen, event_loop=loop,
+                              max_fps=max_fps)
+    for msg in msgs:
+        queue.put(msg)
+
+    t0 = time.time()
+    mainloop.run()
+    seconds = time.time() - t0
+    queue.close()
+
+    frames = sorted(mainloop.frame_times) or [0]
+    return {'messages': len(msgs),
+            'seconds': seconds,
+            'msgs_per_sec': len(msgs) / seconds,
+            'frames': mainloop.frames_drawn,
+            'frames_skipped': mainloop.frames_skipped,
+            'frame_ms_median': frames[len(frames)//2] * 1e3,
+            'frame_ms_max': frames[-1] * 1e3,
+            'max_rss_mb': max_rss(),
+            'screen': screen}
@@ -0,0 +1,88 @@
+"""Syntax highlighting in a worker thread, so that lexing a large cell or
+traceback does not hold up the keyboard.
+
+BackgroundHighlighter lexes and formats text with pygments in its own
+thread, and hands the markup back through the event loop. The markup of the
+last cache_size texts is kept, keyed on a hash of the text with the lexer and
+style, so that text highlighted before (a cell run again, the same
+traceback) comes back at once."""
+
+import hashlib, threading, Queue
+
+from eventloop import WakeupQueue
+
+
+class BackgroundHighlighter(object):
+    """Highlights text with formatter (an UrwidFormatter) in a worker
+    thread, calling back from loop (an urwid event loop)."""
+    cache_size = 100
+
+    def __init__(self, formatter, loop, cache_size=None):
+        self.formatter = formatter
+        self.loop = loop
+        if cache_size is not None:
+            self.cache_size = cache_size
+        # key -> markup, and the keys, least recently used first
+        self.cache = {}
+        self._used = []
+        self._jobs = Queue.Queue()
+        self._done = WakeupQueue()
+        self._handle = loop.watch_file(self._done.fileno(), self._deliver)
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def key(self, text, lexer):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return (hashlib.sha1(text).digest(), lexer.name,
+                self.formatter.style)
+
+    def cached(self, key):
+        """Returns the markup cached for key, or None."""
+        markup = self.cache.get(key)
+        if markup is not None:
+            self._used.remove(key)
+            self._used.append(key)
+        return markup
+
+    def highlight(self, text, lexer, callback):
+        """Returns the markup for text if it is cached. Otherwise returns
+        None, and calls callback(markup) from the event loop once the text
+        has been highlighted."""
+        key = self.key(text, lexer)
+        markup = self.cached(key)
+        if markup is None:
+            self._jobs.put((key, text, lexer, callback))
+        return markup
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            key, text, lexer, callback = job
+            tokens = lexer.get_tokens(text)
+            markup = list(self.formatter.formatgenerator(tokens))
+            self._done.put((key, markup, callback))
+
+    def _deliver(self):
+        """Passes on the markup the worker has finished."""
+        self._done.clear_wakeup()
+        while True:
+            try:
+                key, markup, callback = self._done.get_nowait()
+            except Queue.Empty:
+                break
+            if key not in self.cache:
+                self._used.append(key)
+            self.cache[key] = markup
+            while len(self._used) > self.cache_size:
+                del self.cache[self._used.pop(0)]
+            callback(markup)
+
+    def close(self):
+        """Stops the worker thread. Callbacks still due are dropped."""
+        self._jobs.put(None)
+        self.loop.remove_watch_file(self._handle)
+        self._done.close()
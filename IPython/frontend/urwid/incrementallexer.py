@@ -0,0 +1,387 @@
+"""Incremental syntax highlighting for edit boxes.
+
+Re-lexing a whole buffer after every keystroke gets slow for long inputs.
+IncrementalHighlighter keeps the tokens of each line, and the lexer state at
+the start of each line, so that after an edit it only re-lexes from just
+before the first changed line until the lexer is back in the state it had at
+the same place in the old text.
+
+Most rules only look at the line they are tried in, so the lines before an
+edit keep their tokens. A rule whose regex may look past a newline it has
+matched (such as the Python lexer's docstring rule, whose leading \s* runs
+over blank lines) is tried again wherever it was tried before the edit, and
+the re-lexing starts early enough to include any place where the result
+differs. The result is the same as that of lexing the whole text."""
+
+import sre_parse
+from itertools import chain
+
+from pygments.lexer import RegexLexer, ExtendedRegexLexer
+from pygments.token import Text, Error, _TokenType
+
+
+ROOT = ('root',)
+
+# what lex() yields in place of a token type for a rule that reads past a
+# newline, with the rule's regex and the spans of its match
+PROBE = object()
+
+
+def supports(lexer):
+    """Returns whether lexer can be run incrementally. That is the case for
+    RegexLexers that use the standard lexing loop."""
+    return (isinstance(lexer, RegexLexer)
+            and not isinstance(lexer, ExtendedRegexLexer)
+            and type(lexer).get_tokens_unprocessed.im_func is
+                RegexLexer.get_tokens_unprocessed.im_func)
+
+
+def _change_state(statestack, new_state):
+    """Applies a state transition of a RegexLexer rule to statestack (a list),
+    as RegexLexer.get_tokens_unprocessed does."""
+    if isinstance(new_state, tuple):
+        for state in new_state:
+            if state == '#pop':
+                if len(statestack) > 1:
+                    statestack.pop()
+            elif state == '#push':
+                statestack.append(statestack[-1])
+            else:
+                statestack.append(state)
+    elif isinstance(new_state, int):
+        if abs(new_state) >= len(statestack):
+            del statestack[1:]
+        else:
+            del statestack[new_state:]
+    elif new_state == '#push':
+        statestack.append(statestack[-1])
+    else:
+        assert False, "wrong state def: %r" % new_state
+
+
+# The codes of the anchors that only look behind them
+_BEHIND = frozenset(['at_beginning', 'at_beginning_line',
+                     'at_beginning_string'])
+
+# Whether a newline is in each category of character
+_NEWLINE_CATEGORIES = {
+    'category_space': True, 'category_not_space': False,
+    'category_digit': False, 'category_not_digit': True,
+    'category_word': False, 'category_not_word': True,
+    'category_linebreak': True, 'category_not_linebreak': False,
+}
+
+def _in_set(items):
+    """Returns whether a newline may be in the set of an 'in' code."""
+    negate = False
+    found = False
+    for op, av in items:
+        if op == 'negate':
+            negate = True
+        elif op == 'literal':
+            found = found or av == 10
+        elif op == 'range':
+            found = found or av[0] <= 10 <= av[1]
+        elif op == 'category':
+            found = found or _NEWLINE_CATEGORIES.get(av, True)
+        else:
+            return True
+    return found != negate
+
+def _scan(items, flags, newline):
+    """Follows a parsed regex (a list of sre_parse codes), as matched after
+    a newline, if newline. Returns whether it may look at a character after
+    a newline it has matched (or at the end of the text), whether it may
+    have matched a newline by its end, and the widest lookbehind in it."""
+    reads_past = False
+    behind = 0
+    for op, av in items:
+        if op in ('literal', 'not_literal', 'any', 'in'):
+            reads_past = reads_past or newline
+            if op == 'literal':
+                newline = newline or av == 10
+            elif op == 'not_literal':
+                newline = newline or av != 10
+            elif op == 'any':
+                newline = newline or bool(flags & sre_parse.SRE_FLAG_DOTALL)
+            else:
+                newline = newline or _in_set(av)
+        elif op == 'at':
+            if av == 'at_end_string' or (
+                    av == 'at_end' and
+                    not flags & sre_parse.SRE_FLAG_MULTILINE):
+                reads_past = True
+            elif av not in _BEHIND:
+                reads_past = reads_past or newline
+        elif op == 'subpattern':
+            far, newline, width = _scan(av[1], flags, newline)
+            reads_past, behind = reads_past or far, max(behind, width)
+        elif op == 'branch':
+            after = newline
+            for branch in av[1]:
+                far, nl, width = _scan(branch, flags, newline)
+                reads_past, behind = reads_past or far, max(behind, width)
+                after = after or nl
+            newline = after
+        elif op in ('max_repeat', 'min_repeat'):
+            minimum, maximum, sub = av
+            far, nl, width = _scan(sub, flags, newline)
+            if maximum > 1:
+                # the next repeat looks on from where the last one ended
+                far2, nl, width = _scan(sub, flags, nl)
+                far = far or far2
+            reads_past, behind = reads_past or far, max(behind, width)
+            newline = newline or nl
+        elif op in ('assert', 'assert_not'):
+            direction, sub = av
+            if direction < 0:
+                behind = max(behind, sub.getwidth()[1])
+            else:
+                far, nl, width = _scan(sub, flags, newline)
+                reads_past = reads_past or far
+                behind = max(behind, width)
+        else:
+            # backreferences and the like: assume the worst
+            reads_past = reads_past or newline
+            newline = True
+    return reads_past, newline, behind
+
+def _lead(items, flags):
+    """Returns whether a parsed regex can only match at the start of a line,
+    and the literal text any match starts with, up to a newline."""
+    items = list(items)
+    line_start = False
+    prefix = []
+    while items:
+        op, av = items.pop(0)
+        if op == 'subpattern':
+            items[:0] = av[1]
+        elif (op == 'at' and av == 'at_beginning' and not prefix and
+                flags & sre_parse.SRE_FLAG_MULTILINE):
+            line_start = True
+        elif (op == 'literal' and av != 10 and
+                not flags & sre_parse.SRE_FLAG_IGNORECASE):
+            prefix.append(unichr(av))
+        else:
+            break
+    return line_start, u''.join(prefix)
+
+def analyze(regex):
+    """Returns whether matching regex (a compiled regex) may look at a
+    character past a newline it has matched, or at the end of the text; how
+    far its lookbehinds may look back; and a (line_start, prefix) pair: a
+    match that looks past a newline can only be tried at the start of a
+    line, if line_start, and where the text starts with prefix."""
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    flags = parsed.pattern.flags
+    reads_past, newline, behind = _scan(parsed, flags, False)
+    return reads_past, behind, _lead(parsed, flags)
+
+
+# type of lexer -> the states of its lexer, as rules() returns them, and the
+# widest lookbehind of its rules
+_rules = {}
+
+def rules(lexer):
+    """Returns lexer._tokens with a fourth item in each rule, which is None
+    unless its regex may look past a newline it has matched, and otherwise
+    the (line_start, prefix) of analyze(); and the widest lookbehind of any
+    rule."""
+    key = type(lexer)
+    if key not in _rules:
+        states = {}
+        widest = 0
+        for state, tokens in lexer._tokens.items():
+            states[state] = []
+            for rexmatch, action, new_state in tokens:
+                reaches, behind, lead = analyze(rexmatch.__self__)
+                states[state].append((rexmatch, action, new_state,
+                                      lead if reaches else None))
+                widest = max(widest, behind)
+        _rules[key] = states, widest
+    return _rules[key]
+
+
+def lex(lexer, text, pos=0, stack=ROOT):
+    """Like RegexLexer.get_tokens_unprocessed, but starts at pos. Besides the
+    (pos, tokentype, value) tokens it yields (pos, None, stack) whenever the
+    lexer is between two matches at the start of a line, where stack is the
+    state stack as a tuple, and (pos, PROBE, (rexmatch, regs)) whenever a
+    rule is tried that may look past a newline from there, where regs are
+    the spans of its match or None."""
+    tokendefs = rules(lexer)[0]
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    end = len(text)
+    while 1:
+        for rexmatch, action, new_state, lead in statetokens:
+            m = rexmatch(text, pos)
+            if lead is not None:
+                line_start, prefix = lead
+                if ((not line_start or not pos or text[pos-1] == '\n') and
+                        text.startswith(prefix, pos)):
+                    yield pos, PROBE, (rexmatch, m and m.regs)
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        yield pos, action, m.group()
+                    else:
+                        for item in action(lexer, m):
+                            yield item
+                pos = m.end()
+                if new_state is not None:
+                    _change_state(statestack, new_state)
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            if pos >= end:
+                break
+            if text[pos] == '\n':
+                # at EOL, reset state to "root"
+                statestack = ['root']
+                statetokens = tokendefs['root']
+                yield pos, Text, u'\n'
+            else:
+                yield pos, Error, text[pos]
+            pos += 1
+        if pos and text[pos-1] == '\n':
+            yield pos, None, tuple(statestack)
+
+
+class _Line(object):
+    """One line of the text, with the tokens that start in it and their
+    attributes. stack is the lexer state at the start of the line, or None if
+    the line starts inside a token. probes are the (offset in the line,
+    rexmatch, regs) of the rules tried in it that may look past a newline."""
+    __slots__ = ('text', 'stack', 'tokens', 'attrib', 'probes')
+
+    def __init__(self, text, stack):
+        self.text = text
+        self.stack = stack
+        self.tokens = []
+        self.attrib = []
+        self.probes = []
+
+
+class IncrementalHighlighter(object):
+    """Keeps the highlighting of a text up to date as it is edited.
+
+    update(text) returns the run length encoded attributes (as returned by
+    urwid.Text.get_text) for the new text."""
+    def __init__(self, lexer, formatter):
+        if not supports(lexer):
+            raise TypeError('%r can not be lexed incrementally' % lexer)
+        self.lexer = lexer
+        self.formatter = formatter
+        self.lines = [_Line(u'', ROOT)]
+        self.text = u''
+        self.attrib = []
+        self._style = formatter.style
+
+    def _set_attrib(self, line):
+        line.attrib = [(attr, len(value)) for attr, value
+                       in self.formatter.formatgenerator(line.tokens)
+                       if value]
+
+    def _join_attrib(self):
+        self.attrib = list(chain.from_iterable(
+                line.attrib for line in self.lines))
+        return self.attrib
+
+    def restyle(self):
+        """Recomputes the attributes of every line, after a style change."""
+        self._style = self.formatter.style
+        for line in self.lines:
+            self._set_attrib(line)
+        return self._join_attrib()
+
+    def update(self, text):
+        """Re-lexes the changed part of the text and returns the attributes
+        for the whole text."""
+        parts = text.split(u'\n')
+        texts = [part + u'\n' for part in parts[:-1]]
+        texts.append(parts[-1])
+        old = self.lines
+        nold, nnew = len(old), len(texts)
+
+        # the first changed line, and the number of unchanged lines at the end
+        first = 0
+        while (first < nold and first < nnew and
+               old[first].text == texts[first]):
+            first += 1
+        if first == nold == nnew:
+            if self.formatter.style is not self._style:
+                return self.restyle()
+            return self.attrib
+        nsame = 0
+        limit = min(nold, nnew) - first
+        while nsame < limit and old[-1-nsame].text == texts[-1-nsame]:
+            nsame += 1
+        shift = nnew - nold
+
+        # Restart at the first changed line, unless a rule tried before it
+        # that may look past a newline now matches differently; then
+        # restart before that. Go back to a line that starts between tokens.
+        start = first
+        pos = 0
+        for lineno in xrange(first):
+            line = old[lineno]
+            for offset, rexmatch, regs in line.probes:
+                m = rexmatch(text, pos + offset)
+                if (m and m.regs) != regs:
+                    start = lineno
+                    break
+            if start < first:
+                break
+            pos += len(line.text)
+        while old[start].stack is None:
+            start -= 1
+        pos = sum(len(t) for t in texts[:start])
+
+        # The old lines can be taken up again from one that the lexer gets
+        # to in the state it had there before, if the rules looking behind
+        # them see the same text there too
+        behind = rules(self.lexer)[1]
+        oldtext = self.text
+        grown = len(text) - len(oldtext)
+
+        relexed = []
+        lineno = start
+        line = _Line(texts[start], old[start].stack)
+        linestart, nextstart = pos, pos + len(line.text)
+        resume = None
+        for tpos, ttype, value in lex(self.lexer, text, pos, line.stack):
+            while tpos >= nextstart and lineno + 1 < nnew:
+                relexed.append(line)
+                lineno += 1
+                line = _Line(texts[lineno], None)
+                linestart, nextstart = nextstart, nextstart + len(line.text)
+            if ttype is PROBE:
+                line.probes.append((tpos - linestart,) + value)
+            elif ttype is not None:
+                line.tokens.append((ttype, value))
+            elif tpos == linestart and line.stack is None and not line.tokens:
+                line.stack = value
+                oldstart = linestart - grown
+                if (lineno >= nnew - nsame and
+                        old[lineno - shift].stack == value and
+                        text[max(linestart - behind, 0):linestart] ==
+                        oldtext[max(oldstart - behind, 0):oldstart]):
+                    resume = lineno - shift
+                    break
+        if resume is None:
+            relexed.append(line)
+            while lineno + 1 < nnew:
+                lineno += 1
+                relexed.append(_Line(texts[lineno], None))
+
+        for line in relexed:
+            self._set_attrib(line)
+        if resume is None:
+            self.lines = old[:start] + relexed
+        else:
+            self.lines = old[:start] + relexed + old[resume:]
+        self.text = text
+        if self.formatter.style is not self._style:
+            return self.restyle()
+        return self._join_attrib()
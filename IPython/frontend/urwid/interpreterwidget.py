@@ -3,9 +3,6 @@
 
 import urwid
 import pygments.lexers
-import pygments.styles
-import pygments
-import pydoc
 
 from pywidget import *
 from urwidpygments import UrwidFormatter
@@ -16,7 +13,7 @@ class InterpreterWidget(urwid.Pile):
 
     Note that this is simply a widget, and has no extra functionality;
     it exists to organize the inner widgets."""
-    def __init__(self, inputlines=4, caption='>>> '):
+    def __init__(self, inputlines=4, caption='>>> ', spool=False):
         # make inner widgets
         # first the input widgets
         # the input widgets are a 'captionwidget' for the prompt, next
@@ -33,13 +30,13 @@ class InterpreterWidget(urwid.Pile):
         self.inputwidget = urwid.Filler(self.inputbox, valign='top')
         
         # the completion box
-        self.completionbox = TextGrid()
+        self.completionbox = CompletionGrid()
         
         # the 'upper' box, which can be switched to completions, help, etc.
         self.upperbox = UpperBox(self.completionbox)
         
         # now the output widgets
-        self.outputbox = OutputBox()    # Box widget
+        self.outputbox = OutputBox(spool=spool)    # Box widget
         self.outputwidget = self.outputbox
         #self.outputwidget = urwid.Filler(self.outputbox, valign='top')
                     # Box widget
@@ -73,12 +70,21 @@ class InterpreterWidget(urwid.Pile):
         
     def set_style(self, s):
         if isinstance(s, basestring):
+            import pygments.styles
             s = pygments.styles.get_style_by_name(s)
         self.formatter.style = s
     
     def add_to_output(self, markup):
-        self.outputbox.add_stdout(markup)
-        return
+        """Adds markup to the output, and returns its position there."""
+        return self.outputbox.add_stdout(markup)
+
+    def replace_output(self, position, markup):
+        self.outputbox.replace(position, markup)
+
+    def extend_output(self, position, markup):
+        """Continues the output at position with markup, if it is still the
+        last output. Returns whether it was."""
+        return self.outputbox.extend(position, markup)
         
     def _get_widget_size(self, widget, selfsize):
         item_rows = None
@@ -93,6 +99,8 @@ class InterpreterWidget(urwid.Pile):
         key = widget.keypress( tsize, key )
         return key
     
+    _scroll_keys = ('up', 'down', 'page up', 'page down', 'home', 'end')
+
     def keypress(self, size, key):
         """We do not want the normal urwid.Pile keypress stuff to happen..."""
         # let the focus item use the key, if it can...
@@ -106,7 +114,11 @@ class InterpreterWidget(urwid.Pile):
         if key in ('up','page up', 'home'):
             self.outputbox.jumptobottom = False
             key = None
-        key = self._passkey(self.outputwidget, size, origkey)
+        # other keys are only for the output (say, to expand a fold) when
+        # it has the focus
+        if (self.focus_item is self.outputwidget or
+                origkey in self._scroll_keys):
+            key = self._passkey(self.outputwidget, size, origkey)
         tsize = self._get_widget_size(self.outputwidget, size)
         if (origkey in ('down', 'page down', 'end')
                 and self.outputbox.atbottom(tsize)):
@@ -1,32 +1,141 @@
-from interpreterwidget import InterpreterWidget, PagerScreen
-from eventloop import QueueKernelManager, IpyEventLoop, IpyInterpreter
-from urwid import MainLoop
+"""The urwid frontend to IPython kernels, each in a tab (see tabs.py).
 
-def main():
-    kern = QueueKernelManager()
-    kern.start_kernel()
-    kern.start_channels()
-    queue = kern.rcvd_queue
+The first screen is drawn before the kernel machinery is imported, so it
+shows while that is imported and the kernel starts. The import goes on in a
+thread, while the prompt takes the text typed; other keys typed meanwhile are
+handled once the main loop runs.
 
-    widget = InterpreterWidget()
-    screen = PagerScreen()
-    interp = IpyInterpreter(widget, screen, kern)
+Run: python ipythonurwid.py [--spool] [--kernels N] [--latency-log FILE]
+                            [--profile-startup]
+"""
 
-    eventloop = IpyEventLoop(queue, interp)
+try:
+    import argparse
+except ImportError:
+    # Python 2.6; this imports all of IPython first, which the first screen
+    # no longer waits for there
+    from IPython.external import argparse
 
-    mainloop = MainLoop(widget,
-            unhandled_input = interp.handle_input, 
-            event_loop = eventloop)
+import threading
 
+from startup import StartupTimer, take_early_input
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='IPython in a terminal, '
+                                     'with urwid.')
+    parser.add_argument('--spool', action='store_true',
+                        help='keep all of the output in a temporary file, '
+                        'rather than the last 1000 outputs in memory')
+    parser.add_argument('--kernels', type=int, default=1, metavar='N',
+                        help='start N kernels, each in a tab of its own')
+    parser.add_argument('--latency-log', metavar='FILE',
+                        help='write the latencies measured (as f12 shows '
+                        'them) to FILE as JSON, on exit')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report the time each phase of startup takes, '
+                        'on exit')
+    args = parser.parse_args(argv)
+    if args.kernels < 1:
+        parser.error('--kernels must be at least 1')
+    return args
+
+def _time_kernel_ready(timer, kern, interp):
+    """Ends a phase of timer when the kernel answers a first request."""
+    msg_id = kern.xreq_channel.execute(u'', silent=True)
+    execute_reply = interp.execute_reply
+    def first_reply(msg):
+        if msg.parent_header.msg_id == msg_id:
+            timer.phase('kernel answering')
+            del interp.execute_reply
+        execute_reply(msg)
+    interp.execute_reply = first_reply
+
+def _load_client(lexer):
+    """Imports the modules for talking to the kernels, for a thread. The
+    rules of lexer are analysed first, for the prompt to highlight the first
+    key typed without waiting on that."""
+    try:
+        from incrementallexer import supports, rules
+        if supports(lexer):
+            rules(lexer)
+        import zmqeventloop, mainloop, highlighter
+    except Exception:
+        # raised again as main() imports them, rather than written over
+        # the screen
+        pass
+
+def main(argv=None):
+    timer = StartupTimer()
+    args = parse_args(argv)
+
+    import urwid
+    from tabs import TabbedFrontend
+    from latency import LatencyMonitor
+    from urwidpygments import persist_styles
+    timer.phase('import the widgets')
+
+    persist_styles()
+    latency = LatencyMonitor()
+    frontend = TabbedFrontend(spool=args.spool, latency=latency)
+    for i in range(args.kernels):
+        frontend.new_tab()
+    frontend.show(frontend.tabs[0])
+    timer.phase('make the widgets')
+
+    screen = urwid.raw_display.Screen()
+    screen.start()
+    highlighter = None
     try:
+        size = screen.get_cols_rows()
+        screen.draw_screen(size, frontend.render(size, focus=True))
+        timer.phase('draw the first screen')
+        timer.mark_first_screen()
+
+        # the kernel client takes longer to import than the rest of startup,
+        # so the prompt takes what is typed meanwhile
+        loader = threading.Thread(target=_load_client,
+                                  args=(frontend.tabs[0].widget.lexer,))
+        loader.start()
+        held = take_early_input(screen, frontend,
+                                lambda: not loader.is_alive())
+        loader.join()
+        from zmqeventloop import TabbedEventLoop
+        from mainloop import ThrottledMainLoop
+        from highlighter import BackgroundHighlighter
+        timer.phase('import the kernel client')
+
+        eventloop = TabbedEventLoop()
+        latency.attach_event_loop(eventloop)
+        highlighter = BackgroundHighlighter(
+            frontend.tabs[0].widget.formatter, eventloop)
+        frontend.connect(eventloop, screen, highlighter)
+        timer.phase('start the kernels')
+
+        mainloop = ThrottledMainLoop(frontend,
+                screen = screen,
+                unhandled_input = frontend.handle_input,
+                input_filter = frontend.filter_input,
+                event_loop = eventloop,
+                max_fps = 30)
+        latency.attach_main_loop(mainloop)
+        if held:
+            mainloop.set_alarm_in(0, lambda loop, keys: loop.process_input(
+                frontend.filter_input(keys, [])), held)
+        timer.phase('connect to the kernels')
+        if args.profile_startup:
+            tab = frontend.tabs[0]
+            _time_kernel_ready(timer, tab.kernel, tab.interp)
+
         mainloop.run()
-    except:
-        try:
-            kern.stop_channels()
-            kern.kill_kernel()
-        except RuntimeError:
-            pass
-        raise
+    finally:
+        screen.stop()
+        frontend.close()
+        if highlighter is not None:
+            highlighter.close()
+        if args.latency_log:
+            latency.dump(args.latency_log)
+        if args.profile_startup:
+            timer.report()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,272 @@
+"""Latencies of the frontend and of its kernels, kept as rolling histograms.
+
+A LatencyMonitor attached to kernel managers, the event loop and the main
+loop measures:
+
+  key       from a key being pressed to the screen being drawn after it
+  output    from an execute_request being sent to its first output (a
+            stream, pyout or pyerr message)
+  execute   the round trip of an execute_request to its execute_reply
+  complete  the round trip of a complete_request to its complete_reply
+  beat      the round trip of a heartbeat
+  queue     how many messages are waiting each time the event loop takes a
+            batch
+
+so that a slow kernel can be told from a slow frontend. LatencyLine shows
+them on one line, and dump() writes them out as JSON.
+
+The channels are watched as tracelog.TraceRecorder watches them, which with
+the channels of a PollerKernelManager all happens in one thread."""
+
+import json, math, time
+from collections import deque
+
+import urwid
+
+
+class RollingHistogram(object):
+    """The last `size` samples of a quantity, counted in buckets that grow by
+    a factor of sqrt(2) from `resolution` up, so that percentiles can be read
+    without sorting. A percentile is given as the upper end of its bucket
+    (or 0 below resolution), but no more than the largest sample."""
+    size = 1000
+    nbuckets = 64
+
+    def __init__(self, resolution, size=None):
+        self.resolution = resolution
+        if size is not None:
+            self.size = size
+        self.samples = deque()
+        self.counts = [0] * self.nbuckets
+        # samples ever added
+        self.total = 0
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _bucket(self, value):
+        if value < self.resolution:
+            return 0
+        bucket = int(2 * math.log(value / self.resolution, 2)) + 1
+        return min(bucket, self.nbuckets - 1)
+
+    def upper(self, bucket):
+        """The upper end of bucket, or 0 for the samples below
+        resolution."""
+        if bucket == 0:
+            return 0
+        return self.resolution * 2 ** (bucket / 2.0)
+
+    def add(self, value):
+        bucket = self._bucket(value)
+        self.samples.append((value, bucket))
+        self.counts[bucket] += 1
+        self.total += 1
+        if len(self.samples) > self.size:
+            value, bucket = self.samples.popleft()
+            self.counts[bucket] -= 1
+
+    def percentile(self, p):
+        """Returns the p-th percentile of the samples, or None if there are
+        none."""
+        if not self.samples:
+            return None
+        wanted = p / 100.0 * len(self.samples)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                break
+        if bucket == self.nbuckets - 1:
+            # the samples past the buckets are counted in the last one
+            return self.max()
+        return min(self.upper(bucket), self.max())
+
+    def max(self):
+        return max(value for value, bucket in self.samples)
+
+    @property
+    def last(self):
+        return self.samples[-1][0] if self.samples else None
+
+    def summary(self):
+        """Returns a dict of the count, percentiles and largest sample."""
+        summary = {'count': len(self.samples), 'total': self.total}
+        if self.samples:
+            summary['max'] = self.max()
+            for p in (50, 90, 99):
+                summary['p%d' % p] = self.percentile(p)
+            summary['buckets'] = dict((self.upper(bucket), count)
+                                      for bucket, count
+                                      in enumerate(self.counts) if count)
+        return summary
+
+
+class LatencyMonitor(object):
+    """Measures latencies (in milliseconds) into rolling histograms, named
+    as in the module's docstring."""
+    # requests whose replies are still awaited, kept at most
+    max_waiting = 1000
+
+    # the histograms, in the order of the module's docstring
+    names = ('key', 'output', 'execute', 'complete', 'beat', 'queue')
+
+    def __init__(self, size=None):
+        self.histograms = {}
+        for name in self.names:
+            resolution = 1 if name == 'queue' else 0.1
+            self.histograms[name] = RollingHistogram(resolution, size)
+        # msg_id -> (msg_type, time sent), and the msg_ids in the order sent,
+        # including some answered since
+        self._waiting = {}
+        self._sent_order = deque()
+        # msg_ids of the execute_requests without output yet
+        self._no_output = set()
+        self._key_time = None
+
+    def add(self, name, value):
+        self.histograms[name].add(value)
+
+    def _wrap(self, obj, method, before):
+        original = getattr(obj, method)
+        def wrapper(*args):
+            before(*args)
+            return original(*args)
+        setattr(obj, method, wrapper)
+
+    def attach(self, kernelmanager):
+        """Watches the requests sent to the kernel of kernelmanager and its
+        replies. The heartbeat is unpaused, to be measured, if its channel
+        has an rtt_handler (as PollerHB does)."""
+        self._wrap(kernelmanager.xreq_channel, '_queue_request', self.sent)
+        for channel in (kernelmanager.xreq_channel, kernelmanager.sub_channel):
+            self._wrap(channel, 'call_handlers', self.received)
+        hb = kernelmanager.hb_channel
+        if hasattr(hb, 'rtt_handler'):
+            hb.rtt_handler = lambda rtt: self.add('beat', rtt * 1e3)
+            hb.unpause()
+
+    def attach_event_loop(self, loop):
+        """Samples the depth of the queue of loop (an IpyEventLoop) before
+        each batch of messages."""
+        def sample():
+            self.add('queue', loop.queue.qsize() + len(loop._backlog))
+        self._wrap(loop, '_run_msgs', sample)
+
+    def attach_main_loop(self, mainloop):
+        """Times mainloop (a ThrottledMainLoop) from the first key pressed
+        to the screen drawn after it."""
+        def pressed(keys):
+            if self._key_time is None:
+                self._key_time = time.time()
+        self._wrap(mainloop, 'process_input', pressed)
+        draw_screen = mainloop.draw_screen
+        def drawn():
+            draw_screen()
+            if self._key_time is not None:
+                self.add('key', (time.time() - self._key_time) * 1e3)
+                self._key_time = None
+        mainloop.draw_screen = drawn
+
+    def sent(self, msg):
+        msg_type = msg['msg_type']
+        if msg_type not in ('execute_request', 'complete_request'):
+            return
+        msg_id = msg['header']['msg_id']
+        self._waiting[msg_id] = (msg_type, time.time())
+        self._sent_order.append(msg_id)
+        if msg_type == 'execute_request':
+            self._no_output.add(msg_id)
+        while len(self._waiting) > self.max_waiting:
+            oldest = self._sent_order.popleft()
+            self._waiting.pop(oldest, None)
+            self._no_output.discard(oldest)
+        if len(self._sent_order) > 2 * self.max_waiting:
+            # forget the msg_ids answered
+            self._sent_order = deque(msg_id for msg_id in self._sent_order
+                                     if msg_id in self._waiting)
+
+    def received(self, msg):
+        msg_id = msg['parent_header'].get('msg_id')
+        if msg_id not in self._waiting:
+            return
+        msg_type = msg['msg_type']
+        since = (time.time() - self._waiting[msg_id][1]) * 1e3
+        if msg_type in ('stream', 'pyout', 'pyerr'):
+            if msg_id in self._no_output:
+                self._no_output.discard(msg_id)
+                self.add('output', since)
+        elif msg_type in ('execute_reply', 'complete_reply'):
+            del self._waiting[msg_id]
+            self.add(msg_type.split('_')[0], since)
+            # replies may come before the output, or with none at all
+            self._no_output.discard(msg_id)
+
+    def summary(self):
+        return dict((name, histogram.summary())
+                    for name, histogram in self.histograms.items())
+
+    def dump(self, f):
+        """Writes the summary of each histogram to f, a file name or a file
+        opened for writing, as JSON. Times are in milliseconds."""
+        if isinstance(f, basestring):
+            with open(f, 'w') as out:
+                return self.dump(out)
+        json.dump(self.summary(), f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+class LatencyLine(urwid.Text):
+    """A line showing the median and 99th percentile of each latency of a
+    LatencyMonitor, updated every `interval` seconds by an alarm on loop
+    while shown."""
+    interval = 0.5
+
+    def __init__(self, monitor, loop=None):
+        urwid.Text.__init__(self, u'', wrap='clip')
+        self.monitor = monitor
+        self.loop = loop
+        self._alarm = None
+
+    # the name shown for each histogram
+    labels = (('key', 'key'), ('output', 'out'), ('execute', 'exec'),
+              ('complete', 'comp'), ('beat', 'beat'), ('queue', 'queue'))
+
+    def _format(self, name, label):
+        histogram = self.monitor.histograms[name]
+        if not histogram:
+            return u'%s -' % label
+        p50, p99 = histogram.percentile(50), histogram.percentile(99)
+        if name == 'queue':
+            return u'%s %d/%d' % (label, p50, p99)
+        return u'%s %s/%s' % (label, _short(p50), _short(p99))
+
+    def update(self):
+        fields = [self._format(name, label) for name, label in self.labels]
+        self.set_text(u'  '.join(fields) + u'  (ms, p50/p99)')
+
+    def start(self, loop=None):
+        """Starts updating the line."""
+        if loop is not None:
+            self.loop = loop
+        self.update()
+        if self.loop is not None and self._alarm is None:
+            self._alarm = self.loop.alarm(self.interval, self._tick)
+
+    def stop(self):
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+            self._alarm = None
+
+    def _tick(self):
+        self._alarm = None
+        self.start()
+
+
+def _short(value):
+    """Formats value in at most four characters or so."""
+    if value < 10:
+        return u'%.1f' % value
+    if value < 10000:
+        return u'%d' % value
+    return u'%dk' % (value // 1000)
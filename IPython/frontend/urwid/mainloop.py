@@ -0,0 +1,81 @@
+"""A MainLoop that limits how often the screen is redrawn."""
+
+import time
+
+import urwid
+from urwid.canvas import CanvasCache
+
+
+class ThrottledMainLoop(urwid.MainLoop):
+    """A MainLoop that redraws the screen at most max_fps times a second.
+
+    urwid.MainLoop redraws whenever the event loop goes idle, which with fast
+    output means once for every batch of messages. Here a change that comes
+    less than a frame after the last redraw is left for an alarm at the start
+    of the next frame, so all of the changes made until then are drawn
+    together. Input is drawn at the next idle, without waiting.
+
+    frames_drawn counts the redraws, and frames_skipped the idle passes that
+    left a change for the next frame. max_fps=None redraws on every idle,
+    like urwid.MainLoop."""
+    def __init__(self, *args, **kw):
+        self.max_fps = kw.pop('max_fps', 30)
+        urwid.MainLoop.__init__(self, *args, **kw)
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+        self._last_draw = 0
+        self._last_canvas = None
+        self._frame_alarm = None
+        self._input_pending = False
+
+    def _changed(self):
+        """Returns whether the screen may have changed since the last
+        redraw: the topmost widget's canvas is no longer cached."""
+        if self._last_canvas is None or not self.screen_size:
+            return True
+        widget = self._topmost_widget
+        for cls in type(widget).__mro__:
+            if 'render' in cls.__dict__:
+                break
+        focus = not getattr(cls, 'ignore_focus', False)
+        canvas = CanvasCache.fetch(widget, cls, self.screen_size, focus)
+        return canvas is not self._last_canvas
+
+    def process_input(self, keys):
+        self._input_pending = True
+        return urwid.MainLoop.process_input(self, keys)
+
+    def entering_idle(self):
+        if not self.screen.started:
+            return
+        if self._input_pending or not self.max_fps:
+            self.draw_screen()
+            return
+        if not self._changed():
+            return
+        wait = self._last_draw + 1.0 / self.max_fps - time.time()
+        if wait <= 0:
+            self.draw_screen()
+            return
+        self.frames_skipped += 1
+        if self._frame_alarm is None:
+            self._frame_alarm = self.event_loop.alarm(wait, self._next_frame)
+
+    def _next_frame(self):
+        self._frame_alarm = None
+        if self.screen.started and self._changed():
+            self.draw_screen()
+
+    def draw_screen(self):
+        if self._frame_alarm is not None:
+            self.event_loop.remove_alarm(self._frame_alarm)
+            self._frame_alarm = None
+        self._input_pending = False
+        if not self.screen_size:
+            self.screen_size = self.screen.get_cols_rows()
+
+        canvas = self._topmost_widget.render(self.screen_size, focus=True)
+        self.screen.draw_screen(self.screen_size, canvas)
+        self._last_canvas = canvas
+        self._last_draw = time.time()
+        self.frames_drawn += 1
@@ -0,0 +1,458 @@
+"""A pager widget, showing long text a screenful at a time.
+
+The text may be a string, a file or any iterable of strings. Only the lines
+on screen are turned into widgets. The lines of a string or file are found by
+a thread that indexes the offsets where they start in the background, so the
+first screen shows at once however long the text is; the lines an iterable
+yields are taken as they are needed.
+
+PagedWidget shows a Pager in place of another widget, and the widget again
+when the pager is quit, without it having been touched in between."""
+
+import array, re, threading
+
+import urwid
+
+from ansimarkup import ansi_markup
+
+# terminal escapes and the backspace overstriking of man pages and pydoc
+_escape_re = re.compile(u'\x1b\\[[0-9;?]*[A-Za-z]|.\x08')
+
+def plain(line):
+    """Returns line without terminal escapes or overstriking."""
+    if u'\x1b' in line or u'\x08' in line:
+        return _escape_re.sub(u'', line)
+    return line
+
+def _expand_tabs(markup):
+    """Expands the tabs in a list of strings and (attr, string) pieces."""
+    expanded = []
+    col = 0
+    for piece in markup:
+        attr, text = piece if isinstance(piece, tuple) else (None, piece)
+        parts = text.split(u'\t')
+        text = parts[0]
+        col += len(text)
+        for part in parts[1:]:
+            spaces = 8 - col % 8
+            text += u' ' * spaces + part
+            col += spaces + len(part)
+        expanded.append(text if attr is None else (attr, text))
+    return expanded
+
+
+class TextLines(object):
+    """The lines of a string, or of a file opened for reading (and seeking).
+
+    The offsets the lines start at are found a chunk_size piece at a time,
+    by a background thread started by start_indexing(), or by index_to()
+    when a line is wanted that has not been reached yet."""
+    chunk_size = 1 << 16
+
+    def __init__(self, text, encoding='utf-8'):
+        if isinstance(text, basestring):
+            self._file = None
+            self._data = text
+            self._size = len(text)
+            newline = u'\n' if isinstance(text, unicode) else '\n'
+        else:
+            self._file = text
+            text.seek(0, 2)
+            self._size = text.tell()
+            newline = '\n'
+        self._newline = newline
+        self.encoding = encoding
+        # the offsets of the starts of the lines found so far
+        self._starts = array.array('L', [0])
+        self._scanned = 0
+        self.complete = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+        if self._size == 0:
+            self._finish()
+
+    @property
+    def count(self):
+        """The number of lines found so far; all of them if complete."""
+        return len(self._starts)
+
+    def _read(self, start, stop):
+        if self._file is None:
+            return self._data[start:stop]
+        self._file.seek(start)
+        return self._file.read(stop - start)
+
+    def _finish(self):
+        if self._size and self._starts[-1] == self._size:
+            # the text ends with a newline, not with an empty line
+            self._starts.pop()
+        self.complete = True
+
+    def _index_chunk(self):
+        """Finds the lines in the next chunk. Call with the lock held."""
+        start = self._scanned
+        chunk = self._read(start, start + self.chunk_size)
+        find, newline, starts = chunk.find, self._newline, self._starts
+        pos = find(newline)
+        while pos >= 0:
+            starts.append(start + pos + 1)
+            pos = find(newline, pos + 1)
+        self._scanned = start + len(chunk)
+        if not chunk or self._scanned >= self._size:
+            self._finish()
+
+    def index_to(self, n):
+        """Finds lines until there are more than n, or there are no more."""
+        with self._lock:
+            while not self.complete and len(self._starts) <= n + 1:
+                self._index_chunk()
+
+    def index_all(self):
+        self.index_to(self._size)
+
+    def start_indexing(self):
+        """Finds the rest of the lines in a background thread."""
+        if self.complete or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_indexing)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_indexing(self):
+        while not self.complete and not self._stop:
+            with self._lock:
+                if not self.complete:
+                    self._index_chunk()
+
+    def line(self, n):
+        """Returns line n (counting from 0) without its newline, or None if
+        the text has fewer lines."""
+        self.index_to(n)
+        with self._lock:
+            starts = self._starts
+            if n >= len(starts):
+                return None
+            if n + 1 < len(starts):
+                stop = starts[n + 1] - 1
+            else:
+                stop = self._size
+                if self._read(stop - 1, stop) == self._newline:
+                    stop -= 1
+            text = self._read(starts[n], stop)
+        if isinstance(text, str):
+            text = text.decode(self.encoding, 'replace')
+        return text
+
+    def close(self):
+        """Stops the indexing. A file is left open."""
+        self._stop = True
+
+
+class IterLines(object):
+    """The lines of the strings an iterable yields, with the same interface
+    as TextLines. The strings may hold any number of lines, or parts of
+    them. The iterable is only read on when a line past the ones it has
+    given so far is wanted, and only in the thread wanting it."""
+    def __init__(self, iterable, encoding='utf-8'):
+        self._iter = iter(iterable)
+        self.encoding = encoding
+        self._lines = []
+        self._partial = u''
+        self.complete = False
+
+    @property
+    def count(self):
+        return len(self._lines)
+
+    def _take(self):
+        try:
+            text = next(self._iter)
+        except StopIteration:
+            if self._partial:
+                self._lines.append(self._partial)
+            self._partial = u''
+            self.complete = True
+            return
+        if isinstance(text, str):
+            text = text.decode(self.encoding, 'replace')
+        lines = (self._partial + text).split(u'\n')
+        self._partial = lines.pop()
+        self._lines.extend(lines)
+
+    def index_to(self, n):
+        while not self.complete and len(self._lines) <= n:
+            self._take()
+
+    def index_all(self):
+        while not self.complete:
+            self._take()
+
+    def start_indexing(self):
+        pass
+
+    def line(self, n):
+        self.index_to(n)
+        if n < len(self._lines):
+            return self._lines[n]
+        return None
+
+    def close(self):
+        pass
+
+
+def lines_of(text):
+    """Returns a TextLines or IterLines for text, a string, file or
+    iterable of strings."""
+    if isinstance(text, basestring) or hasattr(text, 'seek'):
+        return TextLines(text)
+    return IterLines(text)
+
+
+class Pager(urwid.BoxWidget):
+    """Shows text a screenful at a time, as less does.
+
+    Keys:
+      down, j, enter        one line on
+      up, k, y              one line back
+      space, page down, f   one screen on
+      page up, b            one screen back
+      d, u                  half a screen on or back
+      home, g / end, G      to the top or the bottom
+      left, right           half a screen sideways
+      /, ?                  search forwards or backwards
+      n, N                  search again, in the same or the other direction
+      q, esc                quit
+
+    The search is for plain text, ignoring case unless the pattern has
+    capitals in it. Lines are clipped at the edge of the screen, and colored
+    by their own escapes, each from the default colors.
+    A BOX widget."""
+    _status_attr = urwid.AttrSpec('default,standout', 'default')
+    _match_attr = urwid.AttrSpec('black', 'yellow')
+
+    def __init__(self, text, start=0, on_quit=None):
+        """
+        text -- a string, a file or an iterable of strings
+        start -- the line to show at the top first
+        on_quit -- called with no arguments when the pager is quit"""
+        self.lines = lines_of(text)
+        self.lines.start_indexing()
+        self.top = max(start, 0)
+        self.left = 0
+        self.on_quit = on_quit
+        self.pattern = None
+        self.backwards = False
+        self.message = None
+        self._prompt = None
+        self._rows = None
+
+    def selectable(self):
+        return True
+
+    def close(self):
+        self.lines.close()
+
+    def markup(self, line):
+        """Returns the urwid markup for a line of the text, colored by its
+        terminal escapes."""
+        if u'\x08' in line:
+            line = plain(line)
+        markup = ansi_markup(line)
+        if u'\t' in line:
+            markup = _expand_tabs(markup)
+        return markup
+
+    def _line_markup(self, n):
+        line = self.lines.line(n)
+        if line is None:
+            return u'~'
+        if self.pattern:
+            text = plain(line).expandtabs()
+            starts = self._matches(text)
+            if starts:
+                markup, pos = [], 0
+                for start in starts:
+                    markup.append(text[pos:start])
+                    pos = start + len(self.pattern)
+                    markup.append((self._match_attr, text[start:pos]))
+                markup.append(text[pos:])
+                return markup
+        return self.markup(line)
+
+    def _matches(self, text):
+        """Returns the offsets in text of the matches of the pattern."""
+        pattern = self.pattern
+        if pattern == pattern.lower():
+            text = text.lower()
+        starts = []
+        pos = text.find(pattern)
+        while pos >= 0:
+            starts.append(pos)
+            pos = text.find(pattern, pos + len(pattern))
+        return starts
+
+    def status(self):
+        first = self.top + 1
+        last = self.top + self._rows
+        if self.lines.complete:
+            total = self.lines.count
+            last = min(last, total)
+            return u'lines %d-%d/%d %s' % (first, last, total,
+                u'(END)' if last >= total else
+                u'%d%%' % (100 * last // max(total, 1)))
+        return u'lines %d-%d/%d+' % (first, last, self.lines.count)
+
+    def render(self, size, focus=False):
+        maxcol, maxrow = size
+        rows = self._rows = max(maxrow - 1, 1)
+        self.lines.index_to(self.top + rows)
+        markup = []
+        for n in xrange(self.top, self.top + rows):
+            if markup:
+                markup.append(u'\n')
+            markup.append(self._line_markup(n))
+        body = urwid.Text(markup, wrap='clip').render((maxcol + self.left,))
+        body = urwid.CompositeCanvas(body)
+        if self.left:
+            body.pad_trim_left_right(-self.left, 0)
+        if self._prompt is not None:
+            status = self._prompt.render((maxcol,), focus=True)
+        else:
+            text = self.message or self.status()
+            status = urwid.Text((self._status_attr, text),
+                                wrap='clip').render((maxcol,))
+        if maxrow == 1:
+            return status
+        return urwid.CanvasCombine([(body, None, False),
+                                    (status, None, True)])
+
+    def _last_top(self):
+        """The top line that shows the last line at the bottom."""
+        self.lines.index_all()
+        return max(self.lines.count - self._rows, 0)
+
+    def scroll(self, n):
+        """Moves n lines on, or back if n is negative."""
+        top = max(self.top + n, 0)
+        if n > 0:
+            self.lines.index_to(top + self._rows)
+            if self.lines.complete:
+                top = min(top, max(self.lines.count - self._rows, 0))
+        self.top = top
+        self._invalidate()
+
+    def keypress(self, size, key):
+        maxcol, maxrow = size
+        self._rows = max(maxrow - 1, 1)
+        if self._prompt is not None:
+            return self._prompt_keypress(maxcol, key)
+        self.message = None
+        rows = self._rows
+        if key in ('q', 'Q', 'esc'):
+            self.close()
+            if self.on_quit is not None:
+                self.on_quit()
+        elif key in ('down', 'j', 'enter', 'ctrl n'):
+            self.scroll(1)
+        elif key in ('up', 'k', 'y', 'ctrl p'):
+            self.scroll(-1)
+        elif key in (' ', 'page down', 'f', 'ctrl f'):
+            self.scroll(rows)
+        elif key in ('page up', 'b', 'ctrl b'):
+            self.scroll(-rows)
+        elif key == 'd':
+            self.scroll(rows // 2)
+        elif key == 'u':
+            self.scroll(-(rows // 2))
+        elif key in ('home', 'g', '<'):
+            self.top = 0
+        elif key in ('end', 'G', '>'):
+            self.top = self._last_top()
+        elif key == 'right':
+            self.left += maxcol // 2
+        elif key == 'left':
+            self.left = max(self.left - maxcol // 2, 0)
+        elif key in ('/', '?'):
+            self._prompt = urwid.Edit(key)
+        elif key == 'n':
+            self.search(self.backwards)
+        elif key == 'N':
+            self.search(not self.backwards)
+        else:
+            return key
+        self._invalidate()
+
+    def _prompt_keypress(self, maxcol, key):
+        if key == 'enter':
+            caption, text = self._prompt.caption, self._prompt.edit_text
+            self._prompt = None
+            if text:
+                self.pattern = text
+            self.backwards = caption == '?'
+            if self.pattern:
+                self.search(self.backwards)
+        elif key == 'esc':
+            self._prompt = None
+        elif key == 'backspace' and not self._prompt.edit_text:
+            self._prompt = None
+        else:
+            self._prompt.keypress((maxcol,), key)
+        self._invalidate()
+
+    def search(self, backwards=False):
+        """Moves the next line matching the pattern to the top, searching
+        from the line after the top one, or the one before it."""
+        if not self.pattern:
+            self.message = u'No previous search'
+            return
+        if backwards:
+            found = self._find(xrange(self.top - 1, -1, -1))
+        else:
+            found = self._find(self._forward(self.top + 1))
+        if found is None:
+            self.message = u'Pattern not found: %s' % self.pattern
+        else:
+            self.top = found
+        self._invalidate()
+
+    def _forward(self, n):
+        lines = self.lines
+        while True:
+            lines.index_to(n)
+            if n >= lines.count:
+                return
+            yield n
+            n += 1
+
+    def _find(self, numbers):
+        for n in numbers:
+            if self._matches(plain(self.lines.line(n))):
+                return n
+        return None
+
+
+class PagedWidget(urwid.WidgetWrap):
+    """Shows a widget, or a Pager in its place while text is paged."""
+    def __init__(self, w):
+        self.widget = w
+        self.pager = None
+        urwid.WidgetWrap.__init__(self, w)
+
+    @property
+    def paging(self):
+        return self.pager is not None
+
+    def page(self, text, start=0):
+        """Pages text (see Pager) until the pager is quit."""
+        if self.pager is not None:
+            self.pager.close()
+        self.pager = Pager(text, start, on_quit=self.unpage)
+        self._w = self.pager
+
+    def unpage(self):
+        """Quits the pager, if there is one, showing the widget again."""
+        if self.pager is not None:
+            self.pager.close()
+            self.pager = None
+        self._w = self.widget
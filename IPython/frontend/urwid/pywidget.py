@@ -1,11 +1,11 @@
 # encoding: UTF-8
-import pygments, pygments.lexers, pygments.formatters
-
-import subprocess
+import pygments, pygments.lexers
 
 import urwid
 import urwid.widget as widget
 from urwidpygments import UrwidFormatter
+from incrementallexer import IncrementalHighlighter, supports
+from scrollback import RingListWalker, SpooledListWalker, FoldedText
 
 def recompose(text, attrlst):
     """For some reason, urwid.Text.get_text returns an object not
@@ -16,8 +16,34 @@ def recompose(text, attrlst):
     for (attr, length) in attrlst:
         textpiece, text = text[:length], text[length:]
         markup.append((attr, textpiece))
+    if text:
+        # get_text leaves unattributed text at the end out of attrlst
+        markup.append(text)
     return markup
 
+def _strip_newline(markup):
+    """Returns (markup without its trailing newline, whether it ended with
+    one), where the second is None if markup holds no text."""
+    if isinstance(markup, basestring):
+        if markup.endswith('\n'):
+            return markup[:-1], True
+        return markup, (False if markup else None)
+    if isinstance(markup, tuple):
+        attr, inner = markup
+        inner, ended = _strip_newline(inner)
+        return (attr, inner), ended
+    markup = list(markup)
+    # the last piece may be empty, so look back to the last piece of text
+    for i in reversed(range(len(markup))):
+        markup[i], ended = _strip_newline(markup[i])
+        if ended is not None:
+            return markup, ended
+    return markup, None
+
+def strip_newline(markup):
+    """Returns markup without the newline it ends with, if it ends with
+    one."""
+    return _strip_newline(markup)[0]
 
 class PythonEdit(widget.Edit): # flow
     """An editbox that colorizes python code.
@@ -35,6 +61,13 @@ class PythonEdit(widget.Edit): # flow
             self.formatter = formatter
         else:
             self.formatter = UrwidFormatter()
+        
+        # Only the changed lines need re-lexing if the lexer allows it
+        if supports(self.lexer):
+            self.highlighter = IncrementalHighlighter(self.lexer,
+                                                      self.formatter)
+        else:
+            self.highlighter = None
             
         # note: captions not allowed
         widget.Edit.__init__(self, '', edit_text, multiline, align,
@@ -73,6 +106,12 @@ class PythonEdit(widget.Edit): # flow
         text = self.edit_text
         assert hasattr(self, 'formatter')
         assert hasattr(self, 'lexer')
+        if self.highlighter is not None:
+            # Edit.get_text pairs edit_text with _attrib, so setting the
+            # attributes is all widget.Text.set_text would do for us.
+            self._attrib = self.highlighter.update(text)
+            self._invalidate()
+            return
         tkns = self.lexer.get_tokens(text)
         markup = list(self.formatter.formatgenerator(tkns))
         widget.Text.set_text(self, markup)
@@ -171,6 +210,78 @@ class TextGrid(widget.WidgetWrap):
         self._w.cell_width = 15
         self._w._cache_maxcol = None # hack to invalidate caches
 
+class CompletionGrid(widget.FlowWidget):
+    """Shows a list of strings in columns, in at most maxrows rows.
+
+    Only the rows on screen are turned into text, so the list may be long.
+    narrow() filters it down to the strings starting with a prefix, working
+    from the last filtered list when the prefix only got longer.
+    A FLOW widget."""
+    def __init__(self, matches=(), cellwidth=None, maxrows=8):
+        """
+        cellwidth -- the width of a column, or None to fit the longest string
+        maxrows -- the number of rows shown; a last row that does not fit
+                   tells how many strings are left out"""
+        self.cellwidth = cellwidth
+        self.maxrows = maxrows
+        self.show(list(matches))
+
+    def show(self, matches, prefix=u''):
+        """Shows the strings in matches that start with prefix. matches is
+        kept, not copied: pass the same list again to narrow it further."""
+        if matches is not getattr(self, 'matches', None):
+            self.matches = self.shown = matches
+            self.prefix = u''
+            self._width = None
+        self.narrow(prefix)
+
+    def set_text(self, cells):
+        """Shows cells, a list of strings (as TextGrid.set_text)."""
+        self.show(list(cells))
+
+    def narrow(self, prefix):
+        """Shows only the strings starting with prefix."""
+        if prefix != self.prefix or self._width is None:
+            if prefix.startswith(self.prefix):
+                source = self.shown
+            else:
+                source = self.matches
+            if prefix:
+                self.shown = [m for m in source if m.startswith(prefix)]
+            else:
+                self.shown = source
+            self.prefix = prefix
+            self._width = max([len(m) for m in self.shown] or [0]) + 1
+            self._invalidate()
+
+    def _layout(self, maxcol):
+        """Returns (columns, column width, rows) for maxcol."""
+        width = min(self.cellwidth or self._width, maxcol) or 1
+        ncols = max(maxcol // width, 1)
+        nrows = -(-len(self.shown) // ncols)
+        return ncols, width, nrows
+
+    def rows(self, size, focus=False):
+        ncols, width, nrows = self._layout(size[0])
+        return min(nrows, self.maxrows)
+
+    def render(self, size, focus=False):
+        maxcol, = size
+        ncols, width, nrows = self._layout(maxcol)
+        shown = min(nrows, self.maxrows)
+        if shown < nrows:
+            # leave the last row to say what does not fit
+            shown -= 1
+        lines = []
+        for row in xrange(shown):
+            cells = self.shown[row*ncols:(row+1)*ncols]
+            lines.append(u''.join(cell[:width-1].ljust(width)
+                                  for cell in cells))
+        if shown < nrows:
+            lines.append(u'... %d more' % (len(self.shown) - shown*ncols))
+        text = widget.Text(u'\n'.join(lines), wrap='clip')
+        return text.render((maxcol,))
+
 class Switcher(widget.WidgetWrap):
     def __init__(self, firstwidget=None):
         if firstwidget is None:
@@ -223,12 +334,27 @@ class UpperBox(widget.WidgetWrap):
         self._invalidate()
 
 class OutputBox(widget.WidgetWrap):
-    def __init__(self, remember=1000, jumptobottom=True): #, lexer=None, formatter=None):
+    """A scrolling box of output. It keeps the last `remember` outputs, or
+    with spool=True, all of the output lines in a temporary file, with only
+    the ones on screen held as widgets (see SpooledListWalker).
+
+    Without spool, outputs of more than FoldedText.threshold lines are
+    folded, showing only their first and last lines until expanded. (The
+    spooled box only makes widgets for the lines on screen anyway.)"""
+    def __init__(self, remember=1000, jumptobottom=True, spool=False): #, lexer=None, formatter=None):
         self.remember = remember
         #self.lexer=lexer
         #self.formatter=formatter
-        self.list = urwid.SimpleListWalker([])
+        self.spool = spool
+        if spool:
+            self.list = SpooledListWalker()
+        else:
+            self.list = RingListWalker(remember)
         self.jumptobottom = jumptobottom
+        # the position of the last output, and whether it ended with a
+        # newline, for extend()
+        self._last = None
+        self._newline = False
         mywidget = urwid.ListBox(self.list)
         widget.WidgetWrap.__init__(self, mywidget)
     
@@ -240,38 +366,61 @@ class OutputBox(widget.WidgetWrap):
     def jumptobottom(self, val):
         self._jumptobottom = bool(val)
         if len(self.list) > 0:
-            self.list.set_focus(len(self.list))
+            self.list.set_focus_last()
         
     def add_stdout(self, markup):
-        t=urwid.Text(markup)
-        txt, attrs = t.get_text()
-        if len(txt) > 0 and txt[-1] == u'\n':
-            txt = txt[:-1]
-            t.set_text(recompose(txt, attrs))
-        self.list.append(t)
-        self.list[:] = self.list[-self.remember:]
+        """Adds markup, and returns its position, for replace() and
+        extend()."""
+        markup, self._newline = _strip_newline(markup)
+        position = self._last = self.list.end
+        if self.spool:
+            self.list.append_markup(markup, focus=self.jumptobottom)
+            return position
+        self.list.append(self._output(markup), focus=self.jumptobottom)
+        return position
+
+    def _output(self, markup):
+        """Returns a widget showing markup, folded if it is long."""
+        text = urwid.Text(markup)
+        if text.text.count(u'\n') >= FoldedText.threshold:
+            fold = FoldedText()
+            fold.extend_text(*text.get_text())
+            return fold
+        return text
+
+    def extend(self, position, markup):
+        """Continues the output added at position with markup, if nothing
+        has been added since. Returns whether it did."""
+        if position is None or position != self._last:
+            return False
+        if self._newline:
+            markup = [u'\n', markup]
+        markup, self._newline = _strip_newline(markup)
+        if self.spool:
+            self.list.extend_markup(markup, focus=self.jumptobottom)
+            return True
+        if not self.list.start <= position < self.list.end:
+            return False
+        output = self.list[position]
+        if isinstance(output, FoldedText):
+            output.extend(markup)
+        else:
+            # text that grows past the threshold is folded
+            self.list[position] = self._output(
+                [recompose(*output.get_text()), markup])
         if self.jumptobottom:
-            self.list.set_focus(len(self.list))
+            self.list.set_focus_last()
+        return True
+
+    def replace(self, position, markup):
+        """Replaces the output added at position with markup of the same
+        text, as when it has been highlighted. Output that has been dropped
+        is left alone."""
+        markup = strip_newline(markup)
+        if self.spool:
+            self.list.replace_markup(position, markup)
+        elif self.list.start <= position < self.list.end:
+            self.list[position].set_text(markup)
     
     def atbottom(self, size):
         return 'bottom' in self._w.ends_visible(size)
-    
-class PagerScreen(urwid.raw_display.Screen):
-    """Derives from urwid.raw_display.Screen, and adds a function to run text
-    through a pager."""
-    def page(self, txt):
-        """Turn off urwid, run a pager, and then resume.
-        Text is handed directly to the pager, so any markup needs to be turned
-        into basic terminal escapes."""
-        
-        started = self._started
-        if started:
-            self.stop()
-        proc = subprocess.Popen(['less', '-Rc'], stdin=subprocess.PIPE)
-        #proc = subprocess.Popen(['more', '-c'], stdin=PIPE)
-        try:
-            proc.communicate(txt)
-        except IOError:
-            pass
-        proc.wait()
-        self.start()
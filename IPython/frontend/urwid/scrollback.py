@@ -0,0 +1,623 @@
+"""List walkers for the scrollback of the output box, and the folded text
+it shows long outputs in."""
+
+import collections, marshal, struct, tempfile
+
+import urwid
+import urwid.util
+
+
+class RingListWalker(urwid.ListWalker):
+    """A list walker holding at most capacity widgets. Appending to a full
+    walker drops the oldest widget, in constant time.
+
+    Positions are absolute: the n-th widget ever appended has position n, and
+    keeps it until it is dropped. So the positions a ListBox holds on to stay
+    valid as old widgets are dropped, and a focus that is dropped moves to
+    the oldest widget left. The positions in the walker are
+    range(start, end).
+
+    A widget dropped, by append(), by being replaced or by clear(), is
+    closed if it has a close() method, so that one holding files (as a
+    folded FoldedText does) lets go of them."""
+    def __init__(self, capacity=1000, contents=()):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1, not %r' % capacity)
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self.start = self.end = 0
+        self.focus = 0
+        self.extend(contents)
+
+    def __hash__(self): return id(self)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, position):
+        if not self.start <= position < self.end:
+            raise IndexError('position %r not in the walker' % position)
+        return self._items[position % self.capacity]
+
+    def __iter__(self):
+        for position in xrange(self.start, self.end):
+            yield self._items[position % self.capacity]
+
+    def __setitem__(self, position, widget):
+        if not self.start <= position < self.end:
+            raise IndexError('position %r not in the walker' % position)
+        index = position % self.capacity
+        if self._items[index] is not widget:
+            _close(self._items[index])
+        self._items[index] = widget
+        self._modified()
+
+    def _append(self, widget):
+        index = self.end % self.capacity
+        if self.end - self.start == self.capacity:
+            _close(self._items[index])
+            self.start += 1
+        self._items[index] = widget
+        self.end += 1
+
+    def append(self, widget, focus=False):
+        """Adds widget at position end, dropping the oldest widget if the
+        walker is full. If focus is true, the new widget gets the focus."""
+        self._append(widget)
+        if focus:
+            self.focus = self.end - 1
+        self._modified()
+
+    def extend(self, widgets):
+        for widget in widgets:
+            self._append(widget)
+        self._modified()
+
+    def clear(self):
+        """Drops all of the widgets. Positions are not reused."""
+        for widget in self:
+            _close(widget)
+        self._items = [None] * self.capacity
+        self.start = self.end
+        self._modified()
+
+    def _clamp(self, position):
+        return min(max(position, self.start), self.end - 1)
+
+    def get_focus(self):
+        """Return (focus widget, focus position)."""
+        if self.start == self.end:
+            return None, None
+        self.focus = self._clamp(self.focus)
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        """Set focus position. Positions past either end are moved to the
+        nearest widget."""
+        self.focus = position
+        self._modified()
+
+    def set_focus_last(self):
+        self.set_focus(self.end - 1)
+
+    def get_next(self, start_from):
+        """Return (widget after start_from, position after start_from)."""
+        pos = max(start_from + 1, self.start)
+        if pos >= self.end: return None, None
+        return self[pos], pos
+
+    def get_prev(self, start_from):
+        """Return (widget before start_from, position before start_from)."""
+        pos = min(start_from - 1, self.end - 1)
+        if pos < self.start: return None, None
+        return self[pos], pos
+
+
+def _close(widget):
+    # looked up on the class, as the WidgetWrap of older versions of urwid
+    # passes attribute lookups on to the widget it wraps
+    close = getattr(type(widget), 'close', None)
+    if close is not None:
+        close(widget)
+
+
+def _split_lines(text, runs):
+    """Splits text and its run length encoded attributes into lines, and
+    yields (line, runs) for each one, without the newlines."""
+    runs = iter(runs)
+    attr, left = None, 0
+    for line in text.split('\n'):
+        lineruns = []
+        need = len(line)
+        while need:
+            if not left:
+                try:
+                    attr, left = next(runs)
+                except StopIteration:
+                    break
+                continue
+            n = min(need, left)
+            lineruns.append((attr, n))
+            need -= n
+            left -= n
+        yield line, lineruns
+        # the newline
+        while not left:
+            try:
+                attr, left = next(runs)
+            except StopIteration:
+                break
+        left = max(left - 1, 0)
+
+
+def _covering(text, runs):
+    """Returns runs, made to cover all of text."""
+    covered = sum(length for attr, length in runs)
+    if covered < len(text):
+        runs = runs + [(None, len(text) - covered)]
+    return runs
+
+
+def _join_lines(line, more):
+    """Returns the line (text, runs) continued by the line more."""
+    text, runs = line
+    more_text, more_runs = more
+    if not more_runs:
+        return text + more_text, runs
+    runs = _covering(text, runs)
+    if runs and runs[-1][0] == more_runs[0][0]:
+        # one run where the lines meet, so that a line extended bit by bit
+        # does not get a run for each bit
+        runs = runs[:-1] + [(runs[-1][0], runs[-1][1] + more_runs[0][1])]
+        more_runs = more_runs[1:]
+    return text + more_text, runs + more_runs
+
+
+class _AppendFile(object):
+    """A file that is mostly appended to, and read at given offsets. Appended
+    data is buffered until it is read, or the buffer gets large."""
+    flush_size = 1 << 16
+
+    def __init__(self, f):
+        self.file = f
+        self.size = 0
+        self._flushed = 0
+        self._pending = []
+
+    def append(self, data):
+        """Appends data, and returns the offset it was written at."""
+        offset = self.size
+        self._pending.append(data)
+        self.size += len(data)
+        if self.size - self._flushed >= self.flush_size:
+            self.flush()
+        return offset
+
+    def flush(self):
+        if self._pending:
+            self.file.seek(self._flushed)
+            self.file.write(''.join(self._pending))
+            self._pending = []
+            self._flushed = self.size
+
+    def read(self, offset, length):
+        if offset + length > self._flushed:
+            self.flush()
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def write(self, offset, data):
+        """Overwrites data already in the file at offset."""
+        if offset + len(data) > self._flushed:
+            self.flush()
+        self.file.seek(offset)
+        self.file.write(data)
+
+    def truncate(self, size=0):
+        """Drops the data from size on."""
+        if size < self._flushed:
+            self._pending = []
+        else:
+            self.flush()
+        self.size = self._flushed = size
+        self.file.seek(size)
+        self.file.truncate()
+
+    def close(self):
+        self.file.close()
+
+
+class LineSpool(object):
+    """Lines of text with their run length encoded attributes, kept in a
+    temporary file rather than in memory.
+
+    Each line is written to the spool file, and its start and end offsets to
+    a fixed-size record in an index file, so that any line can be found with
+    a single seek. A replaced line is written over the old one if it fits,
+    and otherwise to the end of the spool file, so a line does not always
+    start where the one before it ends. The space left unused by replacing
+    is counted, and once it is more than half of the spool file, the lines
+    are copied to a new one without it. The distinct attributes used are
+    kept in memory. Lines are read back as (text, runs)."""
+    _record = struct.Struct('<QQ')
+    # no compacting below this many unused bytes
+    compact_size = 1 << 20
+
+    def __init__(self, dir=None):
+        self._dir = dir
+        self._spool = _AppendFile(tempfile.TemporaryFile(dir=dir))
+        self._index = _AppendFile(tempfile.TemporaryFile(dir=dir))
+        self._attr_ids = {}
+        self._attrs = []
+        # the bytes of the spool file no line is in
+        self.unused = 0
+
+    def __len__(self):
+        return self._index.size // self._record.size
+
+    def _attr_id(self, attr):
+        if isinstance(attr, urwid.AttrSpec):
+            key = (attr.foreground, attr.background, attr.colors)
+        else:
+            key = attr
+        try:
+            return self._attr_ids[key]
+        except KeyError:
+            self._attr_ids[key] = len(self._attrs)
+            self._attrs.append(attr)
+            return self._attr_ids[key]
+
+    def _dumps(self, text, runs):
+        runs = [(self._attr_id(attr), length) for attr, length in runs]
+        return marshal.dumps((text, runs))
+
+    def _offsets(self, position):
+        size = self._record.size
+        return self._record.unpack(self._index.read(position * size, size))
+
+    def append(self, text, runs):
+        start = self._spool.append(self._dumps(text, runs))
+        self._index.append(self._record.pack(start, self._spool.size))
+
+    def replace(self, position, text, runs):
+        """Replaces the line at position."""
+        data = self._dumps(text, runs)
+        start, end = self._offsets(position)
+        if end == self._spool.size:
+            # the last line in the spool file, as when extending the last
+            # line, which can grow where it is
+            self._spool.truncate(start)
+            self._spool.append(data)
+        elif len(data) <= end - start:
+            self._spool.write(start, data)
+            self.unused += end - start - len(data)
+        else:
+            self.unused += end - start
+            start = self._spool.append(data)
+        self._index.write(position * self._record.size,
+                          self._record.pack(start, start + len(data)))
+        if self.unused > max(self.compact_size, self._spool.size // 2):
+            self.compact()
+
+    def compact(self):
+        """Copies the lines to a new spool file, leaving out the bytes no
+        line is in."""
+        spool = _AppendFile(tempfile.TemporaryFile(dir=self._dir))
+        index = []
+        for position in xrange(len(self)):
+            start, end = self._offsets(position)
+            start = spool.append(self._spool.read(start, end - start))
+            index.append(self._record.pack(start, spool.size))
+        self._spool.close()
+        self._spool = spool
+        self._index.truncate()
+        self._index.append(''.join(index))
+        self.unused = 0
+
+    def __getitem__(self, position):
+        start, end = self._offsets(position)
+        text, runs = marshal.loads(self._spool.read(start, end - start))
+        return text, [(self._attrs[attr], length) for attr, length in runs]
+
+    def clear(self):
+        """Drops all of the lines."""
+        self._spool.truncate()
+        self._index.truncate()
+        self.unused = 0
+
+    def close(self):
+        """Removes the spool files."""
+        self._spool.close()
+        self._index.close()
+
+
+class SpooledListWalker(urwid.ListWalker):
+    """A list walker for any number of lines of text, which keeps them in a
+    LineSpool rather than in memory.
+
+    Lines are added with append_markup(). Widgets are only made for the
+    lines the ListBox asks for, and the last cache_size of them are kept. The
+    positions are the line numbers."""
+    cache_size = 200
+
+    def __init__(self, dir=None):
+        self._lines = LineSpool(dir)
+        self._cache = {}
+        self._cache_order = collections.deque()
+        self.focus = 0
+
+    def __hash__(self): return id(self)
+
+    def __len__(self):
+        return len(self._lines)
+
+    @property
+    def start(self):
+        return 0
+
+    @property
+    def end(self):
+        return len(self)
+
+    def append_markup(self, markup, focus=False):
+        """Adds the lines of markup, which should not end with a newline. If
+        focus is true, the last line gets the focus."""
+        text, runs = urwid.util.decompose_tagmarkup(markup)
+        for line, lineruns in _split_lines(text, runs):
+            self._lines.append(line, lineruns)
+        if focus:
+            self.focus = len(self) - 1
+        self._modified()
+
+    def extend_markup(self, markup, focus=False):
+        """Adds the lines of markup as append_markup() does, except that the
+        first of them continues the last line."""
+        text, runs = urwid.util.decompose_tagmarkup(markup)
+        lines = _split_lines(text, runs)
+        if len(self):
+            last = len(self) - 1
+            self._lines.replace(last, *_join_lines(self._lines[last],
+                                                   next(lines)))
+            self._cache.pop(last, None)
+        for line, lineruns in lines:
+            self._lines.append(line, lineruns)
+        if focus:
+            self.focus = len(self) - 1
+        self._modified()
+
+    def replace_markup(self, position, markup):
+        """Replaces the lines from position on with the lines of markup,
+        which should not end with a newline."""
+        text, runs = urwid.util.decompose_tagmarkup(markup)
+        for line, lineruns in _split_lines(text, runs):
+            if position >= len(self):
+                break
+            self._lines.replace(position, line, lineruns)
+            # made again when next asked for
+            self._cache.pop(position, None)
+            position += 1
+        self._modified()
+
+    def clear(self):
+        """Drops all of the lines."""
+        self._lines.clear()
+        self._cache.clear()
+        self._cache_order.clear()
+        self.focus = 0
+        self._modified()
+
+    def close(self):
+        """Removes the spool files."""
+        self._lines.close()
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError('position %r not in the walker' % position)
+        try:
+            return self._cache[position]
+        except KeyError:
+            pass
+        text, runs = self._lines[position]
+        widget = urwid.Text(text)
+        widget._attrib = runs
+        self._cache[position] = widget
+        self._cache_order.append(position)
+        if len(self._cache_order) > self.cache_size:
+            self._cache.pop(self._cache_order.popleft(), None)
+        return widget
+
+    def get_focus(self):
+        """Return (focus widget, focus position)."""
+        if not len(self):
+            return None, None
+        self.focus = min(max(self.focus, 0), len(self) - 1)
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        """Set focus position. Positions past either end are moved to the
+        nearest line."""
+        self.focus = position
+        self._modified()
+
+    def set_focus_last(self):
+        self.set_focus(len(self) - 1)
+
+    def get_next(self, start_from):
+        """Return (widget after start_from, position after start_from)."""
+        pos = start_from + 1
+        if pos >= len(self): return None, None
+        return self[pos], pos
+
+    def get_prev(self, start_from):
+        """Return (widget before start_from, position before start_from)."""
+        pos = min(start_from - 1, len(self) - 1)
+        if pos < 0: return None, None
+        return self[pos], pos
+
+
+def _grouped(n):
+    """Formats n with commas between each three digits, as '{0:,}' does
+    from Python 2.7 on."""
+    digits = str(n)
+    groups = []
+    while digits:
+        groups.insert(0, digits[-3:])
+        digits = digits[:-3]
+    return ','.join(groups)
+
+
+def _lines_text(lines):
+    """Returns a Text widget showing lines, a list of (text, runs)."""
+    texts = []
+    attrib = []
+    for text, runs in lines:
+        texts.append(text)
+        attrib.extend(_covering(text, runs))
+        attrib.append((None, 1))
+    widget = urwid.Text(u'\n'.join(texts))
+    widget._attrib = attrib[:-1]
+    return widget
+
+
+class FoldedText(urwid.WidgetWrap):
+    """Text of any length, of which only the first and last `context` lines
+    are shown, with a line between them telling how many are hidden.
+
+    Text of up to `threshold` lines is shown whole. Past that, the lines
+    falling between the first and last ones are written to a LineSpool as
+    they come, so that wrapping and laying out the text costs the same
+    however long it is. Enter, or a click on the summary line, expands the
+    fold by reading `step` more of the hidden lines back; '-' folds them
+    away again.
+
+    Lines can be added with extend(), as a stream brings them."""
+    context = 10
+    threshold = 100
+    step = 1000
+    summary_attr = urwid.AttrSpec('dark gray', 'default')
+
+    def __init__(self, markup=u'', context=None, threshold=None):
+        if context is not None:
+            self.context = context
+        if threshold is not None:
+            self.threshold = threshold
+        self._spool = None
+        urwid.WidgetWrap.__init__(self, urwid.Text(u''))
+        self.set_text(markup)
+
+    def set_text(self, markup):
+        """Replaces the text with markup, folding it again."""
+        self._head = []
+        self._tail = collections.deque()
+        self.close()
+        self._expanded = []
+        self.extend(markup)
+
+    def close(self):
+        """Removes the spool file of the hidden lines, if the text was
+        folded; they can no longer be expanded."""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def extend(self, markup):
+        """Adds markup, continuing the last line."""
+        self.extend_text(*urwid.util.decompose_tagmarkup(markup))
+
+    def extend_text(self, text, runs):
+        """Adds text with its run length encoded attributes, as
+        Text.get_text() returns them, continuing the last line."""
+        lines = _split_lines(text, runs)
+        last = self._tail or self._head
+        if last:
+            last[-1] = _join_lines(last[-1], next(lines))
+        elif self.folded:
+            # with no context shown, the last line is in the fold
+            position = len(self._spool) - 1
+            line = _join_lines(self._spool[position], next(lines))
+            self._spool.replace(position, *line)
+            if position < len(self._expanded):
+                self._expanded[position] = line
+        for line in lines:
+            self._add_line(line)
+        self._update()
+
+    def _add_line(self, line):
+        if self._spool is None:
+            self._head.append(line)
+            if len(self._head) > self.threshold:
+                self._fold()
+            return
+        self._tail.append(line)
+        if len(self._tail) > self.context:
+            self._spool.append(*self._tail.popleft())
+
+    def _fold(self):
+        lines = self._head
+        # not lines[-context:], which is all of them for a context of 0
+        n = len(lines) - self.context
+        self._spool = LineSpool()
+        self._head = lines[:self.context]
+        for line in lines[self.context:n]:
+            self._spool.append(*line)
+        self._tail = collections.deque(lines[n:])
+
+    @property
+    def folded(self):
+        """Whether the text is long enough to be folded."""
+        return self._spool is not None
+
+    @property
+    def hidden(self):
+        """The number of lines hidden in the fold."""
+        if self._spool is None:
+            return 0
+        return len(self._spool) - len(self._expanded)
+
+    def expand(self, count=None):
+        """Shows count more of the hidden lines, by default `step`."""
+        shown = len(self._expanded)
+        upto = min(shown + (count or self.step), shown + self.hidden)
+        self._expanded.extend(self._spool[position]
+                              for position in xrange(shown, upto))
+        self._update()
+
+    def collapse(self):
+        """Hides the lines expanded again."""
+        self._expanded = []
+        self._update()
+
+    def _update(self):
+        self._parts = [_lines_text(self._head + self._expanded)]
+        hidden = self.hidden
+        if hidden:
+            ellipsis = u'\u2026' if urwid.supports_unicode() else u'...'
+            self._parts.append(urwid.Text((self.summary_attr,
+                u'{0} {1} line{2} hidden (enter shows {3})'.format(
+                    ellipsis, _grouped(hidden), 's' if hidden > 1 else '',
+                    _grouped(min(hidden, self.step))))))
+        if self._tail:
+            self._parts.append(_lines_text(self._tail))
+        if len(self._parts) == 1:
+            self._w = self._parts[0]
+        else:
+            self._w = urwid.Pile(self._parts)
+
+    def selectable(self):
+        return self.folded
+
+    def keypress(self, size, key):
+        if key == 'enter' and self.hidden:
+            self.expand()
+        elif key == '-' and self._expanded:
+            self.collapse()
+        else:
+            return key
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        if not (self.hidden and event == 'mouse press' and button == 1):
+            return False
+        if row != self._parts[0].rows(size):
+            return False
+        self.expand()
+        return True
@@ -0,0 +1,104 @@
+"""Timing of the frontend's startup, phase by phase, for --profile-startup,
+and the input taken while it goes on.
+
+The first screen has a budget: the time from the process starting to the
+screen being drawn, which the report holds the phases up to it against."""
+
+import os, sys, time
+
+# the keys the prompt can take before the kernel client is loaded, as they
+# only edit the text typed; others may need the kernel, or the main loop
+_editing_keys = frozenset(['backspace', 'delete', 'left', 'right',
+                           'home', 'end'])
+
+
+def process_start_time():
+    """Returns the wall clock time this process started at, to within a
+    clock tick, or None if /proc cannot tell."""
+    try:
+        with open('/proc/self/stat') as f:
+            # the fields after the command name, which is in parentheses
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        now = time.time()
+        # both in seconds since boot
+        started = int(fields[19]) / float(os.sysconf('SC_CLK_TCK'))
+        return now - (uptime - started)
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer(object):
+    """Records how long each phase of startup takes.
+
+    Each call to phase(name) ends a phase begun by the previous call, or by
+    the timer being made. mark_first_screen() tells which phase ended with
+    the first screen drawn."""
+    # seconds from the process starting to the first screen
+    budget = 0.35
+
+    def __init__(self, budget=None):
+        if budget is not None:
+            self.budget = budget
+        self.start = self._last = time.time()
+        self.process_start = process_start_time()
+        self.phases = []
+        self.first_screen = None
+
+    def phase(self, name):
+        """Ends the current phase, calling it name."""
+        now = time.time()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def mark_first_screen(self):
+        self.first_screen = self._last
+
+    def report(self, out=None):
+        """Writes the phases and their times to out (by default stderr)."""
+        out = out or sys.stderr
+        print >> out, 'Startup, by phase:'
+        start = self.start
+        if self.process_start is not None and self.process_start < start:
+            start = self.process_start
+            print >> out, '  %-26s %8.1f ms' % (
+                'python and the first imports',
+                (self.start - start) * 1e3)
+        for name, seconds in self.phases:
+            print >> out, '  %-26s %8.1f ms' % (name, seconds * 1e3)
+        if self.first_screen is not None:
+            took = self.first_screen - start
+            print >> out, 'First screen after %.1f ms, budget %.1f ms%s' % (
+                took * 1e3, self.budget * 1e3,
+                ' (OVER BUDGET)' if took > self.budget else '')
+
+
+def take_early_input(screen, widget, done, wait=0.02):
+    """Passes the keys typed to widget, drawing it on screen after them,
+    until done() returns true; for while the kernel client is loaded.
+
+    Only text and the keys that edit it are taken. The first other key, such
+    as enter, is held back with all those after it, and the keys held are
+    returned, for the main loop to handle once it has been made."""
+    from urwid import is_mouse_event
+    held = []
+    size = screen.get_cols_rows()
+    screen.set_input_timeouts(max_wait=wait)
+    try:
+        while not done():
+            keys = screen.get_input()
+            if not keys:
+                continue
+            for key in keys:
+                if key == 'window resize':
+                    size = screen.get_cols_rows()
+                elif held or is_mouse_event(key) or not (
+                        len(key) == 1 or key in _editing_keys):
+                    held.append(key)
+                else:
+                    widget.keypress(size, key)
+            screen.draw_screen(size, widget.render(size, focus=True))
+    finally:
+        screen.set_input_timeouts(max_wait=None)
+    return held
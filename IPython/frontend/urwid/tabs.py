@@ -0,0 +1,196 @@
+"""Several kernels at once, each in a tab of its own, on one event loop.
+
+A TabbedFrontend shows a bar naming the tabs above the current one. Each Tab
+has its own InterpreterWidget, pager, kernel and IpyInterpreter, but the
+sockets of all of the kernels are polled by one TabbedEventLoop, which hands
+each message to its tab. A tab in the background is not rendered, and its
+messages are kept until it is shown (see TabbedEventLoop); the bar marks it
+with a * meanwhile.
+
+Keys: ctrl t opens a tab with a new kernel, ctrl w closes the current tab
+and kills its kernel, meta left and meta right go to the tab before or
+after, and meta 1 to meta 9 go to a tab by its number. f12 shows or hides
+a line of latencies (see latency.py) at the bottom."""
+
+import urwid
+
+from interpreterwidget import InterpreterWidget
+from latency import LatencyLine
+from pager import PagedWidget
+
+
+class Tab(object):
+    """A kernel, and the widgets and interpreter talking to it."""
+    def __init__(self, frontend, spool=False):
+        self.frontend = frontend
+        self.widget = InterpreterWidget(spool=spool)
+        self.pager = PagedWidget(self.widget)
+        self.kernel = None
+        self.interp = None
+        self.shown = False
+        # messages kept while in the background, for TabbedEventLoop
+        self.pending = []
+        # whether anything came while in the background
+        self.unseen = False
+
+    def mark_unseen(self):
+        if not self.unseen:
+            self.unseen = True
+            self.frontend.update_bar()
+
+
+class TabbedFrontend(urwid.WidgetWrap):
+    """Tabs, each talking to a kernel of its own. Tabs can be opened before
+    connect() is called, to draw them while the kernels start."""
+    current_attr = urwid.AttrSpec('default,standout', 'default')
+
+    def __init__(self, spool=False, latency=None):
+        self.spool = spool
+        # a latency.LatencyMonitor, to attach to each kernel
+        self.latency = latency
+        self._latency_line = None
+        self.tabs = []
+        self.current = None
+        self.loop = None
+        self.screen = None
+        self.highlighter = None
+        self._bar = urwid.Text(u'', wrap='clip')
+        self._frame = urwid.Frame(urwid.SolidFill(u' '), header=self._bar)
+        urwid.WidgetWrap.__init__(self, self._frame)
+        self._keys = {'ctrl t': self.new_tab,
+                      'ctrl w': lambda: self.close_tab(self.current),
+                      'meta left': lambda: self._step(-1),
+                      'meta right': lambda: self._step(1),
+                      'f12': self.toggle_latency}
+        for n in range(1, 10):
+            self._keys['meta %d' % n] = lambda n=n: self._go_to(n - 1)
+
+    def connect(self, loop, screen, highlighter=None):
+        """Starts a kernel for each tab, whose messages loop (a
+        TabbedEventLoop) will handle."""
+        self.loop = loop
+        self.screen = screen
+        self.highlighter = highlighter
+        for tab in self.tabs:
+            self._start(tab)
+
+    def _start(self, tab):
+        from eventloop import IpyInterpreter
+        from zmqeventloop import PollerKernelManager
+        from completion import Completer
+        kern = PollerKernelManager()
+        kern.rcvd_queue = self.loop.route(tab)
+        kern.event_loop = self.loop
+        kern.start_kernel()
+        if self.latency is not None:
+            self.latency.attach(kern)
+        tab.interp = IpyInterpreter(tab.widget, self.screen, kern,
+                                    pager=tab.pager,
+                                    highlighter=self.highlighter)
+        kern.start_channels()
+        # agree on how messages are packed
+        kern.xreq_channel.connect()
+        tab.interp.completer = Completer(tab.widget, kern, self.loop)
+        tab.kernel = kern
+
+    def toggle_latency(self):
+        """Shows or hides the line of latencies, if there is a monitor."""
+        if self.latency is None:
+            return
+        if self._frame.footer is None:
+            if self._latency_line is None:
+                self._latency_line = LatencyLine(self.latency)
+            self._latency_line.start(self.loop)
+            self._frame.footer = self._latency_line
+        else:
+            self._latency_line.stop()
+            self._frame.footer = None
+
+    def _stop(self, tab):
+        if tab.interp is not None:
+            tab.interp.completer.cancel()
+            tab.interp = None
+        if tab.kernel is not None:
+            try:
+                tab.kernel.stop_channels()
+                tab.kernel.kill_kernel()
+            except RuntimeError:
+                pass
+            tab.kernel = None
+
+    def new_tab(self):
+        """Opens a tab, with a new kernel if connected, and shows it."""
+        tab = Tab(self, self.spool)
+        self.tabs.append(tab)
+        if self.loop is not None:
+            self._start(tab)
+        self.show(tab)
+        return tab
+
+    def close_tab(self, tab):
+        """Closes tab, killing its kernel. Closing the last tab ends the
+        main loop."""
+        self._stop(tab)
+        i = self.tabs.index(tab)
+        del self.tabs[i]
+        if not self.tabs:
+            raise urwid.ExitMainLoop()
+        if tab is self.current:
+            self.current = None
+            self.show(self.tabs[min(i, len(self.tabs) - 1)])
+        else:
+            self.update_bar()
+
+    def close(self):
+        """Kills all of the kernels."""
+        for tab in self.tabs:
+            self._stop(tab)
+
+    def show(self, tab):
+        """Brings tab to the front, handling what came for it meanwhile."""
+        if self.current is not None:
+            self.current.shown = False
+        self.current = tab
+        tab.shown = True
+        tab.unseen = False
+        if tab.pending and self.loop is not None:
+            self.loop.catch_up(tab)
+        self._frame.body = tab.pager
+        self.update_bar()
+
+    def _step(self, step):
+        i = self.tabs.index(self.current)
+        self.show(self.tabs[(i + step) % len(self.tabs)])
+
+    def _go_to(self, i):
+        if i < len(self.tabs):
+            self.show(self.tabs[i])
+
+    def update_bar(self):
+        markup = []
+        for i, tab in enumerate(self.tabs):
+            label = u' %d%s ' % (i + 1, u'*' if tab.unseen else u' ')
+            if tab is self.current:
+                markup.append((self.current_attr, label))
+            else:
+                markup.append(label)
+        markup.append(u'  ctrl t: new tab  ctrl w: close  meta 1-9: go to')
+        self._bar.set_text(markup)
+
+    def filter_input(self, keys, raw):
+        """The input_filter for the MainLoop: takes the keys for the tabs,
+        and lets the current tab's interpreter filter the rest."""
+        rest = []
+        for key in keys:
+            if key in self._keys:
+                self._keys[key]()
+            else:
+                rest.append(key)
+        if self.current.interp is not None:
+            rest = self.current.interp.filter_input(rest, raw)
+        return rest
+
+    def handle_input(self, key):
+        """The unhandled_input for the MainLoop."""
+        if self.current.interp is not None:
+            return self.current.interp.handle_input(key)
@@ -0,0 +1,135 @@
+"""Tests for the conversion of ANSI escapes to urwid markup."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+from ansimarkup import AnsiMarkup, ansi_markup
+
+
+def colors(markup):
+    """Returns markup with each AttrSpec as (foreground, background)."""
+    return [(piece[0].foreground, piece[0].background, piece[1])
+            if isinstance(piece, tuple) else piece for piece in markup]
+
+
+def test_plain():
+    nt.assert_equal(ansi_markup(u'no escapes'), [u'no escapes'])
+    nt.assert_equal(ansi_markup(u''), [])
+
+
+def test_reset():
+    nt.assert_equal(colors(ansi_markup(u'\x1b[31mred\x1b[0m plain')),
+                    [('dark red', 'default', u'red'), u' plain'])
+    nt.assert_equal(colors(ansi_markup(u'\x1b[31mred\x1b[m plain')),
+                    [('dark red', 'default', u'red'), u' plain'])
+
+
+def test_styles():
+    nt.assert_equal(colors(ansi_markup(u'\x1b[1mbold\x1b[4mboth\x1b[22m'
+                                       u'under\x1b[24mplain')),
+                    [('default,bold', 'default', u'bold'),
+                     ('default,bold,underline', 'default', u'both'),
+                     ('default,underline', 'default', u'under'),
+                     u'plain'])
+
+
+def test_16_colors():
+    nt.assert_equal(colors(ansi_markup(u'\x1b[32;44mx\x1b[39my\x1b[49mz')),
+                    [('dark green', 'dark blue', u'x'),
+                     ('default', 'dark blue', u'y'), u'z'])
+    # bold shows in the bright color
+    nt.assert_equal(colors(ansi_markup(u'\x1b[1;32mx\x1b[0;92my')),
+                    [('light green,bold', 'default', u'x'),
+                     ('light green', 'default', u'y')])
+
+
+def test_256_colors():
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;5;196;48;5;21mx')),
+                    [('#f00', '#00f', u'x')])
+
+
+def test_out_of_range():
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;5;300mx')), [u'x'])
+    # what follows the color is still read
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;5;300;1mx')),
+                    [('default,bold', 'default', u'x')])
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;2;300;0;0mx')), [u'x'])
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;5mx')), [u'x'])
+
+
+def test_truecolor():
+    # the parameters of the color are not read as codes of their own
+    nt.assert_equal(colors(ansi_markup(u'\x1b[38;2;30;144;255mx')),
+                    [('#08f', 'default', u'x')])
+    nt.assert_equal(colors(ansi_markup(u'\x1b[48;2;0;0;0;4mx')),
+                    [('default,underline', 'h0', u'x')])
+
+
+def joined(pieces):
+    """Returns the colors() of markup with the neighbouring pieces of the
+    same colors joined up."""
+    out = []
+    for piece in pieces:
+        if not isinstance(piece, tuple):
+            piece = (None, None, piece)
+        if out and out[-1][:2] == piece[:2]:
+            out[-1] = piece[:2] + (out[-1][2] + piece[2],)
+        else:
+            out.append(piece)
+    return [piece[2] if piece[0] is None else piece for piece in out]
+
+
+def test_split_escapes():
+    text = u'a\x1b[1;31mred\x1b[0m b\x1b[38;5;21mblue\x1b[0m'
+    whole = colors(ansi_markup(text))
+    for size in range(1, len(text)):
+        converter = AnsiMarkup()
+        markup = []
+        for start in range(0, len(text), size):
+            markup.extend(converter.feed(text[start:start + size]))
+        markup.extend(converter.flush())
+        nt.assert_equal(joined(colors(markup)), whole)
+
+
+def test_state_kept_between_feeds():
+    converter = AnsiMarkup()
+    nt.assert_equal(converter.feed(u'\x1b[31mred'),
+                    [(converter.attr(), u'red')])
+    nt.assert_equal(colors(converter.feed(u' still red\x1b[')),
+                    [('dark red', 'default', u' still red')])
+    nt.assert_equal(colors(converter.feed(u'0mplain')), [u'plain'])
+    nt.assert_equal(converter.feed(u'\x1b'), [])
+    nt.assert_equal(converter.flush(), [u'^['])
+
+
+def test_other_escapes_dropped():
+    nt.assert_equal(ansi_markup(u'a\x1b[2Kb\x1b[?25lc'), [u'abc'])
+    nt.assert_equal(ansi_markup(u'a\x1b[>0cb\x1b[!pc'), [u'abc'])
+    # a title, ended by BEL or by ST
+    nt.assert_equal(ansi_markup(u'a\x1b]0;title\x07b\x1b]2;t\x1b\\c'),
+                    [u'abc'])
+    # a string another escape cuts short
+    nt.assert_equal(colors(ansi_markup(u'a\x1b]0;title\x1b[31mb')),
+                    [u'a', ('dark red', 'default', u'b')])
+    nt.assert_equal(ansi_markup(u'a\x1bPq#0\x1b\\b\x1b_x\x1b\\c'), [u'abc'])
+    # the character sets, saving the cursor and the keypad mode
+    nt.assert_equal(ansi_markup(u'\x1b(Ba\x1b)0b\x1b7c\x1b=d\x1b8'),
+                    [u'abcd'])
+
+
+def test_split_other_escapes():
+    text = u'a\x1b]0;title\x07b\x1b]2;t\x1b\\c\x1b(Bd\x1b[31me'
+    whole = colors(ansi_markup(text))
+    nt.assert_equal(joined(whole), [u'abcd', ('dark red', 'default', u'e')])
+    for size in range(1, len(text)):
+        converter = AnsiMarkup()
+        markup = []
+        for start in range(0, len(text), size):
+            markup.extend(converter.feed(text[start:start + size]))
+        markup.extend(converter.flush())
+        nt.assert_equal(joined(colors(markup)), whole)
@@ -0,0 +1,253 @@
+"""Tests for tab completion in the urwid frontend."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+from IPython.zmq.session import Message
+from completion import Completer, common_prefix
+from pywidget import PythonEdit, CompletionGrid
+
+
+class Loop(object):
+    """The alarms of an urwid event loop, on a clock moved by hand."""
+    def __init__(self):
+        self.time = 0.0
+        self.alarms = []
+
+    def alarm(self, delay, callback):
+        handle = [self.time + delay, callback]
+        self.alarms.append(handle)
+        return handle
+
+    def remove_alarm(self, handle):
+        self.alarms.remove(handle)
+
+    def advance(self, seconds):
+        """Runs the alarms due by then, including any they set."""
+        end = self.time + seconds
+        while self.alarms and min(self.alarms)[0] <= end:
+            handle = min(self.alarms)
+            self.alarms.remove(handle)
+            self.time = handle[0]
+            handle[1]()
+        self.time = end
+
+
+class XReqChannel(object):
+    """Keeps the complete_requests, instead of sending them."""
+    def __init__(self):
+        self.requests = []
+
+    def complete(self, text, line, cursor_pos, block=None):
+        self.requests.append(text)
+        return 'request %d' % len(self.requests)
+
+
+class Frontend(object):
+    """The parts of an InterpreterWidget and a KernelManager that a
+    Completer uses."""
+    def __init__(self):
+        self.editbox = PythonEdit(multiline=True)
+        self.inputbox = self
+        self.completionbox = CompletionGrid()
+        self.xreq_channel = XReqChannel()
+
+
+def completer(delay=0.15):
+    frontend = Frontend()
+    loop = Loop()
+    return Completer(frontend, frontend, loop, delay), frontend, loop
+
+
+def reply(msg_id, matches):
+    return Message({'parent_header': {'msg_id': msg_id},
+                    'content': {'matches': matches, 'status': 'ok'}})
+
+
+def type_text(c, frontend, text):
+    frontend.editbox.insert_text(text)
+    c.filter_input(list(text))
+
+
+def test_common_prefix():
+    nt.assert_equal(common_prefix([u'abc', u'abd', u'ab']), u'ab')
+    nt.assert_equal(common_prefix([u'abc']), u'abc')
+    nt.assert_equal(common_prefix([]), u'')
+
+
+def test_tab_requests_and_completes():
+    c, frontend, loop = completer()
+    type_text(c, frontend, u'x = os.pa')
+    c.filter_input(['tab'])
+    loop.advance(0)
+    nt.assert_equal(frontend.xreq_channel.requests, [u'os.pa'])
+    c.complete_reply(reply('request 1', [u'os.path', u'os.pardir']))
+    # as much as all of them share is inserted
+    nt.assert_equal(frontend.editbox.edit_text, u'x = os.pa')
+    nt.assert_equal(frontend.completionbox.shown, [u'os.path', u'os.pardir'])
+
+
+def test_inserts_common_prefix():
+    c, frontend, loop = completer()
+    type_text(c, frontend, u'os.p')
+    c.filter_input(['tab'])
+    loop.advance(0)
+    c.complete_reply(reply('request 1', [u'os.path', u'os.pathsep']))
+    nt.assert_equal(frontend.editbox.edit_text, u'os.path')
+    nt.assert_equal(frontend.completionbox.shown, [u'os.path', u'os.pathsep'])
+
+
+def test_stale_replies_dropped():
+    c, frontend, loop = completer()
+    type_text(c, frontend, u'ab')
+    c.filter_input(['tab'])
+    loop.advance(0)
+    type_text(c, frontend, u'.c')
+    loop.advance(1)
+    # a '.' was typed, so the kernel is asked again
+    nt.assert_equal(frontend.xreq_channel.requests, [u'ab', u'ab.c'])
+    c.complete_reply(reply('request 1', [u'abs', u'abc']))
+    nt.assert_equal(frontend.completionbox.shown, [])
+    c.complete_reply(reply('request 2', [u'ab.cd']))
+    nt.assert_equal(frontend.completionbox.shown, [u'ab.cd'])
+    # once answered, a late reply to the same request changes nothing
+    c.complete_reply(reply('request 2', [u'ab.ce']))
+    nt.assert_equal(frontend.completionbox.shown, [u'ab.cd'])
+
+
+def test_debounced():
+    c, frontend, loop = completer(delay=0.15)
+    type_text(c, frontend, u'a')
+    c.filter_input(['tab'])
+    loop.advance(0)
+    c.complete_reply(reply('request 1', [u'abs', u'all', u'any']))
+    # keys typed quickly after a '.' ask the kernel once, once typing
+    # pauses
+    for key in u'.bcd':
+        type_text(c, frontend, key)
+        loop.advance(0.05)
+    nt.assert_equal(frontend.xreq_channel.requests, [u'a'])
+    loop.advance(0.15)
+    nt.assert_equal(frontend.xreq_channel.requests, [u'a', u'a.bcd'])
+
+
+def test_narrowed_from_cache():
+    c, frontend, loop = completer()
+    type_text(c, frontend, u'a')
+    c.filter_input(['tab'])
+    loop.advance(0)
+    c.complete_reply(reply('request 1', [u'abs', u'all', u'any']))
+    type_text(c, frontend, u'n')
+    loop.advance(1)
+    # no '.' added: narrowed at once, without asking the kernel
+    nt.assert_equal(frontend.xreq_channel.requests, [u'a'])
+    nt.assert_equal(frontend.completionbox.shown, [u'any'])
+    nt.assert_equal(c.cached(u'an'), [u'abs', u'all', u'any'])
+    nt.assert_equal(c.cached(u'a.b'), None)
+    nt.assert_equal(c.cached(u'b'), None)
+    c.invalidate()
+    nt.assert_equal(c.cached(u'an'), None)
+
+
+def test_cache_size():
+    c, frontend, loop = completer()
+    c.cache_size = 3
+    for i in range(5):
+        c._pending, c._pending_text = 'request', u'name%d.' % i
+        c.complete_reply(reply('request', [u'name%d.x' % i]))
+    nt.assert_equal([text for text, matches in c.cache],
+                    [u'name2.', u'name3.', u'name4.'])
+
+
+def test_escape_cancels():
+    c, frontend, loop = completer()
+    type_text(c, frontend, u'ab')
+    c.filter_input(['tab'])
+    nt.assert_equal(c.filter_input(['esc']), [])
+    loop.advance(1)
+    nt.assert_false(c.active)
+    nt.assert_equal(frontend.xreq_channel.requests, [])
+    nt.assert_equal(c.filter_input(['esc']), ['esc'])
+
+
+class CountingList(list):
+    """A list that counts the times it is iterated over, and keeps the
+    ranges sliced out of it."""
+    def __init__(self, items):
+        list.__init__(self, items)
+        self.iterated = 0
+        self.sliced = []
+
+    def __iter__(self):
+        self.iterated += 1
+        return list.__iter__(self)
+
+    def __getslice__(self, start, stop):
+        self.sliced.append((start, stop))
+        return list.__getslice__(self, start, stop)
+
+
+def grid_lines(grid, width):
+    return [line.rstrip() for line in grid.render((width,)).text]
+
+
+def test_grid_narrows():
+    matches = CountingList([u'alpha', u'alpine', u'beta', u'alps', u'al'])
+    grid = CompletionGrid()
+    grid.show(matches)
+    nt.assert_equal(grid.shown, matches)
+    grid.narrow(u'al')
+    nt.assert_equal(grid.shown, [u'alpha', u'alpine', u'alps', u'al'])
+    iterated = matches.iterated
+    # a longer prefix narrows what was shown
+    grid.narrow(u'alp')
+    nt.assert_equal(grid.shown, [u'alpha', u'alpine', u'alps'])
+    grid.narrow(u'alp')
+    nt.assert_equal(matches.iterated, iterated)
+    # a shorter one starts again from all of the matches
+    grid.narrow(u'b')
+    nt.assert_equal(grid.shown, [u'beta'])
+    nt.assert_equal(matches.iterated, iterated + 1)
+    grid.narrow(u'')
+    nt.assert_true(grid.shown is matches)
+    # the same list shown again keeps the prefix; another one drops it
+    grid.narrow(u'alpi')
+    grid.show(matches, u'alpi')
+    nt.assert_equal(grid.shown, [u'alpine'])
+    grid.show([u'gamma', u'alpine'])
+    nt.assert_equal(grid.shown, [u'gamma', u'alpine'])
+
+
+def test_grid_layout():
+    grid = CompletionGrid([u'a%d' % i for i in range(10)], maxrows=8)
+    # two characters and a space to a column
+    nt.assert_equal(grid.rows((12,)), 3)
+    nt.assert_equal(grid_lines(grid, 12), [u'a0 a1 a2 a3', u'a4 a5 a6 a7',
+                                           u'a8 a9'])
+    nt.assert_equal(grid.rows((6,)), 5)
+    nt.assert_equal(grid_lines(grid, 6)[-1], u'a8 a9')
+    # past maxrows, the last row tells how many are left out
+    grid.maxrows = 2
+    nt.assert_equal(grid_lines(grid, 12), [u'a0 a1 a2 a3', u'... 6 more'])
+    grid.narrow(u'a1')
+    nt.assert_equal(grid_lines(grid, 12), [u'a1'])
+    grid = CompletionGrid([u'longer', u'x'], cellwidth=4)
+    nt.assert_equal(grid_lines(grid, 12), [u'lon x'])
+
+
+def test_grid_renders_only_rows_shown():
+    matches = CountingList(u'name%06d' % i for i in xrange(100000))
+    grid = CompletionGrid(maxrows=3)
+    grid.show(matches)
+    nt.assert_true(grid.shown is matches)
+    nt.assert_equal(grid.rows((40,)), 3)
+    lines = grid_lines(grid, 40)
+    nt.assert_equal(lines[0], u'name000000 name000001 name000002')
+    nt.assert_equal(lines[2], u'... %d more' % (100000 - 6))
+    # only the two rows drawn were read
+    nt.assert_equal(matches.sliced, [(0, 3), (3, 6)])
@@ -0,0 +1,80 @@
+"""Tests for the batching of kernel messages in the event loop."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+from IPython.zmq.session import Session, Message
+from eventloop import merge_streams
+
+session = Session()
+request = session.msg(u'execute_request')
+other_request = session.msg(u'execute_request')
+
+
+def stream(data, name=u'stdout', parent=request):
+    return session.msg(u'stream', {u'name': name, u'data': data}, parent)
+
+
+def summary(msgs):
+    """Returns the type of each message, with the data of streams."""
+    return [(msg['msg_type'], msg['content'].get('data'))
+            for msg in msgs]
+
+
+def test_merges_adjacent():
+    msgs = [stream(u'a'), stream(u'b\n'), stream(u'c')]
+    merged = merge_streams(msgs)
+    nt.assert_equal(summary(merged), [(u'stream', u'ab\nc')])
+    nt.assert_equal(merged[0]['header'], msgs[0]['header'])
+    nt.assert_equal(merged[0]['parent_header'], msgs[0]['parent_header'])
+    # the messages given are left alone
+    nt.assert_equal(msgs[0]['content']['data'], u'a')
+
+
+def test_keeps_single():
+    msg = stream(u'a')
+    nt.assert_true(merge_streams([msg])[0] is msg)
+    nt.assert_equal(merge_streams([]), [])
+
+
+def test_not_across_other_messages():
+    pyout = session.msg(u'pyout', {u'data': u'1'}, request)
+    merged = merge_streams([stream(u'a'), stream(u'b'), pyout,
+                            stream(u'c'), stream(u'd')])
+    nt.assert_equal(summary(merged), [(u'stream', u'ab'), (u'pyout', u'1'),
+                                      (u'stream', u'cd')])
+
+
+def test_not_across_streams_or_parents():
+    merged = merge_streams([stream(u'a'), stream(u'b', name=u'stderr'),
+                            stream(u'c', name=u'stderr'),
+                            stream(u'd', name=u'stderr',
+                                   parent=other_request),
+                            stream(u'e')])
+    nt.assert_equal([(msg['content']['name'], msg['content']['data'])
+                     for msg in merged],
+                    [(u'stdout', u'a'), (u'stderr', u'bc'),
+                     (u'stderr', u'd'), (u'stdout', u'e')])
+    nt.assert_equal(merged[2]['parent_header']['msg_id'],
+                    other_request['header']['msg_id'])
+
+
+def test_keeps_order():
+    reply = session.msg(u'execute_reply', {u'status': u'ok'}, request)
+    status = session.msg(u'status', {u'execution_state': u'idle'}, request)
+    # one already wrapped is passed on as it is
+    wrapped = Message(stream(u'w'))
+    msgs = [status, stream(u'a'), wrapped, stream(u'b'), stream(u'c'),
+            reply]
+    merged = merge_streams(msgs)
+    nt.assert_equal(len(merged), 5)
+    nt.assert_true(merged[0] is status)
+    nt.assert_equal(merged[1]['content']['data'], u'a')
+    nt.assert_true(merged[2] is wrapped)
+    nt.assert_equal(merged[3]['content']['data'], u'bc')
+    nt.assert_true(merged[4] is reply)
@@ -0,0 +1,89 @@
+"""Tests for highlighting in a worker thread."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import select
+
+import nose.tools as nt
+import pygments.lexers
+import pygments.styles
+
+from highlighter import BackgroundHighlighter
+from urwidpygments import UrwidFormatter
+
+lexer = pygments.lexers.PythonLexer()
+
+
+class FileLoop(object):
+    """Stands in for an urwid event loop, keeping the files watched."""
+    def __init__(self):
+        self.watched = {}
+
+    def watch_file(self, fd, callback):
+        self.watched[fd] = callback
+        return fd
+
+    def remove_watch_file(self, handle):
+        return self.watched.pop(handle, None) is not None
+
+    def run_until(self, done, timeout=5):
+        """Calls back for the files that become readable, until done()."""
+        while not done():
+            ready = select.select(list(self.watched), [], [], timeout)[0]
+            nt.assert_true(ready, 'nothing came back')
+            for fd in ready:
+                self.watched[fd]()
+
+
+def highlighter(**kw):
+    loop = FileLoop()
+    return BackgroundHighlighter(UrwidFormatter(), loop, **kw), loop
+
+
+def test_highlight():
+    h, loop = highlighter()
+    text = u'def f(x):\n    return "%d" % x\n'
+    got = []
+    nt.assert_equal(h.highlight(text, lexer, got.append), None)
+    loop.run_until(lambda: got)
+    expected = list(h.formatter.formatgenerator(lexer.get_tokens(text)))
+    nt.assert_equal(got, [expected])
+    # highlighted again, it comes back at once
+    nt.assert_equal(h.highlight(text, lexer, got.append), expected)
+    nt.assert_true(h._jobs.empty())
+    nt.assert_equal(len(got), 1)
+    h.close()
+    nt.assert_equal(loop.watched, {})
+
+
+def test_least_recently_used_dropped():
+    h, loop = highlighter(cache_size=2)
+    got = []
+    texts = [u'a = 1\n', u'b = 2\n', u'c = 3\n']
+    for text in texts[:2]:
+        h.highlight(text, lexer, got.append)
+    loop.run_until(lambda: len(got) == 2)
+    # a is used again, so b goes to make room for c
+    nt.assert_not_equal(h.highlight(texts[0], lexer, got.append), None)
+    h.highlight(texts[2], lexer, got.append)
+    loop.run_until(lambda: len(got) == 3)
+    keys = [h.key(text, lexer) for text in texts]
+    nt.assert_equal(h._used, [keys[0], keys[2]])
+    nt.assert_equal(sorted(h.cache), sorted([keys[0], keys[2]]))
+    h.close()
+
+
+def test_key():
+    h, loop = highlighter()
+    # keyed on the text, the lexer and the style
+    key = h.key(u'x = 1\n', lexer)
+    nt.assert_equal(h.key('x = 1\n', lexer), key)
+    nt.assert_not_equal(h.key(u'x = 2\n', lexer), key)
+    nt.assert_not_equal(h.key(u'x = 1\n', pygments.lexers.RubyLexer()), key)
+    h.formatter.style = pygments.styles.get_style_by_name('emacs')
+    nt.assert_not_equal(h.key(u'x = 1\n', lexer), key)
+    h.close()
@@ -0,0 +1,125 @@
+"""Tests for incremental highlighting, against lexing the whole text."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import random
+import re
+
+import nose.tools as nt
+import pygments.lexers
+
+from incrementallexer import IncrementalHighlighter, supports, analyze
+from urwidpygments import UrwidFormatter
+
+SOURCE = u'''\
+def f(x, y=2):
+    """Add y to x.
+
+    And return it."""
+    s = 'a string with %d args' % 2  # a comment
+    return x + y * 0x1f
+
+class C(object):
+    t = """one
+    two"""
+'''
+
+# what the fuzz test inserts: mostly what opens and closes strings, comments
+# and brackets, which change how the lines after them lex
+FRAGMENTS = [u'"', u"'", u'"""', u"'''", u'\n', u'#', u'\\', u'(', u')',
+             u'x', u' ', u'def ', u'1.5', u'u"', u'r\'', u'\n    ',
+             u'  \n']
+
+
+def full(lexer, formatter, text):
+    """Returns the tokens and the attributes of text lexed whole."""
+    tokens = [(ttype, value) for pos, ttype, value
+              in lexer.get_tokens_unprocessed(text)]
+    attrib = [(attr, len(value)) for attr, value
+              in formatter.formatgenerator(tokens) if value]
+    return tokens, attrib
+
+
+def merged(attrib):
+    """Returns run length encoded attributes with neighbouring runs of the
+    same attribute merged."""
+    out = []
+    for attr, length in attrib:
+        if out and out[-1][0] == attr:
+            out[-1] = (attr, out[-1][1] + length)
+        else:
+            out.append((attr, length))
+    return out
+
+
+def check(highlighter, text):
+    attrib = highlighter.update(text)
+    tokens, full_attrib = full(highlighter.lexer, highlighter.formatter, text)
+    nt.assert_equal([token for line in highlighter.lines
+                     for token in line.tokens], tokens)
+    nt.assert_equal(merged(attrib), merged(full_attrib))
+
+
+def test_supports():
+    nt.assert_true(supports(pygments.lexers.get_lexer_by_name('python')))
+    nt.assert_false(supports(pygments.lexers.get_lexer_by_name('ruby')))
+
+
+def test_analyze():
+    nt.assert_equal(analyze(re.compile(r'[^\S\n]+')), (False, 0, (False, u'')))
+    nt.assert_equal(analyze(re.compile(r'\n')), (False, 0, (False, u'')))
+    nt.assert_equal(analyze(re.compile(r'(?<!\.)(def)\b'))[:2], (False, 1))
+    nt.assert_equal(analyze(re.compile(r'(def)(\s+)')),
+                    (True, 0, (False, u'def')))
+    nt.assert_equal(analyze(re.compile(r'^(\s*)("""(?:.|\n)*?""")', re.M)),
+                    (True, 0, (True, u'')))
+    nt.assert_true(analyze(re.compile(r'x\Z'))[0])
+    nt.assert_false(analyze(re.compile(r'x$', re.M))[0])
+    nt.assert_true(analyze(re.compile(r'x$'))[0])
+
+
+def test_docstring_after_blank_lines():
+    # The docstring rule is tried where a line of spaces starts, and reads
+    # on through the lines after it; a string opening there makes it match
+    # from before the changed line.
+    lexer = pygments.lexers.get_lexer_by_name('python')
+    for old, new in [(u'x\n  \n\n1 t"""wo\n',
+                      u'x\n  \n\n"""\n1 t"""wo\n'),
+                     (u'x = 1\n  \n    \ny = 2\n',
+                      u'x = 1\n  \n    \n"""y"""\n')]:
+        highlighter = IncrementalHighlighter(lexer, UrwidFormatter())
+        check(highlighter, old)
+        check(highlighter, new)
+        check(highlighter, old)
+
+
+def test_edits_match_full_lex():
+    lexer = pygments.lexers.get_lexer_by_name('python')
+    highlighter = IncrementalHighlighter(lexer, UrwidFormatter())
+    rand = random.Random(0)
+    text = SOURCE
+    check(highlighter, text)
+    for i in range(1500):
+        pos = rand.randint(0, len(text))
+        if text and rand.random() < 0.4:
+            text = text[:pos] + text[pos + rand.randint(1, 6):]
+        else:
+            text = text[:pos] + rand.choice(FRAGMENTS) + text[pos:]
+        if len(text) > 2000:
+            text = SOURCE
+        check(highlighter, text)
+
+
+def test_typing_match_full_lex():
+    # as typed, one character at a time, at the end and in the middle
+    lexer = pygments.lexers.get_lexer_by_name('python')
+    highlighter = IncrementalHighlighter(lexer, UrwidFormatter())
+    for i in range(len(SOURCE) + 1):
+        check(highlighter, SOURCE[:i])
+    middle = len(SOURCE) // 2
+    for i in range(len(SOURCE) + 1):
+        check(highlighter, SOURCE[:middle] + SOURCE[:i] + SOURCE[middle:])
@@ -0,0 +1,134 @@
+"""Tests for the latency histograms of the urwid frontend."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import json
+from StringIO import StringIO
+
+import nose.tools as nt
+
+from latency import RollingHistogram, LatencyMonitor, LatencyLine
+
+
+def test_percentiles():
+    h = RollingHistogram(1)
+    nt.assert_equal(h.percentile(50), None)
+    for value in range(1, 101):
+        h.add(value)
+    # each percentile is the upper end of its bucket, within sqrt(2)
+    for p in (10, 50, 90, 99):
+        nt.assert_true(p <= h.percentile(p) <= p * 2 ** 0.5,
+                       (p, h.percentile(p)))
+    nt.assert_equal(h.percentile(100), 100)
+    nt.assert_equal(h.max(), 100)
+    nt.assert_equal(h.last, 100)
+
+
+def test_below_resolution():
+    h = RollingHistogram(0.1)
+    for value in (0, 0.01, 0.05):
+        h.add(value)
+    nt.assert_equal(h.percentile(50), 0)
+    h.add(1e9)
+    # the top bucket has no upper end but the largest sample
+    nt.assert_equal(h.percentile(100), 1e9)
+
+
+def test_rolling():
+    h = RollingHistogram(1, size=10)
+    for i in range(10):
+        h.add(1000)
+    for i in range(10):
+        h.add(2)
+    # the slow samples have rolled out
+    nt.assert_equal(len(h), 10)
+    nt.assert_equal(h.total, 20)
+    nt.assert_equal(h.percentile(99), 2)
+    nt.assert_equal(h.counts[h._bucket(1000)], 0)
+    nt.assert_equal(h.counts[h._bucket(2)], 10)
+
+
+def test_summary():
+    h = RollingHistogram(1, size=3)
+    nt.assert_equal(h.summary(), {'count': 0, 'total': 0})
+    for value in (1, 3, 5, 7):
+        h.add(value)
+    summary = h.summary()
+    nt.assert_equal(summary['count'], 3)
+    nt.assert_equal(summary['total'], 4)
+    nt.assert_equal(summary['max'], 7)
+    nt.assert_equal(sum(summary['buckets'].values()), 3)
+    nt.assert_true(summary['p50'] <= summary['p90'] <= summary['p99'] <= 7)
+
+
+def request(msg_id, msg_type='execute_request'):
+    return {'msg_type': msg_type, 'header': {'msg_id': msg_id},
+            'parent_header': {}, 'content': {}}
+
+
+def reply(msg_id, msg_type):
+    return {'msg_type': msg_type, 'header': {'msg_id': 'r' + msg_id},
+            'parent_header': {'msg_id': msg_id}, 'content': {}}
+
+
+def test_monitor_round_trips():
+    m = LatencyMonitor()
+    m.sent(request('a'))
+    m.sent(request('b', 'complete_request'))
+    m.sent(request('c', 'history_request'))
+    m.received(reply('a', 'status'))
+    m.received(reply('a', 'stream'))
+    m.received(reply('a', 'pyout'))
+    m.received(reply('a', 'execute_reply'))
+    m.received(reply('b', 'complete_reply'))
+    m.received(reply('c', 'history_reply'))
+    # a second reply to the same request is not counted again
+    m.received(reply('a', 'execute_reply'))
+    nt.assert_equal(len(m.histograms['output']), 1)
+    nt.assert_equal(len(m.histograms['execute']), 1)
+    nt.assert_equal(len(m.histograms['complete']), 1)
+    nt.assert_equal(m._waiting, {})
+    nt.assert_equal(m._no_output, set())
+
+
+def test_monitor_forgets_unanswered():
+    m = LatencyMonitor()
+    m.max_waiting = 10
+    for i in range(100):
+        m.sent(request(str(i)))
+    nt.assert_equal(sorted(m._waiting, key=int),
+                    [str(i) for i in range(90, 100)])
+    nt.assert_true(len(m._sent_order) <= 2 * m.max_waiting)
+    nt.assert_true(len(m._no_output) <= m.max_waiting)
+    m.received(reply('5', 'execute_reply'))
+    m.received(reply('95', 'execute_reply'))
+    nt.assert_equal(len(m.histograms['execute']), 1)
+
+
+def test_dump():
+    m = LatencyMonitor()
+    m.add('queue', 3)
+    m.add('key', 12.5)
+    f = StringIO()
+    m.dump(f)
+    summary = json.loads(f.getvalue())
+    nt.assert_equal(sorted(summary), sorted(LatencyMonitor.names))
+    nt.assert_equal(summary['key']['max'], 12.5)
+    nt.assert_equal(summary['queue']['count'], 1)
+    nt.assert_equal(summary['beat'], {'count': 0, 'total': 0})
+
+
+def test_line():
+    m = LatencyMonitor()
+    line = LatencyLine(m)
+    line.update()
+    nt.assert_true(line.text.startswith(u'key -  out -'))
+    m.add('key', 12345)
+    m.add('queue', 4)
+    line.update()
+    nt.assert_true(line.text.startswith(u'key 12k/12k  out -'), line.text)
+    nt.assert_true(u'queue 4/4' in line.text, line.text)
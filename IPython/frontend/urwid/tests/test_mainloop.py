@@ -0,0 +1,98 @@
+"""Tests for the main loop that limits how often the screen is redrawn."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+import urwid
+
+from mainloop import ThrottledMainLoop
+
+
+class CountingScreen(object):
+    """A screen that keeps the text of what it draws."""
+    started = True
+
+    def __init__(self):
+        self.drawn = []
+
+    def get_cols_rows(self):
+        return (20, 3)
+
+    def get_input_descriptors(self):
+        return []
+
+    def draw_screen(self, size, canvas):
+        self.drawn.append(canvas.text[0].strip())
+
+
+class AlarmLoop(object):
+    """An event loop that only keeps the alarms set, for the test to ring."""
+    def __init__(self):
+        self.alarms = []
+
+    def alarm(self, seconds, callback):
+        handle = (seconds, callback)
+        self.alarms.append(handle)
+        return handle
+
+    def remove_alarm(self, handle):
+        self.alarms.remove(handle)
+
+    def ring(self):
+        seconds, callback = self.alarms.pop(0)
+        callback()
+
+
+def throttled(max_fps=1):
+    text = urwid.Text(u'start')
+    screen = CountingScreen()
+    loop = AlarmLoop()
+    mainloop = ThrottledMainLoop(urwid.Filler(text, 'top'), screen=screen,
+                                 event_loop=loop, max_fps=max_fps)
+    return mainloop, text, screen, loop
+
+
+def test_redraws_within_a_frame_drawn_once():
+    mainloop, text, screen, loop = throttled()
+    mainloop.entering_idle()
+    nt.assert_equal(screen.drawn, [u'start'])
+    # nothing changed, nothing to draw
+    mainloop.entering_idle()
+    nt.assert_equal(mainloop.frames_skipped, 0)
+    for i in range(5):
+        text.set_text(u'change %d' % i)
+        mainloop.entering_idle()
+    nt.assert_equal(mainloop.frames_drawn, 1)
+    nt.assert_equal(mainloop.frames_skipped, 5)
+    # one alarm for the next frame, which draws the last change
+    nt.assert_equal(len(loop.alarms), 1)
+    nt.assert_true(0 < loop.alarms[0][0] <= 1)
+    loop.ring()
+    nt.assert_equal(mainloop.frames_drawn, 2)
+    nt.assert_equal(screen.drawn, [u'start', u'change 4'])
+
+
+def test_input_drawn_at_once():
+    mainloop, text, screen, loop = throttled()
+    mainloop.entering_idle()
+    text.set_text(u'output')
+    mainloop.entering_idle()
+    nt.assert_equal(mainloop.frames_skipped, 1)
+    mainloop.process_input([])
+    mainloop.entering_idle()
+    nt.assert_equal(screen.drawn, [u'start', u'output'])
+    # the frame's alarm is no longer needed
+    nt.assert_equal(loop.alarms, [])
+
+
+def test_unthrottled():
+    mainloop, text, screen, loop = throttled(max_fps=None)
+    for i in range(3):
+        text.set_text(u'change %d' % i)
+        mainloop.entering_idle()
+    nt.assert_equal(mainloop.frames_drawn, 3)
+    nt.assert_equal(mainloop.frames_skipped, 0)
@@ -0,0 +1,148 @@
+"""Tests for the line indexing and search of the pager."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import tempfile
+
+import nose.tools as nt
+
+from pager import TextLines, IterLines, Pager, plain
+
+text = u''.join(u'line %d%s\n' % (n, u' ' * (n % 7)) for n in range(100))
+expected = text.split(u'\n')[:-1]
+
+
+def all_lines(lines):
+    found = []
+    while lines.line(len(found)) is not None:
+        found.append(lines.line(len(found)))
+    return found
+
+
+def test_lines_of_string():
+    for source in (text, text.encode('utf-8'), text.rstrip(u'\n')):
+        for chunk_size in (1, 5, 64, 1 << 16):
+            lines = TextLines(source)
+            lines.chunk_size = chunk_size
+            nt.assert_equal(all_lines(lines), expected)
+            nt.assert_true(lines.complete)
+            nt.assert_equal(lines.count, 100)
+
+
+def test_lines_of_file():
+    f = tempfile.TemporaryFile()
+    f.write(u'\xe9t\xe9\n\nend'.encode('utf-8'))
+    lines = TextLines(f)
+    lines.chunk_size = 3
+    nt.assert_equal(lines.line(2), u'end')
+    nt.assert_equal(lines.line(0), u'\xe9t\xe9')
+    nt.assert_equal(lines.line(1), u'')
+    nt.assert_equal(lines.line(3), None)
+    f.close()
+
+
+def test_lines_indexed_lazily():
+    lines = TextLines(text)
+    lines.chunk_size = 16
+    nt.assert_equal(lines.line(3), expected[3])
+    nt.assert_false(lines.complete)
+    nt.assert_true(lines.count < 10)
+    lines.index_all()
+    nt.assert_true(lines.complete)
+    nt.assert_equal(lines.count, 100)
+
+
+def test_lines_indexed_in_background():
+    lines = TextLines(text)
+    lines.chunk_size = 16
+    lines.start_indexing()
+    lines._thread.join()
+    nt.assert_true(lines.complete)
+    nt.assert_equal(lines.count, 100)
+    nt.assert_equal(lines.line(99), expected[99])
+
+
+def test_empty_lines():
+    nt.assert_equal(all_lines(TextLines(u'')), [u''])
+    nt.assert_equal(all_lines(TextLines(u'\n')), [u''])
+    nt.assert_equal(all_lines(TextLines(u'\n\n')), [u'', u''])
+
+
+def test_iter_lines():
+    lines = IterLines(iter([u'a\nb', u'c\n', '', 'd\n\ne']))
+    nt.assert_equal(lines.line(0), u'a')
+    nt.assert_false(lines.complete)
+    nt.assert_equal(all_lines(lines), [u'a', u'bc', u'd', u'', u'e'])
+    nt.assert_true(lines.complete)
+
+
+def test_plain():
+    nt.assert_equal(plain(u'\x1b[01;31mred\x1b[0m'), u'red')
+    nt.assert_equal(plain(u'b\x08bo\x08ol\x08ld\x08d'), u'bold')
+
+
+def pager(source):
+    p = Pager(source)
+    p.render((20, 11))
+    return p
+
+
+def test_search():
+    p = pager(text)
+    p.pattern = u'line 5'
+    p.search()
+    nt.assert_equal(p.top, 5)
+    p.search()
+    nt.assert_equal(p.top, 50)
+    p.search(backwards=True)
+    nt.assert_equal(p.top, 5)
+    p.search(backwards=True)
+    nt.assert_equal(p.top, 5)
+    nt.assert_equal(p.message, u'Pattern not found: line 5')
+
+
+def test_search_keys():
+    p = pager(text)
+    for key in u'/line 9':
+        p.keypress((20, 11), key)
+    p.keypress((20, 11), 'enter')
+    nt.assert_equal(p.top, 9)
+    p.keypress((20, 11), 'n')
+    nt.assert_equal(p.top, 90)
+    p.keypress((20, 11), 'N')
+    nt.assert_equal(p.top, 9)
+    # ? searches backwards, and then so does n
+    p.top = 95
+    for key in u'?line 8':
+        p.keypress((20, 11), key)
+    p.keypress((20, 11), 'enter')
+    nt.assert_equal(p.top, 89)
+    p.keypress((20, 11), 'n')
+    nt.assert_equal(p.top, 88)
+
+
+def test_search_case():
+    p = pager(u'Spam\nham\nHAM\n')
+    p.pattern = u'ham'
+    p.search()
+    nt.assert_equal(p.top, 1)
+    p.search()
+    nt.assert_equal(p.top, 2)
+    # capitals in the pattern make it match case
+    p.top = 0
+    p.pattern = u'HAM'
+    p.search()
+    nt.assert_equal(p.top, 2)
+
+
+def test_search_ignores_escapes():
+    p = pager([u'one\n', u'\x1b[1mt\x1b[0mwo\n', u't\x08two\n'])
+    p.pattern = u'two'
+    p.search()
+    nt.assert_equal(p.top, 1)
+    p.search()
+    nt.assert_equal(p.top, 2)
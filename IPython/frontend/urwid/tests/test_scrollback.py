@@ -0,0 +1,231 @@
+"""Tests for the scrollback list walkers and folded text."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import os
+
+import nose.tools as nt
+import urwid
+from nose import SkipTest
+
+from pywidget import OutputBox
+from scrollback import RingListWalker, SpooledListWalker, LineSpool, FoldedText
+
+
+def open_files():
+    if not os.path.isdir('/proc/self/fd'):
+        raise SkipTest('no /proc/self/fd to count open files in')
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_dropped_folds_are_closed():
+    box = OutputBox(remember=5)
+    before = open_files()
+    lines = u'\n'.join(u'line %d' % i for i in range(150))
+    # held on to, as the screen's canvases may hold the widgets drawn
+    folds = []
+    for i in range(50):
+        box.add_stdout(lines)
+        folds.append(box.list[box.list.end - 1])
+    nt.assert_true(all(isinstance(fold, FoldedText) for fold in folds))
+    nt.assert_equal([fold.folded for fold in folds], [False] * 45 + [True] * 5)
+    # two files for each fold kept
+    nt.assert_true(open_files() - before <= 2 * 5)
+    box.list.clear()
+    nt.assert_equal(open_files(), before)
+
+
+def texts(walker):
+    return [widget.text for widget in walker]
+
+
+def ring(capacity, count):
+    return RingListWalker(capacity, [urwid.Text(str(i))
+                                     for i in range(count)])
+
+
+def test_ring_drops_oldest():
+    walker = ring(3, 2)
+    nt.assert_equal(texts(walker), ['0', '1'])
+    walker.append(urwid.Text('2'))
+    walker.append(urwid.Text('3'))
+    nt.assert_equal(texts(walker), ['1', '2', '3'])
+    nt.assert_equal((walker.start, walker.end, len(walker)), (1, 4, 3))
+
+
+def test_ring_positions_after_wraparound():
+    walker = ring(3, 10)
+    nt.assert_equal(range(walker.start, walker.end), [7, 8, 9])
+    nt.assert_equal(walker[8].text, '8')
+    nt.assert_raises(IndexError, walker.__getitem__, 6)
+    nt.assert_raises(IndexError, walker.__getitem__, 10)
+    nt.assert_equal(walker.get_next(8)[1], 9)
+    nt.assert_equal(walker.get_next(9), (None, None))
+    # from a position dropped, the next is the oldest left
+    nt.assert_equal(walker.get_next(2)[1], 7)
+    nt.assert_equal(walker.get_prev(7), (None, None))
+    nt.assert_equal(walker.get_prev(20)[1], 9)
+    walker[8] = urwid.Text('eight')
+    nt.assert_equal(texts(walker), ['7', 'eight', '9'])
+
+
+def test_ring_focus():
+    walker = ring(3, 3)
+    nt.assert_equal(walker.get_focus()[1], 0)
+    walker.append(urwid.Text('3'))
+    # the focus was dropped: the oldest widget left gets it
+    nt.assert_equal(walker.get_focus()[1], 1)
+    walker.append(urwid.Text('4'), focus=True)
+    nt.assert_equal(walker.get_focus(), (walker[4], 4))
+    walker.set_focus(100)
+    nt.assert_equal(walker.get_focus()[1], 4)
+
+
+def test_ring_clear():
+    walker = ring(3, 5)
+    walker.clear()
+    nt.assert_equal(len(walker), 0)
+    nt.assert_equal(walker.get_focus(), (None, None))
+    walker.append(urwid.Text('5'))
+    # positions are not reused
+    nt.assert_equal((walker.start, walker.end), (5, 6))
+
+
+def test_spooled_reads_back_lines():
+    walker = SpooledListWalker()
+    walker.cache_size = 5
+    red = urwid.AttrSpec('dark red', 'default')
+    for i in range(100):
+        walker.append_markup([u'line ', (red, u'%d' % i)])
+    walker.append_markup(u'two\nlines', focus=True)
+    nt.assert_equal(len(walker), 102)
+    nt.assert_equal(walker.get_focus()[1], 101)
+    # more than are cached, so most are read back from the spool
+    for i in range(100):
+        text, attrib = walker[i].get_text()
+        nt.assert_equal(text, u'line %d' % i)
+        nt.assert_equal(attrib[1][1], len(str(i)))
+        nt.assert_equal(attrib[1][0].foreground, 'dark red')
+    nt.assert_true(len(walker._cache) <= 5)
+    nt.assert_equal(walker[100].text, u'two')
+    nt.assert_equal(walker[101].text, u'lines')
+    nt.assert_raises(IndexError, walker.__getitem__, 102)
+    walker.close()
+
+
+def test_spooled_extend_and_replace():
+    walker = SpooledListWalker()
+    walker.append_markup(u'one\ntw')
+    walker.extend_markup(u'o\nthree')
+    nt.assert_equal(texts(walker), [u'one', u'two', u'three'])
+    walker.replace_markup(1, u'TWO\nTHREE\nFOUR')
+    # lines past the end are not added
+    nt.assert_equal(texts(walker), [u'one', u'TWO', u'THREE'])
+    walker.clear()
+    nt.assert_equal(len(walker), 0)
+    nt.assert_equal(walker.get_focus(), (None, None))
+    walker.append_markup(u'again')
+    nt.assert_equal(texts(walker), [u'again'])
+    walker.close()
+
+
+def test_spooled_steps():
+    walker = SpooledListWalker()
+    walker.append_markup(u'a\nb\nc')
+    nt.assert_equal(walker.get_next(0)[1], 1)
+    nt.assert_equal(walker.get_next(2), (None, None))
+    nt.assert_equal(walker.get_prev(0), (None, None))
+    nt.assert_equal(walker.get_prev(10)[1], 2)
+    walker.close()
+
+
+def test_spool_size_bounded_by_extending():
+    walker = SpooledListWalker()
+    red = urwid.AttrSpec('dark red', 'default')
+    walker.append_markup(u'first\n')
+    for i in range(1000):
+        walker.extend_markup(u'x')
+    for i in range(1000):
+        walker.extend_markup((red, u'y'))
+    nt.assert_equal(texts(walker), [u'first', u'x' * 1000 + u'y' * 1000])
+    nt.assert_equal(walker._lines[1][1], [(None, 1000), (red, 1000)])
+    spool = walker._lines._spool
+    nt.assert_true(spool.size < 2200, spool.size)
+    walker.close()
+
+
+def test_spool_size_bounded_by_replacing():
+    lines = LineSpool()
+    lines.compact_size = 1000
+    for i in range(10):
+        lines.append(u'line %d' % i, [])
+    # lines too long to go where they were; the lines kept come to under
+    # 10k, and all of those written to 500k
+    for i in range(1000):
+        lines.replace(i % 9, u'x' * i, [(None, i)])
+        nt.assert_true(lines._spool.size < 20000, lines._spool.size)
+    for position in range(9):
+        i = 999 - (999 - position) % 9
+        nt.assert_equal(lines[position], (u'x' * i, [(None, i)]))
+    nt.assert_equal(lines[9], (u'line 9', []))
+    # and short enough to
+    size, unused = lines._spool.size, lines.unused
+    lines.replace(1, u'y', [])
+    nt.assert_equal(lines._spool.size, size)
+    nt.assert_true(lines.unused > unused)
+    # until the unused space is more than half
+    for position in range(9):
+        lines.replace(position, u'y', [])
+    nt.assert_true(lines._spool.size < 200, lines._spool.size)
+    nt.assert_equal([lines[position] for position in range(9)],
+                    [(u'y', [])] * 9)
+    lines.compact()
+    nt.assert_equal(lines.unused, 0)
+    nt.assert_equal(lines[9], (u'line 9', []))
+    lines.close()
+
+
+def fold_texts(fold):
+    return [part.text for part in fold._parts]
+
+
+def test_fold_without_context():
+    fold = FoldedText(u'\n'.join(u'line %d' % i for i in range(20)),
+                      context=0, threshold=10)
+    nt.assert_true(fold.folded)
+    nt.assert_equal(fold.hidden, 20)
+    nt.assert_equal(fold_texts(fold)[0], u'')
+    nt.assert_true(u' 20 lines hidden' in fold_texts(fold)[1])
+    nt.assert_equal(len(fold._parts), 2)
+    # lines streamed in continue the last one, in the fold
+    fold.extend(u' more\nline 20')
+    nt.assert_equal(fold.hidden, 21)
+    fold.expand()
+    nt.assert_equal(fold.hidden, 0)
+    nt.assert_equal(fold_texts(fold)[0].split(u'\n')[-2:],
+                    [u'line 19 more', u'line 20'])
+    fold.extend(u'!')
+    nt.assert_equal(fold_texts(fold)[0].split(u'\n')[-1], u'line 20!')
+    fold.close()
+
+
+def test_extended_output_folded_when_long():
+    box = OutputBox()
+    red = urwid.AttrSpec('dark red', 'default')
+    position = box.add_stdout(u'one\n')
+    nt.assert_true(box.extend(position, [(red, u'two'), u'\nthree']))
+    output = box.list[position]
+    nt.assert_false(isinstance(output, FoldedText))
+    nt.assert_equal(output.text, u'one\ntwo\nthree')
+    attrs = [attr for attr, length in output.get_text()[1] if attr]
+    nt.assert_equal([attr.foreground for attr in attrs], ['dark red'])
+    lines = u''.join(u'\nline %d' % i for i in range(FoldedText.threshold))
+    nt.assert_true(box.extend(position, lines))
+    output = box.list[position]
+    nt.assert_true(isinstance(output, FoldedText))
+    nt.assert_true(output.folded)
+    box.list.clear()
@@ -0,0 +1,53 @@
+"""Tests for the input taken while the frontend starts."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+import urwid
+
+from startup import take_early_input
+
+
+class ScriptedScreen(object):
+    """A screen whose input comes in the batches given."""
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.drawn = 0
+        self.max_wait = None
+
+    def get_cols_rows(self):
+        return (40, 5)
+
+    def set_input_timeouts(self, max_wait=None):
+        self.max_wait = max_wait
+
+    def get_input(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def draw_screen(self, size, canvas):
+        self.drawn += 1
+
+
+def test_early_input():
+    edit = urwid.Edit()
+    screen = ScriptedScreen([['a', 'b'], [], ['c', 'backspace', 'x'],
+                             ['window resize', 'enter', 'y'],
+                             [('mouse press', 1, 0, 0), 'z']])
+    held = take_early_input(screen, urwid.Filler(edit),
+                            lambda: not screen.batches)
+    # the text is edited until a key that is not for editing it comes
+    nt.assert_equal(edit.edit_text, u'abx')
+    nt.assert_equal(held, ['enter', 'y', ('mouse press', 1, 0, 0), 'z'])
+    nt.assert_equal(screen.drawn, 4)
+    nt.assert_equal(screen.max_wait, None)
+
+
+def test_early_input_done_at_once():
+    screen = ScriptedScreen([['a']])
+    held = take_early_input(screen, urwid.Filler(urwid.Edit()), lambda: True)
+    nt.assert_equal(held, [])
+    nt.assert_equal(screen.batches, [['a']])
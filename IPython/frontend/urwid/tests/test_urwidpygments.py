@@ -0,0 +1,122 @@
+"""Tests for the compiled pygments styles and their cache on disk."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+from pygments.style import Style
+from pygments.token import Keyword, Name, String
+
+import urwidpygments
+from urwidpygments import (StyleCache, UrwidFormatter, compile_style,
+                           persist_styles, style_id)
+
+
+class PlainStyle(Style):
+    styles = {Keyword: 'bold #ff0000', String: '#00ff00 bg:#000000'}
+
+
+def setup():
+    global ipython_dir, saved_env
+    ipython_dir = tempfile.mkdtemp()
+    saved_env = os.environ.get('IPYTHON_DIR')
+    os.environ['IPYTHON_DIR'] = ipython_dir
+
+
+def teardown():
+    if saved_env is None:
+        del os.environ['IPYTHON_DIR']
+    else:
+        os.environ['IPYTHON_DIR'] = saved_env
+    shutil.rmtree(ipython_dir)
+    urwidpygments._store = None
+
+
+def forget_tables():
+    urwidpygments._tables.clear()
+
+
+def stored(name):
+    with open(os.path.join(ipython_dir, 'urwid_styles', name)) as f:
+        return json.load(f)
+
+
+def test_stored_in_ipython_dir():
+    forget_tables()
+    store = StyleCache()
+    nt.assert_equal(store.path, os.path.join(ipython_dir, 'urwid_styles'))
+    table = compile_style(PlainStyle, 256, store=store)
+    nt.assert_equal(table[Keyword].foreground, 'h9,bold')
+    nt.assert_equal(table[String].background, 'h0')
+    name = '%s-256-1-1.json' % style_id(PlainStyle)
+    names = stored(name)
+    nt.assert_equal(names['Token.Keyword'], ['h9,bold', 'default'])
+    nt.assert_equal(names['Token.Literal.String'], ['h10', 'h0'])
+    # made once in a process, and shared
+    nt.assert_true(compile_style(PlainStyle, 256, store=store) is table)
+
+
+def test_read_from_store():
+    forget_tables()
+    store = StyleCache()
+    compile_style(PlainStyle, 16, store=store)
+    key = '%s-16-1-1' % style_id(PlainStyle)
+    names = store.get(key)
+    names['Token.Keyword'] = ['dark blue', 'default']
+    store.put(key, names)
+    forget_tables()
+    # the stored table is used rather than computed again
+    table = compile_style(PlainStyle, 16, store=store)
+    nt.assert_equal(table[Keyword].foreground, 'dark blue')
+
+
+def test_unreadable_file_computed_again():
+    forget_tables()
+    store = StyleCache()
+    key = '%s-88-1-1' % style_id(PlainStyle)
+    if not os.path.isdir(store.path):
+        os.makedirs(store.path)
+    with open(store._file(key), 'w') as f:
+        f.write('{not json')
+    nt.assert_equal(store.get(key), None)
+    table = compile_style(PlainStyle, 88, store=store)
+    nt.assert_true(table[Keyword].bold)
+    nt.assert_equal(store.get(key)['Token.Keyword'][1], 'default')
+
+
+def test_unwritable_store():
+    forget_tables()
+    path = os.path.join(ipython_dir, 'a file')
+    open(path, 'w').close()
+    store = StyleCache(path)
+    table = compile_style(PlainStyle, 256, usebold=False, store=store)
+    nt.assert_equal(table[Keyword].foreground, 'h9')
+
+
+def test_style_id_follows_definition():
+    class Changed(PlainStyle):
+        styles = dict(PlainStyle.styles, **{Name: '#0000ff'})
+    Changed.__name__ = PlainStyle.__name__
+    nt.assert_equal(style_id(PlainStyle), style_id(PlainStyle))
+    nt.assert_not_equal(style_id(Changed), style_id(PlainStyle))
+
+
+def test_formatter_uses_persisted_store():
+    forget_tables()
+    persist_styles()
+    formatter = UrwidFormatter(style=PlainStyle, usebg=False)
+    nt.assert_equal(formatter.store.path,
+                    os.path.join(ipython_dir, 'urwid_styles'))
+    name = '%s-256-1-0.json' % style_id(PlainStyle)
+    nt.assert_true(os.path.exists(os.path.join(ipython_dir, 'urwid_styles',
+                                               name)))
+    nt.assert_equal(list(formatter.formatgenerator([(Keyword, u'def')])),
+                    [(formatter.style_attrs[Keyword], u'def')])
@@ -0,0 +1,130 @@
+"""Tests for the routing of kernel messages to tabs in the event loop."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import nose.tools as nt
+
+from IPython.zmq.session import Session
+from zmqeventloop import TabbedEventLoop, TabBuffer
+
+
+class RecordingInterp(object):
+    """Keeps the type of each message it is given, with the data of
+    streams."""
+    def __init__(self):
+        self.handled = []
+
+    def stream(self, msg):
+        self.handled.append((msg.msg_type, msg.content.data))
+
+    def unknown_msg(self, msg):
+        self.handled.append((msg.msg_type, None))
+
+
+class CountingTab(object):
+    """Stands in for a tabs.Tab, counting the calls to mark_unseen."""
+    def __init__(self, shown=False):
+        self.interp = RecordingInterp()
+        self.shown = shown
+        self.pending = []
+        self.unseen = 0
+
+    def mark_unseen(self):
+        self.unseen += 1
+
+
+def stream(session, data, parent):
+    return session.msg(u'stream', {u'name': u'stdout', u'data': data},
+                       parent)
+
+
+def test_route():
+    loop = TabbedEventLoop()
+    tab = CountingTab()
+    queue = loop.route(tab)
+    nt.assert_true(isinstance(queue, TabBuffer))
+    msg = {'msg_type': 'status'}
+    queue.put(msg)
+    nt.assert_true(loop.queue.get_nowait() is msg)
+    nt.assert_true(msg['tab'] is tab)
+
+
+def test_each_message_to_its_tab():
+    loop = TabbedEventLoop()
+    tabs = [CountingTab(shown=True), CountingTab(shown=True)]
+    sessions = [Session(), Session()]
+    requests = [session.msg(u'execute_request') for session in sessions]
+    # the kernels' messages come interleaved
+    for i in range(3):
+        for tab, session, request in zip(tabs, sessions, requests):
+            loop.route(tab).put(session.msg(u'status', {}, request))
+            loop.route(tab).put(stream(session, unicode(i), request))
+    loop._run_msgs()
+    for tab in tabs:
+        nt.assert_equal(tab.interp.handled,
+                        [(u'status', None), (u'stream', u'0')] +
+                        [(u'status', None), (u'stream', u'1')] +
+                        [(u'status', None), (u'stream', u'2')])
+        nt.assert_equal(tab.pending, [])
+        nt.assert_equal(tab.unseen, 0)
+
+
+def test_background_tab_kept_until_caught_up():
+    loop = TabbedEventLoop(batch_size=1)
+    shown, hidden = CountingTab(shown=True), CountingTab()
+    session = Session()
+    request = session.msg(u'execute_request')
+    for data in (u'a', u'b', u'c'):
+        loop.route(hidden).put(stream(session, data, request))
+        loop.route(shown).put(session.msg(u'status', {}, request))
+        # handled in batches of one, so that the streams are not merged
+        # before they reach the tab
+        loop._run_msgs()
+        loop._run_msgs()
+    nt.assert_equal(shown.interp.handled, [(u'status', None)] * 3)
+    nt.assert_equal(hidden.interp.handled, [])
+    nt.assert_equal(len(hidden.pending), 3)
+    nt.assert_equal(hidden.unseen, 1)
+    hidden.shown = True
+    loop.catch_up(hidden)
+    nt.assert_equal(hidden.interp.handled, [(u'stream', u'abc')])
+    nt.assert_equal(hidden.pending, [])
+
+
+def test_closed_tab_dropped():
+    loop = TabbedEventLoop()
+    tabs = [CountingTab(shown=True), CountingTab()]
+    for tab in tabs:
+        tab.interp = None
+        loop.route(tab).put({'msg_type': 'status'})
+    loop._run_msgs()
+    for tab in tabs:
+        nt.assert_equal(tab.pending, [])
+        nt.assert_equal(tab.unseen, 0)
+
+
+def test_max_pending():
+    loop = TabbedEventLoop()
+    loop.max_pending = 10
+    tab = CountingTab()
+    session = Session()
+    request = session.msg(u'execute_request')
+    # streams are merged as they pile up, rather than handled
+    for i in range(20):
+        loop._dispatch(dict(stream(session, u'x', request), tab=tab))
+    nt.assert_equal(tab.interp.handled, [])
+    nt.assert_true(len(tab.pending) < loop.max_pending)
+    # messages that cannot be merged are handled once there are too many
+    for i in range(20):
+        loop._dispatch(dict(session.msg(u'status', {}, request), tab=tab))
+    nt.assert_equal(tab.interp.handled[0], (u'stream', u'x' * 20))
+    nt.assert_true(len(tab.pending) < loop.max_pending // 2)
+    # with the streams as one, none are lost
+    nt.assert_equal(len(tab.interp.handled) + len(tab.pending), 21)
+    # the tab is marked again each time messages are kept after some have
+    # been handled
+    nt.assert_equal(tab.unseen, 3)
@@ -1,6 +1,9 @@
 """Provides a pygments formatter for use with urwid."""
 
+import hashlib, json, os, tempfile
+
 from pygments.formatter import Formatter
+from pygments.token import string_to_tokentype
 import urwid
 
 colors16 = ['default',
@@ -9,6 +12,221 @@ colors16 = ['default',
       'light red', 'light green', 'yellow', 'light blue', 
       'light magenta', 'light cyan', 'white']
 
+# The xterm 256 and 88 color modes are made of the 16 basic colors, a color
+# cube with CUBE_STEPS[colors] levels for each of red, green and blue, and a
+# gray ramp with GRAY_STEPS[colors] levels.
+CUBE_STEPS = {256 : 6, 88 : 4}
+GRAY_STEPS = {256 : 24, 88 : 8}
+
+def _make_palette(colors):
+    """Returns (names, rgbs) for the given number of colors, where names are
+    the urwid names of the colors and rgbs their (r, g, b) values."""
+    if colors == 16:
+        names = colors16[1:]
+    else:
+        names = ['h%d' % i for i in range(colors)]
+    rgbs = [urwid.AttrSpec(name, 'default', colors).get_rgb_values()[:3]
+            for name in names]
+    return names, rgbs
+
+def _nearest_step(value, steps):
+    """Returns the index of the value in the sorted list steps nearest to
+    value (the lower one on a tie)."""
+    best = 0
+    for i in range(1, len(steps)):
+        if abs(steps[i] - value) < abs(steps[best] - value):
+            best = i
+    return best
+
+class Palette(object):
+    """The colors of one of the terminal color modes (16, 88 or 256), with a
+    nearest-color lookup.
+
+    In the 88 and 256 color modes the nearest color of the cube and of the
+    gray ramp are each found by indexing, so only the 16 basic colors are
+    compared one by one."""
+    def __init__(self, colors):
+        self.colors = colors
+        self.names, self.rgbs = _make_palette(colors)
+        if colors in CUBE_STEPS:
+            ncube, ngray = CUBE_STEPS[colors], GRAY_STEPS[colors]
+            self.cube_start = 16
+            self.gray_start = 16 + ncube ** 3
+            self.cube_steps = [self.rgbs[self.cube_start + i][2]
+                               for i in range(ncube)]
+            self.gray_steps = [self.rgbs[self.gray_start + i][0]
+                               for i in range(ngray)]
+            self.nbasic = 16
+        else:
+            self.nbasic = len(self.rgbs)
+        self._cache = {}
+
+    @staticmethod
+    def _distance(col1, col2):
+        r1, g1, b1 = col1
+        r2, g2, b2 = col2
+        
+        rd = r1 - r2
+        gd = g1 - g2
+        bd = b1 - b2
+        
+        return rd*rd + gd*gd + bd*bd
+
+    def _candidates(self, rgb):
+        """Yields the indices of the colors that may be nearest to rgb."""
+        for i in range(self.nbasic):
+            yield i
+        if self.nbasic == len(self.rgbs):
+            return
+        n = len(self.cube_steps)
+        ri, gi, bi = [_nearest_step(v, self.cube_steps) for v in rgb]
+        yield self.cube_start + (ri * n + gi) * n + bi
+        yield self.gray_start + _nearest_step(sum(rgb) / 3.0, self.gray_steps)
+
+    def nearest(self, rgb):
+        """Returns the index of the color nearest to the (r, g, b) tuple."""
+        return min((self._distance(rgb, self.rgbs[i]), i)
+                   for i in self._candidates(rgb))[1]
+
+    def closest(self, colstr):
+        """Takes a hex string (e.g. 'ff00dd') and returns the name of the
+        nearest color."""
+        try:
+            return self._cache[colstr]
+        except KeyError:
+            pass
+        rgb = int(colstr, 16)
+        rgb = ((rgb >> 16) & 0xff, (rgb >> 8) & 0xff, rgb & 0xff)
+        name = self._cache[colstr] = self.names[self.nearest(rgb)]
+        return name
+
+_palettes = {}
+
+def get_palette(colors):
+    """Returns the Palette for 16, 88 or 256 colors, making it on first use."""
+    if colors not in _palettes:
+        if colors not in (16, 88, 256):
+            raise ValueError('colors must be 16, 88 or 256, not %r' % colors)
+        _palettes[colors] = Palette(colors)
+    return _palettes[colors]
+
+def _attr_names(fgcolstr=None, bgcolstr=None, othersettings='', colors=256):
+    """Returns the urwid (foreground, background) nearest to two hex color
+    strings (e.g. 'ff00dd')."""
+    palette = get_palette(colors)
+    fg = bg = 'default'
+    if fgcolstr:
+        fg = palette.closest(fgcolstr)
+    if bgcolstr:
+        bg = palette.closest(bgcolstr)
+    if othersettings:
+        fg = fg + ',' + othersettings
+    return fg, bg
+
+def style_id(style):
+    """Returns a name for a pygments style class, which changes when the
+    style's definition does."""
+    definition = repr(sorted(style.styles.items()))
+    return '%s.%s-%s' % (style.__module__, style.__name__,
+                         hashlib.sha1(definition).hexdigest()[:12])
+
+def _compute_style(style, colors, usebold, usebg):
+    """Returns {token type name: (foreground, background)} for every token
+    type of style, with the inherited settings resolved."""
+    names = {}
+    for ttype, ndef in style:
+        fgcolstr = bgcolstr = None
+        othersettings = ''
+        if ndef['color']:
+            fgcolstr = ndef['color']
+        if usebg and ndef['bgcolor']:
+            bgcolstr = ndef['bgcolor']
+        if usebold and ndef['bold']:
+            othersettings = 'bold'
+        names[str(ttype)] = _attr_names(fgcolstr, bgcolstr, othersettings,
+                                        colors)
+    return names
+
+def _ipython_dir():
+    """Returns the IPython directory, as IPython.utils.path.get_ipython_dir
+    does in the usual cases. Importing that takes much longer than
+    computing a style, so it would defeat the cache."""
+    return os.environ.get('IPYTHON_DIR', os.environ.get(
+        'IPYTHONDIR', os.path.join(os.path.expanduser('~'), '.ipython')))
+
+class StyleCache(object):
+    """Compiled style tables kept as JSON files in a directory, by default
+    urwid_styles in the IPython directory, one file per table, so that
+    each is only computed once. Failing to read or write a file only means
+    computing the table again."""
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(_ipython_dir(), 'urwid_styles')
+        self.path = path
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        """Returns the {token type name: (foreground, background)} stored
+        for key, or None."""
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, key, names):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            # written whole and renamed, so a reader never sees half of it
+            fd, tmp = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(names, f)
+            os.rename(tmp, self._file(key))
+        except (IOError, OSError):
+            pass
+
+# (style, colors, usebold, usebg) -> {token type: AttrSpec}
+_tables = {}
+# the StyleCache used by formatters that are not given one
+_store = None
+
+def persist_styles(path=None):
+    """Makes the formatters created from now on keep their compiled styles
+    in a StyleCache at path (by default in the IPython directory)."""
+    global _store
+    _store = StyleCache(path)
+
+def compile_style(style, colors=256, usebold=True, usebg=True, store=None):
+    """Returns a dict mapping each token type of style to its AttrSpec.
+
+    The tables are made once per (style, colors, usebold, usebg) in a
+    process, and are shared; with a StyleCache as store, they are only
+    computed if the store does not have them already."""
+    key = (style, colors, usebold, usebg)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+    names = None
+    if store is not None:
+        store_key = '%s-%d-%d-%d' % (style_id(style), colors, usebold, usebg)
+        names = store.get(store_key)
+    if names is None:
+        names = _compute_style(style, colors, usebold, usebg)
+        if store is not None:
+            store.put(store_key, names)
+    # one AttrSpec for each distinct pair of colors
+    specs = {}
+    table = {}
+    for name, (fg, bg) in names.iteritems():
+        if (fg, bg) not in specs:
+            specs[fg, bg] = urwid.AttrSpec(fg, bg, colors)
+        table[string_to_tokentype(name)] = specs[fg, bg]
+    _tables[key] = table
+    return table
+
 class UrwidFormatter(Formatter):
     """Formatter that returns [(text,attrspec), ...],
     where text is a piece of text, and attrspec is an urwid.AttrSpec"""
@@ -20,10 +238,13 @@ class UrwidFormatter(Formatter):
         usebg: if false, background color will always be 'default'
                 default: True
         colors: number of colors to use (16, 88, or 256)
-                default: 256"""
+                default: 256
+        store: a StyleCache for the compiled styles
+                default: the one set by persist_styles(), if any"""
         self.usebold = options.get('usebold',True)
         self.usebg = options.get('usebg', True)
-        colors = options.get('colors', 256)
+        self.colors = options.get('colors', 256)
+        self.store = options.get('store', _store)
         self.style_attrs = {}
         Formatter.__init__(self, **options)
         
@@ -35,78 +256,43 @@ class UrwidFormatter(Formatter):
     def style(self, newstyle):
         self._style = newstyle
         self._setup_styles()
-        
-    @staticmethod
-    def _distance(col1, col2):
-        r1, g1, b1 = col1
-        r2, g2, b2 = col2
-        
-        rd = r1 - r2
-        gd = g1 - g2
-        bd = b1 - b2
-        
-        return rd*rd + gd*gd + bd*bd
     
     @classmethod
     def findclosest(cls, colstr, colors=256):
         """Takes a hex string and finds the nearest color to it.
         
         Returns a string urwid will recognize."""
-        
-        rgb = int(colstr, 16)
-        r = (rgb >> 16) & 0xff
-        g = (rgb >> 8) & 0xff
-        b = rgb & 0xff
-        
-        dist = 257 * 257 * 3
-        bestcol = urwid.AttrSpec('h0','default')
-        
-        for i in range(colors):
-            curcol = urwid.AttrSpec('h%d' % i,'default', colors=colors)
-            currgb = curcol.get_rgb_values()[:3]
-            curdist = cls._distance((r,g,b), currgb)
-            if curdist < dist:
-                dist = curdist
-                bestcol = curcol
-        
-        return bestcol.foreground
-    
+        return get_palette(colors).closest(colstr)
     
-    def findclosestattr(self, fgcolstr=None, bgcolstr=None, othersettings='', colors = 256):
+    def findclosestattr(self, fgcolstr=None, bgcolstr=None, othersettings='',
+                        colors=None):
         """Takes two hex colstring (e.g. 'ff00dd') and returns the 
         nearest urwid style."""
-        fg = bg = 'default'
-        if fgcolstr:
-            fg = self.findclosest(fgcolstr, colors)
-        if bgcolstr:
-            bg = self.findclosest(bgcolstr, colors)
-        if othersettings:
-            fg = fg + ',' + othersettings
+        if colors is None:
+            colors = self.colors
+        fg, bg = _attr_names(fgcolstr, bgcolstr, othersettings, colors)
         return urwid.AttrSpec(fg, bg, colors)
     
-    def _setup_styles(self, colors = 256):
-        """Fills self.style_attrs with urwid.AttrSpec attributes 
-        corresponding to the closest equivalents to the given style."""
-        for ttype, ndef in self.style:
-            fgcolstr = bgcolstr = None
-            othersettings = ''
-            if ndef['color']:
-                fgcolstr = ndef['color']
-            if self.usebg and ndef['bgcolor']:
-                bgcolstr = ndef['bgcolor']
-            if self.usebold and ndef['bold']:
-                othersettings = 'bold'
-            self.style_attrs[str(ttype)] = self.findclosestattr(
-                fgcolstr, bgcolstr, othersettings, colors)
+    def _setup_styles(self, colors=None):
+        """Sets self.style_attrs to the compiled table of urwid.AttrSpec
+        attributes closest to the given style, by token type."""
+        self.style_attrs = compile_style(self.style, colors or self.colors,
+                                         self.usebold, self.usebg, self.store)
         
     def formatgenerator(self, tokensource):
         """Takes a token source, and generates 
         (tokenstring, urwid.AttrSpec) pairs"""
+        attrs = self.style_attrs
         for (ttype, tstring) in tokensource:
-            while str(ttype) not in self.style_attrs:
-                ttype = ttype[:-1]
-
-            attr = self.style_attrs[str(ttype)]
+            try:
+                attr = attrs[ttype]
+            except KeyError:
+                # a token type the style does not know: use its nearest
+                # known parent's, from now on
+                parent = ttype
+                while parent not in attrs:
+                    parent = parent.parent
+                attr = attrs[ttype] = attrs[parent]
             yield attr, tstring
     
     def format(self, tokensource, outfile):
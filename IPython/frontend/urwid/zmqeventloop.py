@@ -0,0 +1,365 @@
+"""A single-threaded event loop that talks to the kernel directly.
+
+The channels of QueueKernelManager each run an IOLoop in a thread of their
+own, and hand every message to the urwid thread through a Queue. Here the
+XREQ, SUB, REP and heartbeat sockets are instead registered with one
+zmq.Poller, next to the terminal input and the urwid alarms, and messages are
+dispatched in the thread that received them."""
+
+import collections, errno, heapq, time, Queue
+
+import zmq
+from urwid import ExitMainLoop
+
+from IPython.zmq.kernelmanager import (ZmqSocketChannel, XReqSocketChannel,
+        SubSocketChannel, RepSocketChannel, HBSocketChannel)
+from IPython.utils.traitlets import Any, Type
+from eventloop import (QueueKernelManager, IpyEventLoop, dispatch,
+                       merge_streams)
+
+
+class MessageBuffer(collections.deque):
+    """The message queue used when the channels and the event loop share a
+    thread. Provides the parts of the WakeupQueue interface IpyEventLoop uses,
+    without any locking or pipe."""
+    def put(self, msg):
+        self.append(msg)
+
+    def get_nowait(self):
+        try:
+            return self.popleft()
+        except IndexError:
+            raise Queue.Empty
+
+    def empty(self):
+        return not self
+
+    def qsize(self):
+        return len(self)
+
+    def wakeup(self):
+        pass
+
+    def clear_wakeup(self):
+        pass
+
+
+class PollerChannel(object):
+    """Mixin for channels that are driven by a ZMQEventLoop instead of a
+    thread. The event loop must be assigned to loop before start()."""
+    loop = None
+    socket_type = zmq.XREQ
+
+    def __init__(self, rcvd_queue, context, session, address):
+        # Skip the constructors of the channel classes, which make an IOLoop
+        # per channel.
+        ZmqSocketChannel.__init__(self, context, session, address)
+        self.rcvd_queue = rcvd_queue
+        self._running = False
+
+    def _create_socket(self):
+        self.socket = self.context.socket(self.socket_type)
+        self.socket.setsockopt(zmq.IDENTITY, self.session.session)
+        self.socket.connect('tcp://%s:%i' % self.address)
+        self.loop.watch_socket(self.socket, self._handle_recv)
+
+    def _close_socket(self):
+        self.loop.remove_watch_socket(self.socket)
+        self.socket.close(linger=0)
+
+    def start(self):
+        self._create_socket()
+        self._running = True
+
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._close_socket()
+
+    def is_alive(self):
+        return self._running
+
+    def call_handlers(self, msg):
+        self.rcvd_queue.put(msg)
+
+    def _handle_recv(self):
+        while True:
+            try:
+                msg = self.session.recv_msg(self.socket, zmq.NOBLOCK)
+            except ValueError:
+                # packed by a packer the session doesn't accept
+                continue
+            if msg is None:
+                break
+            self.call_handlers(msg)
+
+
+class PollerXReq(PollerChannel, XReqSocketChannel):
+    def _queue_request(self, msg):
+        self.session.send_msg(self.socket, msg)
+
+    def call_handlers(self, msg):
+        self._use_packer(msg)
+        PollerChannel.call_handlers(self, msg)
+
+
+class PollerSub(PollerChannel, SubSocketChannel):
+    socket_type = zmq.SUB
+
+    def _create_socket(self):
+        super(PollerSub, self)._create_socket()
+        self.socket.setsockopt(zmq.SUBSCRIBE, '')
+
+    def flush(self, timeout=1.0):
+        """Handles all of the messages already received on the SUB socket."""
+        self._handle_recv()
+
+
+class PollerRep(PollerChannel, RepSocketChannel):
+    def _queue_reply(self, msg):
+        self.session.send_msg(self.socket, msg)
+
+
+class PollerHB(PollerChannel, HBSocketChannel):
+    """Pings the kernel every time_to_dead seconds from an alarm. If the
+    previous ping has not been answered by then, a 'kernel_died' message is
+    queued for the interpreter."""
+    socket_type = zmq.REQ
+    # called with the round trip time of each ping answered, if set
+    rtt_handler = None
+
+    def __init__(self, *args, **kw):
+        super(PollerHB, self).__init__(*args, **kw)
+        self._pause = True
+        self._waiting = False
+        self._alarm = None
+
+    def start(self):
+        super(PollerHB, self).start()
+        self._alarm = self.loop.alarm(0, self._beat)
+
+    def stop(self):
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+            self._alarm = None
+        super(PollerHB, self).stop()
+
+    def _beat(self):
+        self._alarm = self.loop.alarm(self.time_to_dead, self._beat)
+        if self._pause:
+            return
+        now = time.time()
+        if self._waiting:
+            self.call_handlers(now - self._request_time)
+            # A REQ socket can't send again until it gets its reply, so
+            # start over with a new one.
+            self._close_socket()
+            self._create_socket()
+        self._request_time = now
+        self._waiting = True
+        self.socket.send_json('ping')
+
+    def _handle_recv(self):
+        # A REQ socket gets exactly one reply per request
+        try:
+            self.socket.recv_json(zmq.NOBLOCK)
+        except zmq.ZMQError, e:
+            if e.errno != zmq.EAGAIN:
+                raise
+        else:
+            self._waiting = False
+            if self.rtt_handler is not None:
+                self.rtt_handler(time.time() - self._request_time)
+
+    def pause(self):
+        self._pause = True
+        self._waiting = False
+
+    def is_beating(self):
+        return self._running and not self._pause
+
+    def call_handlers(self, since_last_heartbeat):
+        self.rcvd_queue.put({'msg_type' : 'kernel_died',
+                             'header' : {}, 'parent_header' : {},
+                             'content' : {'since_last_heartbeat' :
+                                          since_last_heartbeat}})
+
+
+class PollerKernelManager(QueueKernelManager):
+    """A kernel manager whose channels run in the ZMQEventLoop assigned to
+    event_loop, which must be set before start_channels() is called."""
+    xreq_channel_class = Type(PollerXReq)
+    sub_channel_class = Type(PollerSub)
+    rep_channel_class = Type(PollerRep)
+    hb_channel_class = Type(PollerHB)
+
+    rcvd_queue_class = MessageBuffer
+
+    event_loop = Any
+
+    def start_channels(self, *args, **kw):
+        if self.event_loop is None:
+            raise RuntimeError('event_loop must be set before the channels '
+                               'are started.')
+        for channel in (self.xreq_channel, self.sub_channel,
+                        self.rep_channel, self.hb_channel):
+            channel.loop = self.event_loop
+        super(PollerKernelManager, self).start_channels(*args, **kw)
+
+    @property
+    def hb_channel(self):
+        """Get the heartbeat socket channel object."""
+        if self._hb_channel is None:
+            self._hb_channel = self.hb_channel_class(self.rcvd_queue,
+                                                     self.context,
+                                                     self.session,
+                                                     self.hb_address)
+        return self._hb_channel
+
+
+class ZMQEventLoop(IpyEventLoop):
+    """An IpyEventLoop that polls 0MQ sockets as well as files, using a
+    zmq.Poller in place of select. The queue should be the MessageBuffer of
+    a PollerKernelManager."""
+    def __init__(self, queue, interp, **kw):
+        self._poller = zmq.Poller()
+        self._sockets = {}
+        super(ZMQEventLoop, self).__init__(queue, interp, **kw)
+
+    def _watch_queue(self):
+        self._queue_handle = self.queue
+
+    def _unwatch_queue(self):
+        self._queue_handle = None
+
+    def watch_file(self, fd, callback):
+        self._poller.register(fd, zmq.POLLIN)
+        return super(ZMQEventLoop, self).watch_file(fd, callback)
+
+    def remove_watch_file(self, handle):
+        if handle in self._watch_files:
+            self._poller.unregister(handle)
+        return super(ZMQEventLoop, self).remove_watch_file(handle)
+
+    def watch_socket(self, socket, callback):
+        """Call callback() when socket has a message waiting.
+
+        Returns a handle that may be passed to remove_watch_socket()"""
+        self._sockets[socket] = callback
+        self._poller.register(socket, zmq.POLLIN)
+        return socket
+
+    def remove_watch_socket(self, handle):
+        """Remove a socket. Returns True if the socket was being watched."""
+        if handle not in self._sockets:
+            return False
+        del self._sockets[handle]
+        self._poller.unregister(handle)
+        return True
+
+    def run(self):
+        try:
+            self._did_something = True
+            while True:
+                try:
+                    self._loop()
+                except zmq.ZMQError, e:
+                    if e.errno != errno.EINTR:
+                        raise
+        except ExitMainLoop:
+            pass
+
+    def _loop(self):
+        msgs_waiting = (self._queue_handle is not None and
+                        (self._backlog or self.queue))
+        tm = timeout = None
+        if self._alarms:
+            tm = self._alarms[0][0]
+            timeout = max(0, tm - time.time())
+        if ((self._did_something or msgs_waiting) and
+                (not self._alarms or timeout > 0)):
+            tm = 'idle'
+            timeout = 0
+        if timeout is not None:
+            # zmq.Poller wants milliseconds
+            timeout = 1000 * timeout
+        ready = self._poller.poll(timeout)
+
+        if msgs_waiting:
+            self._run_msgs()
+            self._did_something = True
+        elif not ready:
+            if tm == 'idle':
+                self._entering_idle()
+                self._did_something = False
+            elif tm is not None:
+                tm, alarm_callback = heapq.heappop(self._alarms)
+                alarm_callback()
+                self._did_something = True
+
+        for handle, event in ready:
+            # an earlier callback may have removed this one
+            callback = (self._sockets.get(handle) or
+                        self._watch_files.get(handle))
+            if callback is not None:
+                callback()
+                self._did_something = True
+
+
+class TabBuffer(object):
+    """Stands in for the MessageBuffer of one of the kernel managers sharing
+    a TabbedEventLoop. Each message put is marked with the tab it is for,
+    and put in the buffer of the event loop."""
+    def __init__(self, buffer, tab):
+        self.buffer = buffer
+        self.tab = tab
+
+    def put(self, msg):
+        msg['tab'] = self.tab
+        self.buffer.put(msg)
+
+
+class TabbedEventLoop(ZMQEventLoop):
+    """A ZMQEventLoop for several kernels at once, each shown in a tab.
+
+    The sockets of all of the kernels are polled together, and their
+    messages handled in batches from one MessageBuffer, as ZMQEventLoop
+    does. The rcvd_queue of each PollerKernelManager should be set to
+    route(tab) before its channels are made.
+
+    Each message goes to the interp of its tab, if the tab is shown. For a
+    tab in the background, messages are kept in tab.pending until
+    catch_up(tab) is called as it is shown, so that its widgets are not
+    updated for output no one sees; runs of stream messages are merged as
+    they pile up, and past max_pending messages they are handled anyway.
+    tab.mark_unseen() is called when the first message is kept. Messages
+    for a tab whose interp is None (it has been closed) are dropped."""
+    max_pending = 1000
+
+    def __init__(self, **kw):
+        super(TabbedEventLoop, self).__init__(MessageBuffer(), None, **kw)
+
+    def route(self, tab):
+        """Returns the queue for the kernel manager of tab."""
+        return TabBuffer(self.queue, tab)
+
+    def _dispatch(self, msg):
+        tab = msg.pop('tab')
+        if tab.interp is None:
+            return
+        if tab.shown:
+            dispatch(tab.interp, msg)
+            return
+        if not tab.pending:
+            tab.mark_unseen()
+        tab.pending.append(msg)
+        if len(tab.pending) >= self.max_pending:
+            tab.pending = merge_streams(tab.pending)
+            if len(tab.pending) >= self.max_pending // 2:
+                self.catch_up(tab)
+
+    def catch_up(self, tab):
+        """Handles the messages kept for tab."""
+        pending, tab.pending = merge_streams(tab.pending), []
+        for msg in pending:
+            dispatch(tab.interp, msg)
@@ -18,9 +18,10 @@ from IPython.external.argparse import ArgumentParser
 from IPython.utils import io
 from displayhook import DisplayHook
 from heartbeat import Heartbeat
-from iostream import OutStream
+from iostream import OutStream, OutputThrottle
+from kernellog import configure as configure_log
 from parentpoller import ParentPollerUnix, ParentPollerWindows
-from session import Session
+from session import Session, packer_names
 
 def bind_port(socket, ip, port):
     """ Binds the specified ZMQ socket. If the port is zero, a random port is
@@ -50,6 +51,33 @@ def make_argument_parser():
                         help='set the REQ channel port [default: random]')
     parser.add_argument('--hb', type=int, metavar='PORT', default=0,
                         help='set the heartbeat port [default: random]')
+    parser.add_argument('--log-level', type=str, metavar='LEVEL',
+                        default='warning',
+                        help='log the messages handled at LEVEL and above, '
+                        'such as debug or info [default: warning]')
+    parser.add_argument('--log-ring', type=int, metavar='N', default=0,
+                        help='keep the last N log records of any level, '
+                        'to be written to stderr on SIGUSR1 [default: 0]')
+    parser.add_argument('--iopub-bytes-rate', type=int, metavar='BYTES',
+                        default=OutputThrottle.bytes_per_sec,
+                        help='publish at most BYTES of output a second, '
+                        'dropping the rest, or 0 for no limit '
+                        '[default: %(default)s]')
+    parser.add_argument('--iopub-msg-rate', type=int, metavar='N',
+                        default=OutputThrottle.msgs_per_sec,
+                        help='publish at most N output messages a second, '
+                        'or 0 for no limit [default: %(default)s]')
+    parser.add_argument('--iopub-hwm', type=int, metavar='N', default=0,
+                        help='queue at most N messages on the PUB channel '
+                        'for each frontend, or 0 for the zmq default')
+    parser.add_argument('--output-spool', type=str, metavar='DIR',
+                        default=None,
+                        help='also write all the output to files in DIR, '
+                        'from which frontends may fetch what was dropped')
+    parser.add_argument('--accept-pickle', action='store_true',
+                        help='read messages packed with pickle, which runs '
+                        'code while unpacking them, as well as the other '
+                        'packers')
 
     if sys.platform == 'win32':
         parser.add_argument('--interrupt', type=int, metavar='HANDLE', 
@@ -78,6 +106,8 @@ def make_kernel(namespace, kernel_factory,
         sys.stdout = sys.stderr = blackhole
         sys.__stdout__ = sys.__stderr__ = blackhole 
 
+    configure_log(namespace.log_level, namespace.log_ring)
+
     # Install minimal exception handling
     sys.excepthook = FormattedTB(mode='Verbose', color_scheme='NoColor', 
                                  ostream=sys.__stdout__)
@@ -87,13 +117,20 @@ def make_kernel(namespace, kernel_factory,
     context = zmq.Context()
     # Uncomment this to try closing the context.
     # atexit.register(context.close)
-    session = Session(username=u'kernel')
+    # Unpacking a pickle can run code before the message reaches the
+    # kernel, whoever sent it, so pickles are only read when asked for.
+    accept = packer_names if namespace.accept_pickle else None
+    session = Session(username=u'kernel', accept=accept)
 
     reply_socket = context.socket(zmq.XREP)
     xrep_port = bind_port(reply_socket, namespace.ip, namespace.xrep)
     io.raw_print("XREP Channel on port", xrep_port)
 
     pub_socket = context.socket(zmq.PUB)
+    if namespace.iopub_hwm > 0:
+        # zmq 2 has one HWM for both directions
+        hwm = getattr(zmq, 'SNDHWM', None) or zmq.HWM
+        pub_socket.setsockopt(hwm, namespace.iopub_hwm)
     pub_port = bind_port(pub_socket, namespace.ip, namespace.pub)
     io.raw_print("PUB Channel on port", pub_port)
 
@@ -112,16 +149,23 @@ def make_kernel(namespace, kernel_factory,
     io.raw_print("-e --xreq {0} --sub {1} --rep {2} --hb {3}".format(
         xrep_port, pub_port, req_port, hb_port))
 
-    # Redirect input streams and set a display hook.
+    # Redirect input streams, limiting their rate together, and set a display
+    # hook.
+    throttle = OutputThrottle(namespace.iopub_bytes_rate,
+                              namespace.iopub_msg_rate,
+                              namespace.output_spool)
     if out_stream_factory:
-        sys.stdout = out_stream_factory(session, pub_socket, u'stdout')
-        sys.stderr = out_stream_factory(session, pub_socket, u'stderr')
+        sys.stdout = out_stream_factory(session, pub_socket, u'stdout',
+                                        throttle=throttle)
+        sys.stderr = out_stream_factory(session, pub_socket, u'stderr',
+                                        throttle=throttle)
     if display_hook_factory:
         sys.displayhook = display_hook_factory(session, pub_socket)
 
     # Create the kernel.
     kernel = kernel_factory(session=session, reply_socket=reply_socket, 
-                            pub_socket=pub_socket, req_socket=req_socket)
+                            pub_socket=pub_socket, req_socket=req_socket,
+                            throttle=throttle)
     kernel.record_ports(xrep_port=xrep_port, pub_port=pub_port,
                         req_port=req_port, hb_port=hb_port)
     return kernel
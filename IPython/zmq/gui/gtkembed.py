@@ -16,6 +16,7 @@ import sys
 # Third-party
 import gobject
 import gtk
+import zmq
 
 #-----------------------------------------------------------------------------
 # Classes and functions
@@ -44,17 +45,19 @@ class GTKEmbed(object):
         returns False to ensure it doesn't get run again by GTK.
         """
         self.gtk_main, self.gtk_main_quit = self._hijack_gtk()
-        gobject.timeout_add(int(1000*self.kernel._poll_interval),
-                            self.iterate_kernel)
+        fd = self.kernel.reply_socket.getsockopt(zmq.FD)
+        gobject.io_add_watch(fd, gobject.IO_IN, self.iterate_kernel)
+        # Requests that came before the watch won't make the fd readable.
+        self.kernel.handle_pending()
         return False
         
-    def iterate_kernel(self):
-        """Run one iteration of the kernel and return True.
+    def iterate_kernel(self, fd, condition):
+        """Handle the requests waiting for the kernel and return True.
 
-        GTK timer functions must return True to be called again, so we make the
-        call to :meth:`do_one_iteration` and then return True for GTK.
+        GTK watch functions must return True to be called again, so we make
+        the call to :meth:`handle_pending` and then return True for GTK.
         """
-        self.kernel.do_one_iteration()
+        self.kernel.handle_pending()
         return True
 
     def stop(self):
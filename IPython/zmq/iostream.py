@@ -1,49 +1,277 @@
+import os
 import sys
 import time
-from cStringIO import StringIO
+from threading import Event, Lock, Thread
 
+from kernellog import log
 from session import extract_header, Message
 
-from IPython.utils import io
-
 #-----------------------------------------------------------------------------
 # Stream classes
 #-----------------------------------------------------------------------------
 
+def _size(n):
+    """Returns n bytes as text to read, such as '3.2 MB'."""
+    if n < 2**10:
+        return '%d bytes' % n
+    if n < 2**20:
+        return '%.1f KB' % (n / 2.0**10)
+    return '%.1f MB' % (n / 2.0**20)
+
+
+class OutputThrottle(object):
+    """Limits the rate the output streams of a kernel publish at, together.
+
+    Each window of window seconds, the streams may publish bytes_per_sec
+    and msgs_per_sec times window bytes and messages (a limit of 0 is no
+    limit); what is written past that, until the next window, is dropped,
+    so a runaway cell shows a sample of its output, at the limit, instead
+    of flooding the frontends. An OutStream marks each gap with a summary
+    of what it dropped, when it publishes again, when its output stops,
+    or when the kernel calls summarize() at the end of a cell.
+
+    With a spool_dir, every stream also writes all of its output to a file
+    there (see spool), from which spool_request fetches any part of it.
+    """
+    bytes_per_sec = 10 * 2**20
+    msgs_per_sec = 1000
+    window = 1.0
+
+    def __init__(self, bytes_per_sec=None, msgs_per_sec=None, spool_dir=None):
+        if bytes_per_sec is not None:
+            self.bytes_per_sec = bytes_per_sec
+        if msgs_per_sec is not None:
+            self.msgs_per_sec = msgs_per_sec
+        self.spool_dir = spool_dir
+        # stream name -> the path of its spool file
+        self.spools = {}
+        # the streams limited, which add themselves
+        self.streams = []
+        self._lock = Lock()
+        self._start = 0.0
+        self._bytes = 0
+        self._msgs = 0
+        # whether a message was dropped in this window
+        self._full = False
+
+    def allow(self, nbytes):
+        """Returns whether a message of nbytes may be published now, and
+        counts it if so."""
+        now = time.time()
+        with self._lock:
+            if now - self._start >= self.window:
+                self._start = now
+                self._bytes = self._msgs = 0
+                self._full = False
+            # Once one is dropped, so are the rest of the window, rather than
+            # the small ones that would fit in what is left.
+            if self._full:
+                return False
+            # One message bigger than the window allows gets through alone.
+            over_bytes = self.bytes_per_sec and self._bytes and \
+                self._bytes + nbytes > self.bytes_per_sec * self.window
+            over_msgs = self.msgs_per_sec and \
+                self._msgs >= self.msgs_per_sec * self.window
+            if over_bytes or over_msgs:
+                self._full = True
+                return False
+            self._bytes += nbytes
+            self._msgs += 1
+            return True
+
+    def spool(self, name):
+        """Returns a new file to spool the output of the stream name to, or
+        None if there is no spool_dir."""
+        if self.spool_dir is None:
+            return None
+        path = os.path.join(self.spool_dir,
+                            'kernel-%d-%s.out' % (os.getpid(), name))
+        self.spools[name] = path
+        # unbuffered, so that read_spool sees everything written
+        return open(path, 'wb', 0)
+
+    def read_spool(self, name, offset=0, size=-1):
+        """Returns size bytes (by default all) from offset in the spool of
+        the stream name, and the length of the whole spool; or None, 0 if
+        it has none."""
+        path = self.spools.get(name)
+        if path is None:
+            return None, 0
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            total = f.tell()
+            f.seek(offset)
+            return f.read(size), total
+
+    def summarize(self):
+        """Has each stream publish a summary of what it dropped since its
+        last, if anything."""
+        for stream in self.streams:
+            stream.summarize()
+
+
 class OutStream(object):
-    """A file like object that publishes the stream to a 0MQ PUB socket."""
+    """A file like object that publishes the stream to a 0MQ PUB socket.
+
+    What is written is published by a thread of its own flush_interval after
+    it was written, so output printed before a long computation shows while
+    the computation runs; or at once if more than flush_size bytes are
+    waiting. Each message carries at most chunk_size bytes, cut after a
+    newline where there is one. The session's send lock keeps the thread's
+    sends apart from the kernel's on the same PUB socket.
+
+    With a throttle (see OutputThrottle), what is written too fast is dropped
+    and summarized instead, and all of it is spooled if the throttle spools.
+    """
 
     # The time interval between automatic flushes, in seconds.
     flush_interval = 0.05
+    # The bytes waiting that make a write flush at once.
+    flush_size = 2**16
+    # The most bytes published in one message.
+    chunk_size = 2**16
 
-    def __init__(self, session, pub_socket, name):
+    def __init__(self, session, pub_socket, name, throttle=None):
         self.session = session
         self.pub_socket = pub_socket
         self.name = name
         self.parent_header = {}
-        self._new_buffer()
+        # an OutputThrottle, if the rate is limited
+        self.throttle = throttle
+        self._spool = None
+        if throttle is not None:
+            throttle.streams.append(self)
+            self._spool = throttle.spool(name)
+        # the bytes spooled, and those and the lines dropped since the last
+        # summary, with the offset of the first in the spool
+        self._spooled = 0
+        self._dropped = 0
+        self._dropped_lines = 0
+        self._dropped_at = 0
+        # whether the last data published ended a line
+        self._line_ended = True
+        # The strings written and not yet published, and their length, both
+        # guarded by _lock, which is held while publishing too so that the
+        # thread and flush() don't publish out of order.
+        self._pieces = []
+        self._size = 0
+        self._lock = Lock()
+        # set while anything is waiting, for the thread
+        self._waiting = Event()
+        self._thread = Thread(target=self._flush_later)
+        self._thread.daemon = True
+        self._thread.start()
 
     def set_parent(self, parent):
+        # What is waiting came from the previous parent.
+        if self._pieces:
+            self.flush()
         self.parent_header = extract_header(parent)
 
     def close(self):
         self.pub_socket = None
+        self._waiting.set()
 
     def flush(self):
-        #io.rprint('>>>flushing output buffer: %s<<<' % self.name)  # dbg
         if self.pub_socket is None:
             raise ValueError(u'I/O operation on closed file')
         else:
-            data = self._buffer.getvalue()
-            if data:
-                content = {u'name':self.name, u'data':data}
-                msg = self.session.msg(u'stream', content=content,
-                                       parent=self.parent_header)
-                io.raw_print(msg)
-                self.pub_socket.send_json(msg)
-                
-                self._buffer.close()
-                self._new_buffer()
+            with self._lock:
+                if not self._pieces:
+                    self._waiting.clear()
+                    # the output stopped: say what was dropped of it
+                    if self._dropped:
+                        self._publish_summary()
+                    return
+                data = ''.join(self._pieces)
+                self._pieces = []
+                self._size = 0
+                self._waiting.clear()
+                for chunk in self._chunks(data):
+                    if self._spool is not None:
+                        self._spool.write(chunk)
+                        self._spooled += len(chunk)
+                    if self.throttle is None or \
+                            self.throttle.allow(len(chunk)):
+                        if self._dropped:
+                            self._publish_summary()
+                        self._publish(chunk)
+                    else:
+                        self._drop(chunk)
+                if self._dropped:
+                    # to flush again, and so summarize, if nothing more is
+                    # written
+                    self._waiting.set()
+
+    def summarize(self):
+        """Publishes a summary of what was dropped since the last, if
+        anything."""
+        with self._lock:
+            if self.pub_socket is not None and self._dropped:
+                self._publish_summary()
+
+    def _publish(self, data, **content):
+        content.update(name=self.name, data=data)
+        msg = self.session.msg(u'stream', content=content,
+                               parent=self.parent_header)
+        log.debug('Publishing: %s', msg)
+        self.session.send_msg(self.pub_socket, msg)
+        self._line_ended = data.endswith('\n')
+
+    def _drop(self, chunk):
+        if not self._dropped:
+            self._dropped_at = self._spooled - len(chunk)
+        self._dropped += len(chunk)
+        self._dropped_lines += chunk.count('\n')
+
+    def _publish_summary(self):
+        """Publishes what was dropped since the last summary, in the text and
+        under 'suppressed' in the content."""
+        suppressed = {u'bytes': self._dropped, u'lines': self._dropped_lines}
+        text = 'output rate exceeded; %s (%d lines) suppressed' % (
+            _size(self._dropped), self._dropped_lines)
+        if self._spool is not None:
+            suppressed[u'spool'] = {u'offset': self._dropped_at,
+                                    u'length': self._dropped}
+            text += '; spooled at bytes %d-%d of %s' % (
+                self._dropped_at, self._dropped_at + self._dropped,
+                self.name)
+        log.info('Stream %s: %s', self.name, text)
+        text = '[%s]\n' % text
+        if not self._line_ended:
+            text = '\n' + text
+        self._dropped = self._dropped_lines = 0
+        self._publish(text, suppressed=suppressed)
+
+    def _chunks(self, data):
+        """Cuts data into pieces of at most chunk_size bytes, after the last
+        newline in each where there is one, and otherwise not within a utf-8
+        character."""
+        size = self.chunk_size
+        start = 0
+        while len(data) - start > size:
+            end = data.rfind('\n', start, start + size) + 1
+            if end <= start:
+                end = start + size
+                # back off from a continuation byte, 10xxxxxx
+                while end > start + 1 and '\x80' <= data[end] <= '\xbf':
+                    end -= 1
+            yield data[start:end]
+            start = end
+        yield data[start:]
+
+    def _flush_later(self):
+        """Publishes what is written flush_interval after it is."""
+        while True:
+            self._waiting.wait()
+            time.sleep(self.flush_interval)
+            if self.pub_socket is None:
+                return
+            try:
+                self.flush()
+            except ValueError:
+                # closed
+                return
 
     def isatty(self):
         return False
@@ -65,12 +293,15 @@ class OutStream(object):
             # into utf-8 for all frontends if we get unicode inputs.
             if type(string) == unicode:
                 string = string.encode('utf-8')
-                
-            self._buffer.write(string)
-            current_time = time.time()
-            if self._start <= 0:
-                self._start = current_time
-            elif current_time - self._start > self.flush_interval:
+
+            with self._lock:
+                pieces = self._pieces
+                pieces.append(string)
+                size = self._size = self._size + len(string)
+                if len(pieces) == 1:
+                    # the first since the last flush
+                    self._waiting.set()
+            if size > self.flush_size:
                 self.flush()
 
     def writelines(self, sequence):
@@ -79,7 +310,3 @@ class OutStream(object):
         else:
             for string in sequence:
                 self.write(string)
-
-    def _new_buffer(self):
-        self._buffer = StringIO()
-        self._start = -1
@@ -18,23 +18,26 @@ from __future__ import print_function
 # Standard library imports.
 import __builtin__
 import atexit
+import errno
+import select
 import sys
 import time
 import traceback
+from threading import Event, Thread
 
 # System library imports.
 import zmq
 
 # Local imports.
 from IPython.config.configurable import Configurable
-from IPython.utils import io
 from IPython.utils.jsonutil import json_clean
 from IPython.lib import pylabtools
 from IPython.utils.traitlets import Instance, Float
 from entry_point import (base_launch_kernel, make_argument_parser, make_kernel,
                          start_kernel)
-from iostream import OutStream
-from session import Session, Message
+from iostream import OutStream, OutputThrottle
+from kernellog import log
+from session import Session
 from zmqshell import ZMQInteractiveShell
 
 #-----------------------------------------------------------------------------
@@ -52,6 +55,8 @@ class Kernel(Configurable):
     reply_socket = Instance('zmq.Socket')
     pub_socket = Instance('zmq.Socket')
     req_socket = Instance('zmq.Socket')
+    # The throttle of the output streams, which keeps their spools.
+    throttle = Instance(OutputThrottle)
 
     # Private interface
 
@@ -64,7 +69,8 @@ class Kernel(Configurable):
     # a little if it's not enough after more interactive testing.
     _execute_sleep = Float(0.0005, config=True)
 
-    # Frequency of the kernel's event loop.
+    # Frequency of the kernel's event loop, for the GUI toolkits that can't
+    # watch the reply socket for requests and must poll it instead.
     # Units are in seconds, kernel subclasses for GUI toolkits may need to
     # adapt to milliseconds.
     _poll_interval = Float(0.05, config=True)
@@ -98,55 +104,72 @@ class Kernel(Configurable):
         # Build dict of handlers for message types
         msg_types = [ 'execute_request', 'complete_request', 
                       'object_info_request', 'history_request',
-                      'connect_request', 'shutdown_request']
+                      'connect_request', 'spool_request', 'shutdown_request']
         self.handlers = {}
         for msg_type in msg_types:
             self.handlers[msg_type] = getattr(self, msg_type)
 
     def do_one_iteration(self):
-        """Do one iteration of the kernel's evaluation loop.
+        """Do one iteration of the kernel's evaluation loop: handle one
+        request, if there is one waiting. Returns whether there was.
         """
         try:
-            ident = self.reply_socket.recv(zmq.NOBLOCK)
-        except zmq.ZMQError, e:
-            if e.errno == zmq.EAGAIN:
-                return
-            else:
-                raise
-        # FIXME: Bug in pyzmq/zmq?
-        # assert self.reply_socket.rcvmore(), "Missing message part."
-        msg = self.reply_socket.recv_json()
-        
-        # Print some info about this message and leave a '--->' marker, so it's
-        # easier to trace visually the message chain when debugging.  Each
-        # handler prints its message at the end.
-        # Eventually we'll move these from stdout to a logger.
-        io.raw_print('\n*** MESSAGE TYPE:', msg['msg_type'], '***')
-        io.raw_print('   Content: ', msg['content'],
-                     '\n   --->\n   ', sep='', end='')
+            ident, msg = self.session.recv_with_ident(self.reply_socket,
+                                                      zmq.NOBLOCK)
+        except ValueError, e:
+            log.warning('Dropping a request: %s', e)
+            return True
+        if msg is None:
+            return False
+
+        # Each handler logs the reply it sends, after this.
+        log.debug('Handling %s: %s', msg['msg_type'], msg['content'])
 
         # Find and call actual handler for message
         handler = self.handlers.get(msg['msg_type'], None)
         if handler is None:
-            io.raw_print_err("UNKNOWN MESSAGE TYPE:", msg)
+            log.error('Unknown message type: %s', msg)
         else:
             handler(ident, msg)
             
         # Check whether we should exit, in case the incoming message set the
         # exit flag on
         if self.shell.exit_now:
-            io.raw_print('\nExiting IPython kernel...')
+            log.info('Exiting IPython kernel...')
             # We do a normal, clean exit, which allows any actions registered
             # via atexit (such as history saving) to take place.
             sys.exit(0)
+        return True
 
+    def handle_pending(self):
+        """Handle all of the requests waiting on the reply socket.
+
+        Checking zmq.EVENTS also rearms the socket's zmq.FD, which is edge
+        triggered, so this is what a GUI event loop watching that file
+        descriptor should call when it becomes readable.
+        """
+        while self.reply_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            self.do_one_iteration()
 
     def start(self):
         """ Start the kernel main loop.
+
+        The loop blocks until requests arrive on the reply socket, and then
+        handles all of them before waiting again.
         """
+        poller = zmq.Poller()
+        poller.register(self.reply_socket, zmq.POLLIN)
         while True:
-            time.sleep(self._poll_interval)
-            self.do_one_iteration()
+            try:
+                poller.poll()
+            except KeyboardInterrupt:
+                # An interrupt while idle has nothing to interrupt.
+                continue
+            except zmq.ZMQError, e:
+                if e.errno != errno.EINTR:
+                    raise
+                continue
+            self.handle_pending()
 
     def record_ports(self, xrep_port, pub_port, req_port, hb_port):
         """Record the ports that this kernel is using.
@@ -169,7 +192,7 @@ class Kernel(Configurable):
         """Publish the code request on the pyin stream."""
 
         pyin_msg = self.session.msg(u'pyin',{u'code':code}, parent=parent)
-        self.pub_socket.send_json(pyin_msg)
+        self.session.send_msg(self.pub_socket, pyin_msg)
 
     def execute_request(self, ident, parent):
         
@@ -178,15 +201,14 @@ class Kernel(Configurable):
             {u'execution_state':u'busy'},
             parent=parent
         )
-        self.pub_socket.send_json(status_msg)
+        self.session.send_msg(self.pub_socket, status_msg)
         
         try:
             content = parent[u'content']
             code = content[u'code']
             silent = content[u'silent'] 
         except:
-            io.raw_print_err("Got bad msg: ")
-            io.raw_print_err(Message(parent))
+            log.error('Got a bad execute_request: %s', parent)
             return
 
         shell = self.shell # we'll need this a lot here
@@ -269,19 +291,21 @@ class Kernel(Configurable):
 
         # Send the reply.
         reply_msg = self.session.msg(u'execute_reply', reply_content, parent)
-        io.raw_print(reply_msg)
+        log.debug('Replied: %s', reply_msg)
 
-        # Flush output before sending the reply.
+        # Flush output, and say what of it was dropped, before sending the
+        # reply.
         sys.stdout.flush()
         sys.stderr.flush()
+        if self.throttle is not None:
+            self.throttle.summarize()
         # FIXME: on rare occasions, the flush doesn't seem to make it to the
         # clients... This seems to mitigate the problem, but we definitely need
         # to better understand what's going on.
         if self._execute_sleep:
             time.sleep(self._execute_sleep)
         
-        self.reply_socket.send(ident, zmq.SNDMORE)
-        self.reply_socket.send_json(reply_msg)
+        self.session.send_msg(self.reply_socket, reply_msg, ident)
         if reply_msg['content']['status'] == u'error':
             self._abort_queue()
 
@@ -290,7 +314,7 @@ class Kernel(Configurable):
             {u'execution_state':u'idle'},
             parent=parent
         )
-        self.pub_socket.send_json(status_msg)
+        self.session.send_msg(self.pub_socket, status_msg)
 
     def complete_request(self, ident, parent):
         txt, matches = self._complete(parent)
@@ -299,7 +323,7 @@ class Kernel(Configurable):
                    'status' : 'ok'}
         completion_msg = self.session.send(self.reply_socket, 'complete_reply',
                                            matches, parent, ident)
-        io.raw_print(completion_msg)
+        log.debug('Replied: %s', completion_msg)
 
     def object_info_request(self, ident, parent):
         object_info = self.shell.object_inspect(parent['content']['oname'])
@@ -307,7 +331,7 @@ class Kernel(Configurable):
         oinfo = json_clean(object_info)
         msg = self.session.send(self.reply_socket, 'object_info_reply',
                                 oinfo, parent, ident)
-        io.raw_print(msg)
+        log.debug('Replied: %s', msg)
 
     def history_request(self, ident, parent):
         output = parent['content']['output']
@@ -317,16 +341,44 @@ class Kernel(Configurable):
         content = {'history' : hist}
         msg = self.session.send(self.reply_socket, 'history_reply',
                                 content, parent, ident)
-        io.raw_print(msg)
+        log.debug('Replied: %s', msg)
 
     def connect_request(self, ident, parent):
         if self._recorded_ports is not None:
             content = self._recorded_ports.copy()
         else:
             content = {}
+        # The frontend may offer the packers it reads; the reply names the
+        # one the kernel sends with from now on.
+        offered = parent['content'].get('packers')
+        if offered:
+            content['packer'] = self.session.choose(offered)
         msg = self.session.send(self.reply_socket, 'connect_reply',
                                 content, parent, ident)
-        io.raw_print(msg)
+        log.debug('Replied: %s', msg)
+
+    def spool_request(self, ident, parent):
+        # The spooled output is sent as a buffer beside the reply, as it was
+        # written, without packing it.
+        content = parent['content']
+        name = content.get('name', u'stdout')
+        offset = content.get('offset', 0)
+        size = content.get('size')
+        data, total = None, 0
+        if self.throttle is not None:
+            data, total = self.throttle.read_spool(
+                name, offset, -1 if size is None else size)
+        if data is None:
+            reply = {'status' : 'error', 'name' : name, 'offset' : offset,
+                     'size' : 0, 'total' : 0}
+            buffers = None
+        else:
+            reply = {'status' : 'ok', 'name' : name, 'offset' : offset,
+                     'size' : len(data), 'total' : total}
+            buffers = [data]
+        msg = self.session.send(self.reply_socket, 'spool_reply',
+                                reply, parent, ident, buffers=buffers)
+        log.debug('Replied: %s', msg)
 
     def shutdown_request(self, ident, parent):
         self.shell.exit_now = True
@@ -340,21 +392,18 @@ class Kernel(Configurable):
     def _abort_queue(self):
         while True:
             try:
-                ident = self.reply_socket.recv(zmq.NOBLOCK)
-            except zmq.ZMQError, e:
-                if e.errno == zmq.EAGAIN:
-                    break
-            else:
-                assert self.reply_socket.rcvmore(), \
-                       "Unexpected missing message part."
-                msg = self.reply_socket.recv_json()
-            io.raw_print("Aborting:\n", Message(msg))
+                ident, msg = self.session.recv_with_ident(self.reply_socket,
+                                                          zmq.NOBLOCK)
+            except ValueError:
+                continue
+            if msg is None:
+                break
+            log.info('Aborting: %s', msg)
             msg_type = msg['msg_type']
             reply_type = msg_type.split('_')[0] + '_reply'
             reply_msg = self.session.msg(reply_type, {'status' : 'aborted'}, msg)
-            io.raw_print(reply_msg)
-            self.reply_socket.send(ident,zmq.SNDMORE)
-            self.reply_socket.send_json(reply_msg)
+            log.debug('Replied: %s', reply_msg)
+            self.session.send_msg(self.reply_socket, reply_msg, ident)
             # We need to wait a bit for requests to come in. This can probably
             # be set shorter for true asynchronous clients.
             time.sleep(0.1)
@@ -367,15 +416,15 @@ class Kernel(Configurable):
         # Send the input request.
         content = dict(prompt=prompt)
         msg = self.session.msg(u'input_request', content, parent)
-        self.req_socket.send_json(msg)
+        self.session.send_msg(self.req_socket, msg)
 
         # Await a response.
-        reply = self.req_socket.recv_json()
+        reply = None
         try:
+            reply = self.session.recv_msg(self.req_socket)
             value = reply['content']['value']
         except:
-            io.raw_print_err("Got bad raw_input reply: ")
-            io.raw_print_err(Message(parent))
+            log.error('Got a bad raw_input reply: %s', reply)
             value = ''
         return value
     
@@ -427,9 +476,9 @@ class Kernel(Configurable):
         """
         # io.rprint("Kernel at_shutdown") # dbg
         if self._shutdown_message is not None:
-            self.reply_socket.send_json(self._shutdown_message)
-            self.pub_socket.send_json(self._shutdown_message)
-            io.raw_print(self._shutdown_message)
+            self.session.send_msg(self.reply_socket, self._shutdown_message)
+            self.session.send_msg(self.pub_socket, self._shutdown_message)
+            log.debug('Shutting down: %s', self._shutdown_message)
             # A very short sleep to give zmq time to flush its message buffers
             # before Python truly shuts down.
             time.sleep(0.01)
@@ -446,10 +495,12 @@ class QtKernel(Kernel):
 
         self.app = get_app_qt4([" "])
         self.app.setQuitOnLastWindowClosed(False)
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.do_one_iteration)
-        # Units for the timer are in milliseconds
-        self.timer.start(1000*self._poll_interval)
+        # Qt watches the reply socket's file descriptor for us.
+        self.notifier = QtCore.QSocketNotifier(
+            self.reply_socket.getsockopt(zmq.FD), QtCore.QSocketNotifier.Read)
+        self.notifier.activated.connect(lambda fd: self.handle_pending())
+        # Requests that came before the notifier was made won't signal it.
+        QtCore.QTimer.singleShot(0, self.handle_pending)
         start_event_loop_qt4(self.app)
 
 
@@ -462,35 +513,18 @@ class WxKernel(Kernel):
         import wx
         from IPython.lib.guisupport import start_event_loop_wx
 
-        doi = self.do_one_iteration
-         # Wx uses milliseconds
-        poll_interval = int(1000*self._poll_interval)
-
-        # We have to put the wx.Timer in a wx.Frame for it to fire properly.
-        # We make the Frame hidden when we create it in the main app below.
-        class TimerFrame(wx.Frame):
-            def __init__(self, func):
-                wx.Frame.__init__(self, None, -1)
-                self.timer = wx.Timer(self)
-                # Units for the timer are in milliseconds
-                self.timer.Start(poll_interval)
-                self.Bind(wx.EVT_TIMER, self.on_timer)
-                self.func = func
-
-            def on_timer(self, event):
-                self.func()
-
-        # We need a custom wx.App to create our Frame subclass that has the
-        # wx.Timer to drive the ZMQ event loop.
+        # wx can't watch a file descriptor itself, so a thread waits on the
+        # reply socket's descriptor and hands over to the wx event loop.
         class IPWxApp(wx.App):
             def OnInit(self):
-                self.frame = TimerFrame(doi)
-                self.frame.Show(False)
                 return True
 
         # The redirect=False here makes sure that wx doesn't replace
         # sys.stdout/stderr with its own classes.
         self.app = IPWxApp(redirect=False)
+        self.watcher = FDWatcherThread(self.reply_socket.getsockopt(zmq.FD),
+                                       self.handle_pending, wx.CallAfter)
+        self.watcher.start()
         start_event_loop_wx(self.app)
 
 
@@ -501,26 +535,25 @@ class TkKernel(Kernel):
         """Start a Tk enabled event loop."""
 
         import Tkinter
-        doi = self.do_one_iteration
-        # Tk uses milliseconds
-        poll_interval = int(1000*self._poll_interval)
         # For Tkinter, we create a Tk object and call its withdraw method.
-        class Timer(object):
-            def __init__(self, func):
-                self.app = Tkinter.Tk()
-                self.app.withdraw()
-                self.func = func
-                
-            def on_timer(self):
-                self.func()
-                self.app.after(poll_interval, self.on_timer)
-                
-            def start(self):
-                self.on_timer()  # Call it once to get things going.
-                self.app.mainloop()
-
-        self.timer = Timer(doi)
-        self.timer.start()
+        self.app = Tkinter.Tk()
+        self.app.withdraw()
+        if hasattr(self.app.tk, 'createfilehandler'):
+            # Tk can watch the reply socket's file descriptor, except on
+            # Windows.
+            self.app.tk.createfilehandler(
+                self.reply_socket.getsockopt(zmq.FD), Tkinter.READABLE,
+                lambda fd, mask: self.handle_pending())
+            # Requests that came before this won't make the fd readable.
+            self.app.after_idle(self.handle_pending)
+        else:
+            # Tk uses milliseconds
+            poll_interval = int(1000*self._poll_interval)
+            def on_timer():
+                self.handle_pending()
+                self.app.after(poll_interval, on_timer)
+            on_timer()  # Call it once to get things going.
+        self.app.mainloop()
 
 
 class GTKKernel(Kernel):
@@ -534,6 +567,42 @@ class GTKKernel(Kernel):
         gtk_kernel.start()
 
 
+class FDWatcherThread(Thread):
+    """Waits for a file descriptor to become readable, and then calls
+    handler through call_in_loop (such as wx.CallAfter), for event loops
+    that can't watch file descriptors themselves.
+
+    The descriptor is a zmq.FD, which stays readable until the handler has
+    run, so the thread waits for the handler before watching it again.
+    """
+
+    def __init__(self, fd, handler, call_in_loop):
+        super(FDWatcherThread, self).__init__()
+        self.daemon = True
+        self.fd = fd
+        self.handler = handler
+        self.call_in_loop = call_in_loop
+        self._handled = Event()
+
+    def _handle(self):
+        try:
+            self.handler()
+        finally:
+            self._handled.set()
+
+    def run(self):
+        # Handle any requests that came before the watching started.
+        while True:
+            self._handled.clear()
+            self.call_in_loop(self._handle)
+            self._handled.wait()
+            try:
+                select.select([self.fd], [], [])
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+
 #-----------------------------------------------------------------------------
 # Kernel main and launch functions
 #-----------------------------------------------------------------------------
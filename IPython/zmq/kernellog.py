@@ -0,0 +1,116 @@
+"""Leveled logging for the kernel, quiet by default.
+
+The kernel logs what it does with the messages it handles to ``log``, at
+DEBUG for each message and INFO for what happens less often, and only
+warnings and errors are shown unless the kernel is started with a lower
+--log-level. Messages are passed to the logger as arguments, so they are
+not formatted unless a handler takes the record; where just building the
+arguments costs, guard the call with ``log.isEnabledFor``.
+
+With --log-ring N, a RingHandler also keeps the last N records at any level,
+unformatted, and writes them to stderr when the kernel gets SIGUSR1 (where
+there is one), or when its dump() is called.
+"""
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import logging
+import signal
+import sys
+from collections import deque
+
+
+class NullHandler(logging.Handler):
+    """Drops every record; logging.NullHandler is new in Python 2.7."""
+    def emit(self, record):
+        pass
+
+#-----------------------------------------------------------------------------
+# Constants
+#-----------------------------------------------------------------------------
+
+log = logging.getLogger('IPython.zmq.kernel')
+# The kernel's stdout and stderr are sent to the frontends, so the records
+# must not reach a handler of the root logger that writes to them.
+log.propagate = False
+log.setLevel(logging.WARNING)
+# until configure() is called, as it is for a kernel made by make_kernel
+log.addHandler(NullHandler())
+
+# how records are written, to stderr and when the ring is dumped
+FORMAT = '[kernel %(asctime)s] %(levelname)s %(message)s'
+
+#-----------------------------------------------------------------------------
+# Classes and functions
+#-----------------------------------------------------------------------------
+
+class RingHandler(logging.Handler):
+    """Keeps the last capacity records, to be formatted only when dumped."""
+
+    def __init__(self, capacity):
+        logging.Handler.__init__(self)
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, stream=None):
+        """Writes the records kept to stream, by default the real stderr,
+        oldest first."""
+        stream = stream or sys.__stderr__
+        stream.write('--- the last %d kernel log records ---\n' %
+                     len(self.records))
+        for record in list(self.records):
+            try:
+                stream.write(self.format(record) + '\n')
+            except Exception:
+                self.handleError(record)
+        stream.flush()
+
+
+def parse_level(level):
+    """Returns the logging level named by level, a name such as 'debug' or
+    a number."""
+    if isinstance(level, basestring):
+        if level.isdigit():
+            return int(level)
+        named = logging.getLevelName(level.upper())
+        if not isinstance(named, int):
+            raise ValueError('unknown log level: %r' % level)
+        return named
+    return level
+
+
+def configure(level=logging.WARNING, ring=0, stream=None):
+    """Sends the records of level and above to stream (by default the real
+    stderr). If ring is more than 0, also keeps the last ring records of
+    any level in a RingHandler, which SIGUSR1 dumps, and returns it.
+    """
+    level = parse_level(level)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    formatter = logging.Formatter(FORMAT)
+    handler = logging.StreamHandler(stream or sys.__stderr__)
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    log.addHandler(handler)
+    if ring <= 0:
+        log.setLevel(level)
+        return None
+    ring_handler = RingHandler(ring)
+    ring_handler.setFormatter(formatter)
+    log.addHandler(ring_handler)
+    log.setLevel(logging.DEBUG)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: ring_handler.dump())
+    return ring_handler
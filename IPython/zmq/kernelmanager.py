@@ -26,9 +26,14 @@ import time
 
 # System library imports.
 import zmq
-from zmq import POLLIN, POLLOUT, POLLERR
 from zmq.eventloop import ioloop
 
+# The events the channels' IOLoops report. Older versions of pyzmq use zmq's
+# own POLLIN, POLLOUT and POLLERR for these, later ones those of epoll.
+POLLIN = ioloop.IOLoop.READ
+POLLOUT = ioloop.IOLoop.WRITE
+POLLERR = ioloop.IOLoop.ERROR
+
 # Local imports.
 from IPython.utils import io
 from IPython.utils.traitlets import HasTraits, Any, Instance, Type, TCPAddress
@@ -305,6 +310,29 @@ class XReqSocketChannel(ZmqSocketChannel):
         self._queue_request(msg)
         return msg['header']['msg_id']
 
+    def spool(self, name='stdout', offset=0, size=None):
+        """Fetch output the kernel spooled, such as what it dropped when the
+        output came too fast (see the 'suppressed' of its stream messages).
+
+        Parameters
+        ----------
+        name : str, optional
+            The stream, 'stdout' or 'stderr'.
+        offset : int, optional
+            Where in the stream to start, in bytes.
+        size : int, optional
+            How many bytes to fetch; by default, to the end.
+
+        Returns
+        -------
+        The msg_id of the message sent. The spool_reply carries the bytes as
+        its one buffer, if the kernel spools its output.
+        """
+        content = dict(name=name, offset=offset, size=size)
+        msg = self.session.msg('spool_request', content)
+        self._queue_request(msg)
+        return msg['header']['msg_id']
+
     def shutdown(self, restart=False):
         """Request an immediate kernel shutdown.
 
@@ -322,6 +350,28 @@ class XReqSocketChannel(ZmqSocketChannel):
         self._queue_request(msg)
         return msg['header']['msg_id']
 
+    def connect(self, packers=None):
+        """Ask the kernel for the ports it listens on, and offer it packers
+        to send messages with.
+
+        Parameters
+        ----------
+        packers : list of str, optional
+            The names of the packers (see session.packers) this side reads,
+            preferred first; by default, those the session accepts. The
+            connect_reply names the one the kernel picked, which the session
+            then sends with too.
+
+        Returns
+        -------
+        The msg_id of the message sent.
+        """
+        if packers is None:
+            packers = self.session.accept
+        msg = self.session.msg('connect_request', {'packers':list(packers)})
+        self._queue_request(msg)
+        return msg['header']['msg_id']
+
     def _handle_events(self, socket, events):
         if events & POLLERR:
             self._handle_err()
@@ -331,8 +381,24 @@ class XReqSocketChannel(ZmqSocketChannel):
             self._handle_recv()
 
     def _handle_recv(self):
-        msg = self.socket.recv_json()
-        self.call_handlers(msg)
+        # Get all of the messages we can: where the IOLoop polls the
+        # socket's file descriptor, it only says that something happened
+        while True:
+            try:
+                msg = self.session.recv_msg(self.socket, zmq.NOBLOCK)
+            except ValueError:
+                # packed by a packer the session doesn't accept, or corrupt
+                continue
+            if msg is None:
+                break
+            self._use_packer(msg)
+            self.call_handlers(msg)
+
+    def _use_packer(self, msg):
+        """Sends with the packer the kernel picked, once it has replied to
+        a connect_request."""
+        if msg['msg_type'] == 'connect_reply' and 'packer' in msg['content']:
+            self.session.use(msg['content']['packer'])
 
     def _handle_send(self):
         try:
@@ -340,7 +406,7 @@ class XReqSocketChannel(ZmqSocketChannel):
         except Empty:
             pass
         else:
-            self.socket.send_json(msg)
+            self.session.send_msg(self.socket, msg)
         if self.command_queue.empty():
             self.drop_io_state(POLLOUT)
 
@@ -425,13 +491,17 @@ class SubSocketChannel(ZmqSocketChannel):
         # Get all of the messages we can
         while True:
             try:
-                msg = self.socket.recv_json(zmq.NOBLOCK)
+                msg = self.session.recv_msg(self.socket, zmq.NOBLOCK)
             except zmq.ZMQError:
                 # Check the errno?
                 # Will this trigger POLLERR?
                 break
-            else:
-                self.call_handlers(msg)
+            except ValueError:
+                # packed by a packer the session doesn't accept, or corrupt
+                continue
+            if msg is None:
+                break
+            self.call_handlers(msg)
 
     def _flush(self):
         """Callback for :method:`self.flush`."""
@@ -487,8 +557,16 @@ class RepSocketChannel(ZmqSocketChannel):
             self._handle_recv()
 
     def _handle_recv(self):
-        msg = self.socket.recv_json()
-        self.call_handlers(msg)
+        # as XReqSocketChannel._handle_recv
+        while True:
+            try:
+                msg = self.session.recv_msg(self.socket, zmq.NOBLOCK)
+            except ValueError:
+                # packed by a packer the session doesn't accept, or corrupt
+                continue
+            if msg is None:
+                break
+            self.call_handlers(msg)
 
     def _handle_send(self):
         try:
@@ -496,7 +574,7 @@ class RepSocketChannel(ZmqSocketChannel):
         except Empty:
             pass
         else:
-            self.socket.send_json(msg)
+            self.session.send_msg(self.socket, msg)
         if self.msg_queue.empty():
             self.drop_io_state(POLLOUT)
 
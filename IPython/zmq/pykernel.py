@@ -28,6 +28,7 @@ import zmq
 from IPython.utils.traitlets import HasTraits, Instance
 from completer import KernelCompleter
 from entry_point import base_launch_kernel, make_default_main
+from iostream import OutputThrottle
 from session import Session, Message
 
 #-----------------------------------------------------------------------------
@@ -50,6 +51,9 @@ class Kernel(HasTraits):
     reply_socket = Instance('zmq.Socket')
     pub_socket = Instance('zmq.Socket')
     req_socket = Instance('zmq.Socket')
+    # The throttle of the output streams; this kernel does not serve their
+    # spools.
+    throttle = Instance(OutputThrottle)
 
     def __init__(self, **kwargs):
         super(Kernel, self).__init__(**kwargs)
@@ -69,9 +73,11 @@ class Kernel(HasTraits):
         """ Start the kernel main loop.
         """
         while True:
-            ident = self.reply_socket.recv()
-            assert self.reply_socket.rcvmore(), "Missing message part."
-            msg = self.reply_socket.recv_json()
+            try:
+                ident, msg = self.session.recv_with_ident(self.reply_socket)
+            except ValueError, e:
+                print >> sys.__stderr__, "DROPPING A REQUEST:", e
+                continue
             omsg = Message(msg)
             print>>sys.__stdout__
             print>>sys.__stdout__, omsg
@@ -106,7 +112,7 @@ class Kernel(HasTraits):
             print>>sys.__stderr__, Message(parent)
             return
         pyin_msg = self.session.msg(u'pyin',{u'code':code}, parent=parent)
-        self.pub_socket.send_json(pyin_msg)
+        self.session.send_msg(self.pub_socket, pyin_msg)
 
         try:
             comp_code = self.compiler(code, '<zmq-kernel>')
@@ -132,7 +138,7 @@ class Kernel(HasTraits):
                 u'evalue' : unicode(evalue)
             }
             exc_msg = self.session.msg(u'pyerr', exc_content, parent)
-            self.pub_socket.send_json(exc_msg)
+            self.session.send_msg(self.pub_socket, exc_msg)
             reply_content = exc_content
         else:
             reply_content = { 'status' : 'ok', 'payload' : {} }
@@ -144,8 +150,7 @@ class Kernel(HasTraits):
         # Send the reply.
         reply_msg = self.session.msg(u'execute_reply', reply_content, parent)
         print>>sys.__stdout__, Message(reply_msg)
-        self.reply_socket.send(ident, zmq.SNDMORE)
-        self.reply_socket.send_json(reply_msg)
+        self.session.send_msg(self.reply_socket, reply_msg, ident)
         if reply_msg['content']['status'] == u'error':
             self._abort_queue()
 
@@ -180,21 +185,19 @@ class Kernel(HasTraits):
     def _abort_queue(self):
         while True:
             try:
-                ident = self.reply_socket.recv(zmq.NOBLOCK)
-            except zmq.ZMQError, e:
-                if e.errno == zmq.EAGAIN:
-                    break
-            else:
-                assert self.reply_socket.rcvmore(), "Missing message part."
-                msg = self.reply_socket.recv_json()
+                ident, msg = self.session.recv_with_ident(self.reply_socket,
+                                                          zmq.NOBLOCK)
+            except ValueError:
+                continue
+            if msg is None:
+                break
             print>>sys.__stdout__, "Aborting:"
             print>>sys.__stdout__, Message(msg)
             msg_type = msg['msg_type']
             reply_type = msg_type.split('_')[0] + '_reply'
             reply_msg = self.session.msg(reply_type, {'status':'aborted'}, msg)
             print>>sys.__stdout__, Message(reply_msg)
-            self.reply_socket.send(ident,zmq.SNDMORE)
-            self.reply_socket.send_json(reply_msg)
+            self.session.send_msg(self.reply_socket, reply_msg, ident)
             # We need to wait a bit for requests to come in. This can probably
             # be set shorter for true asynchronous clients.
             time.sleep(0.1)
@@ -207,11 +210,11 @@ class Kernel(HasTraits):
         # Send the input request.
         content = dict(prompt=prompt)
         msg = self.session.msg(u'input_request', content, parent)
-        self.req_socket.send_json(msg)
+        self.session.send_msg(self.req_socket, msg)
 
         # Await a response.
-        reply = self.req_socket.recv_json()
         try:
+            reply = self.session.recv_msg(self.req_socket)
             value = reply['content']['value']
         except:
             print>>sys.__stderr__, "Got bad raw_input reply: "
@@ -1,37 +1,126 @@
+"""Messages, and the Session that builds, sends and receives them.
+
+A message goes over the wire as one frame packed by one of the packers
+below, followed by any buffers sent with it, one frame each, which are
+neither packed nor copied. Each packer's frames can be told from the
+others' by their first byte, so a session reads any packer in its accept
+list, whatever the other side sends with; which one it sends with is
+agreed on by a connect_request (see Session.choose)."""
+
+import cPickle
 import os
 import uuid
 import pprint
+from threading import Lock
 
 import zmq
+from zmq.utils import jsonapi
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#-----------------------------------------------------------------------------
+# Packers
+#-----------------------------------------------------------------------------
+
+# name -> (pack, unpack), where pack turns a message dict into a str
+packers = {}
+# their names, the fastest first, as sessions prefer them in this order
+packer_names = []
+
+def _add_packer(name, pack, unpack):
+    packers[name] = (pack, unpack)
+    packer_names.append(name)
+
+if msgpack is not None:
+    _add_packer('msgpack',
+                lambda msg: msgpack.packb(msg, use_bin_type=True),
+                lambda data: msgpack.unpackb(data, raw=False))
+_add_packer('pickle', lambda msg: cPickle.dumps(msg, 2), cPickle.loads)
+_add_packer('json', jsonapi.dumps, jsonapi.loads)
+
+
+def packer_of(data):
+    """Returns the name of the packer that packed data, a message frame.
+
+    A message is a dict: json starts it with '{', pickle protocol 2 with
+    the bytes 0x80 0x02, and msgpack with the byte for a map (0x80-0x8f, 0xde
+    or 0xdf), where 0x80, the empty map, is never a message.
+    """
+    first = data[:1]
+    if first == '{':
+        return 'json'
+    if data[:2] == '\x80\x02':
+        return 'pickle'
+    if '\x81' <= first <= '\x8f' or first in ('\xde', '\xdf'):
+        return 'msgpack'
+    raise ValueError('not a packed message: %r' % data[:16])
+
 
 class Message(object):
-    """A simple message object that maps dict keys to attributes.
+    """A view of a message dict that maps its keys to attributes.
 
     A Message can be created from a dict and a dict from a Message instance
-    simply by calling dict(msg_obj)."""
-    
+    simply by calling dict(msg_obj). A dict within is wrapped in a Message of
+    its own only when it is looked up (or iterated over), and that view kept
+    for the next time, so receiving a message costs one small object however
+    much is nested in it. Changes made through a view are made to the dict,
+    and the other way round."""
+    __slots__ = ('_dict', '_views')
+
     def __init__(self, msg_dict):
-        dct = self.__dict__
-        for k, v in msg_dict.iteritems():
-            if isinstance(v, dict):
-                v = Message(v)
-            dct[k] = v
+        if isinstance(msg_dict, Message):
+            msg_dict = msg_dict._dict
+        object.__setattr__(self, '_dict', msg_dict)
+        # key -> Message, for the dicts looked up so far
+        object.__setattr__(self, '_views', None)
+
+    def __getattr__(self, k):
+        try:
+            return self[k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def __setattr__(self, k, v):
+        self._dict[k] = v
+        if self._views is not None:
+            self._views.pop(k, None)
+
+    # for copy and pickle, which the slots and __setattr__ would defeat
+    def __getstate__(self):
+        return self._dict
+
+    def __setstate__(self, msg_dict):
+        Message.__init__(self, msg_dict)
 
     # Having this iterator lets dict(msg_obj) work out of the box.
     def __iter__(self):
-        return iter(self.__dict__.iteritems())
-    
+        for k in self._dict:
+            yield k, self[k]
+
     def __repr__(self):
-        return repr(self.__dict__)
+        return repr(self._dict)
 
     def __str__(self):
-        return pprint.pformat(self.__dict__)
+        return pprint.pformat(self._dict)
 
     def __contains__(self, k):
-        return k in self.__dict__
+        return k in self._dict
 
     def __getitem__(self, k):
-        return self.__dict__[k]
+        v = self._dict[k]
+        if not isinstance(v, dict):
+            return v
+        views = self._views
+        if views is None:
+            views = {}
+            object.__setattr__(self, '_views', views)
+        view = views.get(k)
+        if view is None or view._dict is not v:
+            view = views[k] = Message(v)
+        return view
 
 
 def msg_header(msg_id, username, session):
@@ -63,18 +152,82 @@ def extract_header(msg_or_header):
 
 
 class Session(object):
+    """Builds messages, and sends and receives them over zmq sockets.
+
+    Parameters
+    ----------
+    packer : str, optional (default 'json')
+        The name of the packer (in packers) to send with, until choose()
+        picks another.
+    accept : list of str, optional
+        The names of the packers to read, preferred first, as offered to
+        the other side. By default all of them but pickle, which can run
+        any code while unpacking; a kernel accepts it only when started
+        with --accept-pickle.
+        json is always accepted, as every session can send it.
+    """
 
-    def __init__(self, username=os.environ.get('USER','username'), session=None):
+    def __init__(self, username=os.environ.get('USER','username'), session=None,
+                 packer='json', accept=None):
         self.username = username
         if session is None:
             self.session = str(uuid.uuid4())
         else:
             self.session = session
         self.msg_id = 0
+        if accept is None:
+            accept = [name for name in packer_names if name != 'pickle']
+        accept = list(accept)
+        for name in [packer] + accept:
+            if name not in packers:
+                raise ValueError('unknown packer: %r' % name)
+        if packer not in accept:
+            accept.insert(0, packer)
+        if 'json' not in accept:
+            accept.append('json')
+        self.accept = accept
+        self.use(packer)
+        # the packers every peer offered, once one has (see choose)
+        self._common = None
+        # held while sending, as a socket may not be used by two threads at
+        # once, and the kernel's output streams send from threads of their
+        # own
+        self._send_lock = Lock()
+        self._id_lock = Lock()
+
+    def use(self, packer):
+        """Sends with packer from now on."""
+        if packer not in self.accept:
+            raise ValueError('packer %r is not accepted' % packer)
+        self.packer = packer
+        self.pack = packers[packer][0]
+
+    def choose(self, offered):
+        """Picks the packer to send with, given the names of those a peer
+        reads, preferred first, and returns its name.
+
+        The pick is the first offered that this session accepts and that
+        every peer offered so far reads too, as what is published goes to
+        all of them; json if there is none.
+        """
+        common = set(self.accept) if self._common is None else self._common
+        self._common = common & set(offered)
+        names = [name for name in offered if name in self._common]
+        self.use(names[0] if names else 'json')
+        return self.packer
+
+    def unpack(self, data):
+        """Returns the message dict packed in data, by any packer accepted.
+        """
+        name = packer_of(data)
+        if name not in self.accept:
+            raise ValueError('refusing a message packed by %s' % name)
+        return packers[name][1](data)
 
     def msg_header(self):
-        h = msg_header(self.msg_id, self.username, self.session)
-        self.msg_id += 1
+        with self._id_lock:
+            h = msg_header(self.msg_id, self.username, self.session)
+            self.msg_id += 1
         return h
 
     def msg(self, msg_type, content=None, parent=None):
@@ -85,24 +238,78 @@ class Session(object):
         msg['content'] = {} if content is None else content
         return msg
 
-    def send(self, socket, msg_type, content=None, parent=None, ident=None):
+    def send_msg(self, socket, msg, ident=None, buffers=None):
+        """Sends msg, a message dict, to socket, after ident if given. Safe
+        to call from several threads.
+
+        buffers is a list of objects with the buffer interface (str,
+        numpy arrays, ...), sent after the message without being copied;
+        they must not be changed until zmq has sent them.
+        """
+        if 'buffers' in msg:
+            # a message received with buffers sends them on, unless others
+            # are given
+            if buffers is None:
+                buffers = msg['buffers']
+            msg = dict(msg)
+            del msg['buffers']
+        data = self.pack(msg)
+        with self._send_lock:
+            if ident is not None:
+                socket.send(ident, zmq.SNDMORE)
+            if not buffers:
+                socket.send(data)
+                return
+            socket.send(data, zmq.SNDMORE)
+            for buf in buffers[:-1]:
+                socket.send(buf, zmq.SNDMORE, copy=False)
+            socket.send(buffers[-1], copy=False)
+
+    def send(self, socket, msg_type, content=None, parent=None, ident=None,
+             buffers=None):
         msg = self.msg(msg_type, content, parent)
-        if ident is not None:
-            socket.send(ident, zmq.SNDMORE)
-        socket.send_json(msg)
+        self.send_msg(socket, msg, ident, buffers)
         omsg = Message(msg)
         return omsg
 
-    def recv(self, socket, mode=zmq.NOBLOCK):
+    def _recv_parts(self, socket, mode):
+        """Returns the frames of the next message on socket, or None if
+        there is none and mode is zmq.NOBLOCK."""
         try:
-            msg = socket.recv_json(mode)
+            return socket.recv_multipart(mode, copy=False)
         except zmq.ZMQError, e:
             if e.errno == zmq.EAGAIN:
-                # We can convert EAGAIN to None as we know in this case
-                # recv_json won't return None.
                 return None
-            else:
-                raise
+            raise
+
+    def _from_parts(self, frames):
+        msg = self.unpack(frames[0].bytes)
+        if len(frames) > 1:
+            # the buffers share memory with the frames, which they keep
+            msg['buffers'] = [frame.buffer for frame in frames[1:]]
+        return msg
+
+    def recv_msg(self, socket, mode=0):
+        """Returns the next message on socket as a dict, with its buffers,
+        if any, under 'buffers'; or None if there is none and mode is
+        zmq.NOBLOCK."""
+        frames = self._recv_parts(socket, mode)
+        if frames is None:
+            return None
+        return self._from_parts(frames)
+
+    def recv_with_ident(self, socket, mode=0):
+        """Returns the ident and the message dict of the next message on
+        socket, an XREP socket, or (None, None) as recv_msg would None."""
+        frames = self._recv_parts(socket, mode)
+        if frames is None:
+            return None, None
+        return frames[0].bytes, self._from_parts(frames[1:])
+
+    def recv(self, socket, mode=zmq.NOBLOCK):
+        msg = self.recv_msg(socket, mode)
+        if msg is None:
+            return None
         return Message(msg)
 
 def test_msg2obj():
@@ -120,3 +327,8 @@ def test_msg2obj():
     am2 = dict(ao)
     assert am['x'] == am2['x']
     assert am['y']['z'] == am2['y']['z']
+    assert am2['y'] is am['y']
+
+    assert ao.y is ao.y
+    ao.w = 2
+    assert am['w'] == 2
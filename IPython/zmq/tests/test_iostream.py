@@ -0,0 +1,176 @@
+"""Tests for the flushing and throttling of the kernel's output streams."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import shutil
+import tempfile
+import time
+from threading import Thread
+
+import nose.tools as nt
+
+from ..iostream import OutStream, OutputThrottle
+from ..session import Session
+
+
+class RecordingSession(Session):
+    """Keeps the messages sent, instead of sending them."""
+    def __init__(self):
+        super(RecordingSession, self).__init__()
+        self.sent = []
+
+    def send_msg(self, socket, msg, ident=None, buffers=None):
+        with self._send_lock:
+            self.sent.append(msg)
+
+    def data(self):
+        return ''.join(msg['content']['data'] for msg in self.sent)
+
+
+def stream(throttle=None, **options):
+    session = RecordingSession()
+    out = OutStream(session, object(), u'stdout', throttle)
+    for name, value in options.items():
+        setattr(out, name, value)
+    return session, out
+
+
+def test_flushes_after_interval():
+    session, out = stream(flush_interval=0.02)
+    out.write('before a long computation\n')
+    nt.assert_equal(session.sent, [])
+    time.sleep(0.2)
+    nt.assert_equal(session.data(), 'before a long computation\n')
+    out.close()
+
+
+def test_flushes_past_size():
+    session, out = stream(flush_interval=10, flush_size=100)
+    out.write('x' * 60)
+    nt.assert_equal(session.sent, [])
+    out.write('y' * 60)
+    nt.assert_equal(session.data(), 'x' * 60 + 'y' * 60)
+    out.close()
+
+
+def test_chunks():
+    session, out = stream(flush_interval=10, chunk_size=10)
+    out.write('line one\nline two is longer\n')
+    out.write(u'\xe9' * 6)
+    out.flush()
+    chunks = [msg['content']['data'] for msg in session.sent]
+    nt.assert_true(all(len(chunk) <= 10 for chunk in chunks))
+    nt.assert_equal(chunks[0], 'line one\n')
+    for chunk in chunks:
+        chunk.decode('utf-8')
+    nt.assert_equal(session.data(),
+                    'line one\nline two is longer\n' + '\xc3\xa9' * 6)
+    out.close()
+
+
+def test_threads():
+    session, out = stream(flush_interval=0.001, flush_size=500)
+    def write(c):
+        for i in range(1000):
+            out.write(c)
+    threads = [Thread(target=write, args=(c,)) for c in 'abcd']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    out.flush()
+    data = session.data()
+    nt.assert_equal(sorted(set(data)), list('abcd'))
+    nt.assert_equal([data.count(c) for c in 'abcd'], [1000] * 4)
+    ids = [msg['header']['msg_id'] for msg in session.sent]
+    nt.assert_equal(len(set(ids)), len(ids))
+    out.close()
+
+
+def test_closed():
+    session, out = stream()
+    out.close()
+    nt.assert_raises(ValueError, out.write, 'x')
+    nt.assert_raises(ValueError, out.flush)
+
+
+def test_allow():
+    throttle = OutputThrottle(bytes_per_sec=100, msgs_per_sec=3)
+    nt.assert_true(throttle.allow(60))
+    nt.assert_true(throttle.allow(20))
+    nt.assert_true(throttle.allow(20))
+    nt.assert_false(throttle.allow(0))
+    throttle._start -= throttle.window
+    # a message over the limit, alone in its window
+    nt.assert_true(throttle.allow(1000))
+    nt.assert_false(throttle.allow(1))
+    throttle._start -= throttle.window
+    nt.assert_true(throttle.allow(60))
+    nt.assert_false(throttle.allow(60))
+    # what would fit after one is dropped is dropped too
+    nt.assert_false(throttle.allow(20))
+
+
+def test_suppressed():
+    throttle = OutputThrottle(bytes_per_sec=0, msgs_per_sec=2)
+    session, out = stream(throttle, flush_interval=10, chunk_size=10)
+    for i in range(10):
+        out.write('line %d\n' % i)
+    out.flush()
+    nt.assert_equal(len(session.sent), 2)
+    # the end of the cell
+    throttle.summarize()
+    summary = session.sent[-1]['content']
+    nt.assert_equal(summary['suppressed'], {'bytes': 56, 'lines': 8})
+    nt.assert_equal(summary['data'],
+                    '[output rate exceeded; 56 bytes (8 lines) suppressed]\n')
+    throttle.summarize()
+    out.flush()
+    nt.assert_equal(len(session.sent), 3)
+    out.close()
+
+
+def test_summarized_when_output_stops():
+    throttle = OutputThrottle(bytes_per_sec=0, msgs_per_sec=1)
+    session, out = stream(throttle, flush_interval=0.02)
+    out.write('first\n')
+    out.flush()
+    out.write('second\n')
+    out.flush()
+    nt.assert_equal(len(session.sent), 1)
+    time.sleep(0.2)
+    nt.assert_equal(session.sent[-1]['content']['suppressed'],
+                    {'bytes': 7, 'lines': 1})
+    nt.assert_false(out._waiting.is_set())
+    out.close()
+
+
+def test_spool():
+    spool_dir = tempfile.mkdtemp()
+    try:
+        throttle = OutputThrottle(bytes_per_sec=0, msgs_per_sec=1,
+                                  spool_dir=spool_dir)
+        session, out = stream(throttle, flush_interval=10, chunk_size=4)
+        out.write('abc\ndef\nghi')
+        out.flush()
+        throttle._start -= throttle.window
+        out.write('\njkl\n')
+        out.flush()
+        data = [msg['content']['data'] for msg in session.sent]
+        nt.assert_equal(data[0], 'abc\n')
+        nt.assert_true(data[1].startswith('[output rate exceeded; 7 bytes'))
+        nt.assert_true(data[1].endswith('spooled at bytes 4-11 of stdout]\n'))
+        nt.assert_equal(session.sent[1]['content']['suppressed']['spool'],
+                        {'offset': 4, 'length': 7})
+        nt.assert_equal(data[2], '\n')
+        nt.assert_equal(throttle.read_spool(u'stdout'),
+                        ('abc\ndef\nghi\njkl\n', 16))
+        nt.assert_equal(throttle.read_spool(u'stdout', 4, 7), ('def\nghi', 16))
+        nt.assert_equal(throttle.read_spool(u'stderr'), (None, 0))
+        out.close()
+    finally:
+        shutil.rmtree(spool_dir)
@@ -0,0 +1,112 @@
+"""Tests for the kernel's handling of requests as they come in."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import os
+import time
+import Queue
+
+import nose.tools as nt
+import zmq
+
+from IPython.config.configurable import Configurable
+from ..ipkernel import Kernel, FDWatcherThread
+from ..session import Session
+
+
+class Shell(object):
+    exit_now = False
+
+
+class CountingKernel(Kernel):
+    """A Kernel without a shell, which keeps the code of the execute
+    requests it handles."""
+    shell = Shell()
+
+    def __init__(self, **kwargs):
+        # Kernel.__init__ would start a shell
+        Configurable.__init__(self, **kwargs)
+        self.handled = []
+        self.handlers = {'execute_request': self.execute_request}
+
+    def execute_request(self, ident, parent):
+        self.handled.append(parent['content']['code'])
+
+
+def connected_kernel():
+    context = zmq.Context()
+    reply_socket = context.socket(zmq.XREP)
+    port = reply_socket.bind_to_random_port('tcp://127.0.0.1')
+    client = context.socket(zmq.XREQ)
+    client.connect('tcp://127.0.0.1:%i' % port)
+    kernel = CountingKernel(session=Session(), reply_socket=reply_socket)
+    return kernel, client
+
+
+def wait_readable(socket, timeout=5):
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    nt.assert_true(poller.poll(timeout * 1000))
+
+
+def test_handle_pending_drains():
+    kernel, client = connected_kernel()
+    session = Session()
+    for i in range(20):
+        session.send(client, 'execute_request', {'code': u'x = %d' % i})
+    wait_readable(kernel.reply_socket)
+    # let the rest of them arrive too
+    time.sleep(0.2)
+    kernel.handle_pending()
+    nt.assert_equal(kernel.handled, [u'x = %d' % i for i in range(20)])
+    nt.assert_false(kernel.reply_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN)
+
+
+def test_handle_pending_with_nothing_waiting():
+    kernel, client = connected_kernel()
+    kernel.handle_pending()
+    nt.assert_equal(kernel.handled, [])
+
+
+def test_fd_watcher_waits_for_handler():
+    # a pipe with a byte in it stays readable, as a zmq.FD does until the
+    # socket's events have been read
+    rfd, wfd = os.pipe()
+    os.write(wfd, 'x')
+    calls = Queue.Queue()
+    handled = []
+    watcher = FDWatcherThread(rfd, lambda: handled.append(1), calls.put)
+    watcher.start()
+    try:
+        # requests that came before the watching are handled at once
+        call = calls.get(timeout=5)
+        # but nothing more is asked of the loop until it has run the handler
+        nt.assert_raises(Queue.Empty, calls.get, timeout=0.2)
+        call()
+        nt.assert_equal(handled, [1])
+        call = calls.get(timeout=5)
+        nt.assert_raises(Queue.Empty, calls.get, timeout=0.2)
+        call()
+        nt.assert_equal(handled, [1, 1])
+    finally:
+        os.close(wfd)
+
+
+def test_fd_watcher_survives_handler_error():
+    rfd, wfd = os.pipe()
+    os.write(wfd, 'x')
+    calls = Queue.Queue()
+    def handler():
+        raise ValueError
+    watcher = FDWatcherThread(rfd, handler, calls.put)
+    watcher.start()
+    try:
+        nt.assert_raises(ValueError, calls.get(timeout=5))
+        # the watching goes on
+        calls.get(timeout=5)
+    finally:
+        os.close(wfd)
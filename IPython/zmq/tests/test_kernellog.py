@@ -0,0 +1,75 @@
+"""Tests for the kernel's logging."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import logging
+from StringIO import StringIO
+
+import nose.tools as nt
+
+from ..kernellog import log, configure, parse_level, RingHandler
+
+
+class Counted(object):
+    """Counts the times it is formatted."""
+    def __init__(self):
+        self.formatted = 0
+
+    def __repr__(self):
+        self.formatted += 1
+        return '<counted>'
+
+    __str__ = __repr__
+
+
+def teardown():
+    configure(stream=StringIO())
+
+
+def test_quiet_by_default():
+    out = StringIO()
+    configure(stream=out)
+    msg = Counted()
+    log.debug('Handling %s', msg)
+    log.info('Aborting %s', msg)
+    nt.assert_equal(msg.formatted, 0)
+    nt.assert_equal(out.getvalue(), '')
+    log.warning('Dropping %s', msg)
+    nt.assert_equal(msg.formatted, 1)
+    nt.assert_true(out.getvalue().endswith('WARNING Dropping <counted>\n'))
+
+
+def test_level():
+    out = StringIO()
+    configure('debug', stream=out)
+    log.debug('Handling %s', 'execute_request')
+    nt.assert_true('DEBUG Handling execute_request' in out.getvalue())
+
+
+def test_ring():
+    out = StringIO()
+    ring = configure('error', ring=3, stream=out)
+    nt.assert_true(isinstance(ring, RingHandler))
+    msgs = [Counted() for i in range(5)]
+    for i, msg in enumerate(msgs):
+        log.debug('message %d: %s', i, msg)
+    # kept, but not formatted, and not written at the level given
+    nt.assert_equal([msg.formatted for msg in msgs], [0] * 5)
+    nt.assert_equal(out.getvalue(), '')
+    dumped = StringIO()
+    ring.dump(dumped)
+    lines = dumped.getvalue().splitlines()
+    nt.assert_equal(len(lines), 4)
+    nt.assert_true(lines[1].endswith('DEBUG message 2: <counted>'))
+    nt.assert_true(lines[3].endswith('DEBUG message 4: <counted>'))
+
+
+def test_parse_level():
+    nt.assert_equal(parse_level('info'), logging.INFO)
+    nt.assert_equal(parse_level('10'), logging.DEBUG)
+    nt.assert_equal(parse_level(logging.ERROR), logging.ERROR)
+    nt.assert_raises(ValueError, parse_level, 'loud')
@@ -0,0 +1,191 @@
+"""Tests for the packing and sending of messages by Session."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import copy
+import pickle
+import time
+
+import zmq
+
+import nose.tools as nt
+
+from ..session import Session, Message, packers, packer_names, packer_of
+
+
+def socket_pair(kind=zmq.PAIR, other=zmq.PAIR, ident=None):
+    context = zmq.Context.instance()
+    a = context.socket(kind)
+    port = a.bind_to_random_port('tcp://127.0.0.1')
+    b = context.socket(other)
+    if ident is not None:
+        b.setsockopt(zmq.IDENTITY, ident)
+    b.connect('tcp://127.0.0.1:%i' % port)
+    return a, b
+
+
+def test_packers_round_trip():
+    s = Session(accept=packer_names)
+    msg = s.msg(u'stream', {u'name': u'stdout', u'data': u'\u03b1 ' * 10})
+    for name in packer_names:
+        data = packers[name][0](msg)
+        nt.assert_equal(packer_of(data), name)
+        nt.assert_equal(s.unpack(data), msg)
+
+
+def test_send_recv():
+    a, b = socket_pair()
+    sender, receiver = Session(packer='pickle'), Session(accept=packer_names)
+    sent = sender.send(a, u'execute_request', {u'code': u'x = 1'})
+    msg = receiver.recv_msg(b)
+    nt.assert_equal(msg['content'], {u'code': u'x = 1'})
+    nt.assert_equal(msg['header'], dict(sent.header))
+    nt.assert_false('buffers' in msg)
+    nt.assert_equal(receiver.recv_msg(b, zmq.NOBLOCK), None)
+
+
+def test_buffers():
+    a, b = socket_pair()
+    s = Session()
+    data = 'x' * 100000
+    s.send(a, u'data', {u'size': len(data)}, buffers=[data, buffer('abc')])
+    msg = s.recv_msg(b)
+    nt.assert_equal(msg['content'][u'size'], len(data))
+    nt.assert_equal([buf.tobytes() for buf in msg['buffers']], [data, 'abc'])
+
+
+def test_recv_with_ident():
+    rep, req = socket_pair(zmq.XREP, zmq.XREQ, 'frontend')
+    s = Session()
+    s.send(req, u'complete_request', {u'text': u'a'})
+    ident, msg = s.recv_with_ident(rep)
+    nt.assert_equal(ident, 'frontend')
+    nt.assert_equal(msg['msg_type'], u'complete_request')
+    s.send(rep, u'complete_reply', {}, msg, ident)
+    nt.assert_equal(s.recv_msg(req)['msg_type'], u'complete_reply')
+
+
+def test_refuses_unaccepted():
+    a, b = socket_pair()
+    Session(packer='pickle').send(a, u'stream')
+    receiver = Session()
+    nt.assert_false('pickle' in receiver.accept)
+    nt.assert_raises(ValueError, receiver.recv_msg, b)
+
+
+def test_accept():
+    s = Session(packer='pickle', accept=[])
+    nt.assert_equal(s.accept, ['pickle', 'json'])
+    nt.assert_raises(ValueError, Session, packer='nonesuch')
+    nt.assert_raises(ValueError, s.use, 'nonesuch')
+
+
+def test_choose():
+    kernel = Session(accept=packer_names)
+    nt.assert_equal(kernel.choose(['pickle', 'json']), 'pickle')
+    # a second peer narrows the choice to what both read
+    nt.assert_equal(kernel.choose(['json']), 'json')
+    nt.assert_equal(kernel.choose(['pickle', 'json']), 'json')
+    nt.assert_equal(Session().choose(['nonesuch']), 'json')
+
+
+def test_channel_drops_unreadable():
+    from ..kernelmanager import SubSocketChannel
+    class RecordingChannel(SubSocketChannel):
+        def call_handlers(self, msg):
+            received.append(msg)
+    received = []
+    a, b = socket_pair()
+    session = Session()
+    channel = RecordingChannel(zmq.Context.instance(), session,
+                               ('127.0.0.1', 5555))
+    channel.socket = b
+    Session(packer='pickle').send(a, u'stream', {u'data': u'refused'})
+    a.send('not a message')
+    session.send(a, u'stream', {u'data': u'read'})
+    time.sleep(0.1)
+    channel._handle_recv()
+    nt.assert_equal([msg['content']['data'] for msg in received], [u'read'])
+
+
+class EagerMessage(object):
+    """Message as it was, with each dict within wrapped when it is made."""
+    def __init__(self, msg_dict):
+        dct = self.__dict__
+        for k, v in msg_dict.iteritems():
+            if isinstance(v, dict):
+                v = EagerMessage(v)
+            dct[k] = v
+
+    def __iter__(self):
+        return iter(self.__dict__.iteritems())
+
+    def __repr__(self):
+        return repr(self.__dict__)
+
+
+def plain(msg):
+    """Returns the dicts of msg, a Message or EagerMessage, by dict()."""
+    return dict((k, plain(v) if isinstance(v, (Message, EagerMessage))
+                 else v) for k, v in dict(msg).items())
+
+
+def sample():
+    return {'msg_type': 'execute_reply', 'header': {'msg_id': 1},
+            'content': {'status': 'ok', 'data': {'text/plain': u'1'},
+                        'payload': [{'source': 'page'}]}}
+
+
+def test_message_nested_views():
+    msg = Message(sample())
+    nt.assert_true(isinstance(msg.content, Message))
+    nt.assert_true(isinstance(msg['content']['data'], Message))
+    nt.assert_equal(msg.content.data['text/plain'], u'1')
+    # a view is kept, and dicts in lists left alone
+    nt.assert_true(msg.content is msg['content'])
+    nt.assert_equal(msg.content.payload, [{'source': 'page'}])
+    nt.assert_raises(AttributeError, getattr, msg, 'nonesuch')
+    nt.assert_raises(KeyError, msg.__getitem__, 'nonesuch')
+    nt.assert_true('content' in msg)
+    nt.assert_false('nonesuch' in msg)
+
+
+def test_message_mutation():
+    d = sample()
+    msg = Message(d)
+    content = msg.content
+    content.status = 'error'
+    nt.assert_equal(d['content']['status'], 'error')
+    d['content']['ename'] = 'NameError'
+    nt.assert_equal(msg.content.ename, 'NameError')
+    # a dict put in place of another, either way, gets a view of its own
+    msg.content = {'status': 'aborted'}
+    nt.assert_equal(d['content'], {'status': 'aborted'})
+    nt.assert_equal(msg.content.status, 'aborted')
+    d['content'] = {'status': 'ok'}
+    nt.assert_equal(msg.content.status, 'ok')
+    nt.assert_equal(content.status, 'error')
+
+
+def test_message_as_eager():
+    d = sample()
+    msg, eager = Message(d), EagerMessage(d)
+    nt.assert_equal(repr(msg), repr(eager))
+    nt.assert_equal(sorted(k for k, v in msg), sorted(k for k, v in eager))
+    nt.assert_equal(dict(msg).keys(), dict(eager).keys())
+    nt.assert_true(isinstance(dict(msg)['content'], Message))
+    nt.assert_equal(plain(msg), plain(eager))
+    nt.assert_equal(plain(msg), d)
+    nt.assert_equal(plain(Message(msg)), d)
+
+
+def test_message_copy():
+    msg = Message(sample())
+    for other in (copy.copy(msg), copy.deepcopy(msg),
+                  pickle.loads(pickle.dumps(msg, 2))):
+        nt.assert_equal(plain(other), sample())
+        nt.assert_equal(other.content.status, 'ok')
@@ -0,0 +1,114 @@
+"""Tests for the message trace logs."""
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING.txt, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+import time
+from StringIO import StringIO
+
+import nose.tools as nt
+
+from ..tracelog import (TraceRecorder, TraceReader, TraceError, replay,
+                        replay_to_frontend, SENT, RECEIVED)
+
+
+class FakeChannel(object):
+    def __init__(self):
+        self.handled = []
+        self.sent = []
+
+    def call_handlers(self, msg):
+        self.handled.append(msg)
+
+    def _queue_request(self, msg):
+        self.sent.append(msg)
+
+    _queue_reply = _queue_request
+
+
+class FakeKernelManager(object):
+    def __init__(self):
+        self.xreq_channel = FakeChannel()
+        self.sub_channel = FakeChannel()
+        self.rep_channel = FakeChannel()
+
+
+class UnclosedStringIO(StringIO):
+    def close(self):
+        pass
+
+
+def msg(msg_type, **content):
+    return {'msg_type': msg_type, 'header': {}, 'parent_header': {},
+            'content': content}
+
+
+def record(msgs, compress=False):
+    f = UnclosedStringIO()
+    recorder = TraceRecorder(f, compress)
+    for args in msgs:
+        recorder.record(*args)
+    recorder.close()
+    return f.getvalue()
+
+
+MSGS = [(SENT, 'xreq', msg('execute_request', code=u'print 1')),
+        (RECEIVED, 'sub', msg('stream', name=u'stdout', data=u'1\n')),
+        (RECEIVED, 'xreq', msg('execute_reply', status=u'ok'))]
+
+
+def test_roundtrip():
+    for compress in (False, True):
+        records = list(TraceReader(StringIO(record(MSGS, compress))))
+        nt.assert_equal([(r.direction, r.channel, r.msg) for r in records],
+                        MSGS)
+        times = [r.time for r in records]
+        nt.assert_equal(times, sorted(times))
+
+
+def test_truncated():
+    data = record(MSGS)
+    records = list(TraceReader(StringIO(data[:-3])))
+    nt.assert_equal(len(records), 2)
+
+
+def test_bad_magic():
+    nt.assert_raises(TraceError, TraceReader, StringIO('not a log at all'))
+
+
+def test_attach():
+    km = FakeKernelManager()
+    f = UnclosedStringIO()
+    recorder = TraceRecorder(f)
+    recorder.attach(km)
+    km.xreq_channel._queue_request(MSGS[0][2])
+    km.sub_channel.call_handlers(MSGS[1][2])
+    km.xreq_channel.call_handlers(MSGS[2][2])
+    recorder.close()
+    # The channels still work, and are no longer recorded
+    km.xreq_channel._queue_request(MSGS[0][2])
+    nt.assert_equal(len(km.xreq_channel.sent), 2)
+    nt.assert_equal(km.sub_channel.handled, [MSGS[1][2]])
+    records = list(TraceReader(StringIO(f.getvalue())))
+    nt.assert_equal([(r.direction, r.channel, r.msg) for r in records],
+                    MSGS)
+
+
+def test_replay_to_frontend():
+    km = FakeKernelManager()
+    records = TraceReader(StringIO(record(MSGS)))
+    replay_to_frontend(records, km, speed=None)
+    nt.assert_equal(km.sub_channel.handled, [MSGS[1][2]])
+    nt.assert_equal(km.xreq_channel.handled, [MSGS[2][2]])
+    nt.assert_equal(km.xreq_channel.sent, [])
+
+
+def test_replay_speed():
+    records = list(TraceReader(StringIO(record(MSGS))))
+    records = [r._replace(time=i * 0.05) for i, r in enumerate(records)]
+    t0 = time.time()
+    replay(records, lambda r: None, speed=2.0)
+    nt.assert_true(time.time() - t0 >= 0.045)
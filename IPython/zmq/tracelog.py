@@ -0,0 +1,282 @@
+"""Record the messages between a frontend and a kernel, and replay them.
+
+A TraceRecorder attached to a kernel manager writes every message sent on or
+received from its xreq, sub and rep channels to a binary log. TraceReader
+reads a log back one record at a time, and replay() feeds the records to a
+frontend's handlers or back to a kernel, at the original pace or faster.
+
+The log starts with a header of MAGIC, a format version and the wall clock
+time the recording started. Each record is then::
+
+    <d time><B direction><B channel><I length><length bytes of JSON>
+
+little-endian, where time is in seconds since the start and never goes
+backwards, direction is SENT or RECEIVED, and channel indexes CHANNELS. The
+whole log may be gzip compressed; TraceReader tells by the first bytes.
+
+Run ``python -m IPython.zmq.tracelog`` for the command line tool.
+"""
+
+#-----------------------------------------------------------------------------
+#  Copyright (C) 2011  The IPython Development Team
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#-----------------------------------------------------------------------------
+
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+
+import gzip
+import json
+import struct
+import sys
+import time
+from collections import namedtuple
+from threading import Lock
+
+#-----------------------------------------------------------------------------
+# Constants and exceptions
+#-----------------------------------------------------------------------------
+
+MAGIC = 'IPYTRACE'
+VERSION = 1
+
+SENT, RECEIVED = 0, 1
+CHANNELS = ('xreq', 'sub', 'rep')
+
+_header = struct.Struct('<Bd')
+_record = struct.Struct('<dBBI')
+
+_GZIP_MAGIC = '\x1f\x8b'
+
+
+class TraceError(Exception):
+    pass
+
+#-----------------------------------------------------------------------------
+# Recording
+#-----------------------------------------------------------------------------
+
+TraceRecord = namedtuple('TraceRecord', 'time direction channel msg')
+
+
+class TraceRecorder(object):
+    """Writes messages to a trace log.
+
+    Messages may be recorded from several threads at once, as the channels of
+    a KernelManager each run in their own.
+    """
+
+    def __init__(self, f, compress=False):
+        """f is a file name or a file opened for binary writing. If compress
+        is true, the log is gzip compressed."""
+        if isinstance(f, basestring):
+            f = open(f, 'wb')
+        self._raw = f
+        if compress:
+            f = gzip.GzipFile(fileobj=f, mode='wb')
+        self.file = f
+        self.start = time.time()
+        self._last = 0.0
+        self._lock = Lock()
+        self._attached = []
+        self.file.write(MAGIC + _header.pack(VERSION, self.start))
+
+    def record(self, direction, channel, msg):
+        """Writes msg, a message dict, as sent or received on the channel
+        named channel."""
+        data = json.dumps(msg, separators=(',', ':'), default=repr)
+        with self._lock:
+            # time.time() can step back; the log never does.
+            self._last = max(self._last, time.time() - self.start)
+            self.file.write(_record.pack(self._last, direction,
+                                         CHANNELS.index(channel), len(data)))
+            self.file.write(data)
+
+    def _wrap(self, channel, name, method, direction):
+        original = getattr(channel, method)
+        def wrapper(msg):
+            self.record(direction, name, msg)
+            return original(msg)
+        setattr(channel, method, wrapper)
+        self._attached.append((channel, method))
+
+    def attach(self, kernelmanager):
+        """Records the messages of the xreq, sub and rep channels of
+        kernelmanager, from now until detach() is called.
+
+        The messages received are caught as they are passed to the channels'
+        call_handlers(), and the ones sent as they are queued, so this works
+        for any KernelManager whose channels keep to those methods."""
+        for name in CHANNELS:
+            channel = getattr(kernelmanager, name + '_channel')
+            self._wrap(channel, name, 'call_handlers', RECEIVED)
+        self._wrap(kernelmanager.xreq_channel, 'xreq', '_queue_request', SENT)
+        self._wrap(kernelmanager.rep_channel, 'rep', '_queue_reply', SENT)
+
+    def detach(self):
+        """Stops recording the channels passed to attach()."""
+        for channel, method in self._attached:
+            del channel.__dict__[method]
+        self._attached = []
+
+    def close(self):
+        self.detach()
+        with self._lock:
+            self.file.close()
+            if self._raw is not self.file:
+                self._raw.close()
+
+#-----------------------------------------------------------------------------
+# Reading and replaying
+#-----------------------------------------------------------------------------
+
+class TraceReader(object):
+    """Iterates over the TraceRecords of a log, reading one at a time.
+
+    A record cut short at the end of the log, as left by a process that died
+    while recording, ends the iteration.
+    """
+
+    def __init__(self, f):
+        """f is a file name or a file opened for binary reading."""
+        if isinstance(f, basestring):
+            f = open(f, 'rb')
+        self._raw = f
+        start = f.read(len(_GZIP_MAGIC))
+        f.seek(-len(start), 1)
+        if start == _GZIP_MAGIC:
+            f = gzip.GzipFile(fileobj=f, mode='rb')
+        self.file = f
+        header = f.read(len(MAGIC) + _header.size)
+        if len(header) < len(MAGIC) + _header.size or \
+                not header.startswith(MAGIC):
+            raise TraceError('not a trace log')
+        self.version, self.start = _header.unpack(header[len(MAGIC):])
+        if self.version != VERSION:
+            raise TraceError('unknown trace log version %d' % self.version)
+
+    def __iter__(self):
+        read = self.file.read
+        while True:
+            head = read(_record.size)
+            if len(head) < _record.size:
+                return
+            t, direction, channel, length = _record.unpack(head)
+            data = read(length)
+            if len(data) < length:
+                return
+            yield TraceRecord(t, direction, CHANNELS[channel],
+                              json.loads(data))
+
+    def close(self):
+        self.file.close()
+        if self._raw is not self.file:
+            self._raw.close()
+
+
+def replay(records, handler, speed=1.0):
+    """Calls handler(record) for each record, keeping to the times recorded.
+
+    speed -- how many times faster than recorded to go; 0 or None for as
+             fast as the handler allows.
+    """
+    start = None
+    for record in records:
+        if speed:
+            now = time.time()
+            if start is None:
+                start = now - record.time / speed
+            wait = start + record.time / speed - now
+            if wait > 0:
+                time.sleep(wait)
+        handler(record)
+
+
+def replay_to_frontend(records, kernelmanager, speed=1.0):
+    """Passes the messages that were received to the call_handlers() of the
+    matching channels of kernelmanager, as if the kernel had sent them."""
+    def handler(record):
+        if record.direction == RECEIVED:
+            channel = getattr(kernelmanager, record.channel + '_channel')
+            channel.call_handlers(record.msg)
+    replay(records, handler, speed)
+
+
+def replay_to_kernel(records, kernelmanager, speed=1.0):
+    """Sends the messages that were sent to the kernel again, on the
+    channels of kernelmanager, which must have been started."""
+    def handler(record):
+        if record.direction != SENT:
+            return
+        if record.channel == 'xreq':
+            kernelmanager.xreq_channel._queue_request(record.msg)
+        elif record.channel == 'rep':
+            kernelmanager.rep_channel._queue_reply(record.msg)
+    replay(records, handler, speed)
+
+#-----------------------------------------------------------------------------
+# Command line tool
+#-----------------------------------------------------------------------------
+
+_usage = """\
+usage: python -m IPython.zmq.tracelog dump LOG [--full]
+       python -m IPython.zmq.tracelog replay LOG [SPEED [OUTLOG]]
+
+dump prints the records of LOG, with the whole messages if --full is given.
+replay starts a kernel and sends it the requests in LOG, SPEED times as fast
+as they were recorded (0 for no waiting), recording the new session to OUTLOG
+if given."""
+
+
+def dump(path, full=False, out=sys.stdout):
+    reader = TraceReader(path)
+    for record in reader:
+        arrow = '->' if record.direction == SENT else '<-'
+        msg = record.msg
+        print >> out, '%10.6f %s %-4s %s' % (record.time, arrow,
+                                              record.channel,
+                                              msg.get('msg_type', msg))
+        if full:
+            print >> out, json.dumps(msg, indent=2, sort_keys=True)
+    reader.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('dump', 'replay'):
+        print >> sys.stderr, _usage
+        return 2
+    if argv[0] == 'dump':
+        dump(argv[1], '--full' in argv[2:])
+        return 0
+
+    from .blockingkernelmanager import BlockingKernelManager
+    speed = float(argv[2]) if len(argv) > 2 else 1.0
+    km = BlockingKernelManager()
+    km.start_kernel()
+    km.start_channels()
+    recorder = None
+    if len(argv) > 3:
+        recorder = TraceRecorder(argv[3])
+        recorder.attach(km)
+    reader = TraceReader(argv[1])
+    try:
+        # Give the kernel a chance to come up.
+        time.sleep(1)
+        replay_to_kernel(reader, km, speed)
+        # and to answer
+        time.sleep(1)
+    finally:
+        reader.close()
+        if recorder is not None:
+            recorder.close()
+        km.stop_channels()
+        km.kill_kernel()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())